@@ -10,9 +10,102 @@ PUBLIC_PAGES_STORAGE_BASE = os.path.join(BASE_DIR, "..", "public_pages_storage")
 if not os.path.exists(SECURE_USER_FILES_STORAGE_BASE):
     os.makedirs(SECURE_USER_FILES_STORAGE_BASE, exist_ok=True)
 
+# Downloads: "x-accel-redirect" (nginx) or "x-sendfile" (Apache) hands file bodies to the
+# web server; unset streams them with FileResponse (sendfile() under gunicorn/uWSGI).
+FILES_SENDFILE_BACKEND = os.getenv("FILES_SENDFILE_BACKEND")
+FILES_SENDFILE_URL_PREFIX = os.getenv("FILES_SENDFILE_URL_PREFIX", "/protected-files/")
+
+# Encryption at rest: a base64-encoded 32-byte key wrapping every user's data key.
+# Unset stores new files as plaintext.
+SECURE_FILES_MASTER_KEY = os.getenv("SECURE_FILES_MASTER_KEY")
+SECURE_FILES_ENCRYPTION_CHUNK_SIZE = 64 * 1024
+
+# Background jobs (jobs app): "thread" runs them on an in-process worker pool, "external"
+# leaves them to `manage.py run_jobs`, "eager" runs them inline on commit (tests).
+JOBS_MODE = os.getenv("JOBS_MODE", "thread")
+JOBS_LOCAL_WORKERS = 2
+JOBS_LEASE_SECONDS = 300
+JOBS_RETRY_BASE_SECONDS = 10
+# Succeeded and failed jobs are deleted after this long, by a cleanup job scheduled at most
+# once per JOBS_CLEANUP_INTERVAL_SECONDS while jobs are running.
+JOBS_RETENTION_DAYS = 7
+JOBS_CLEANUP_INTERVAL_SECONDS = 3600
+JOBS_CLEANUP_BATCH_SIZE = 1000
+
+# The default cache (shared-node permissions, public page lookups) is per-process memory unless
+# CACHE_REDIS_URL is set. Use Redis with several worker processes so invalidations reach all of
+# them. Requires the optional "redis" package.
+if os.getenv("CACHE_REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("CACHE_REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+# Public pages: how long a page's resolved location and ETag stay cached. Updating or deleting
+# the page invalidates it immediately, but with the default LocMem cache only in the worker that
+# handled the update. Until their entries expire, other workers still answer a stale
+# If-None-Match with 304 and serve a renamed page under its old name too. They do notice a
+# replaced or deleted file and look it up again.
+PUBLIC_PAGES_CACHE_SECONDS = 600
+
 #  Default max upload sizes
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024  # 5MB
 
+# Recursive soft-delete/restore: subtrees larger than the sync limit are processed in
+# background batches of FILES_SUBTREE_BATCH_SIZE rows.
+FILES_SUBTREE_SYNC_LIMIT = 5000
+FILES_SUBTREE_BATCH_SIZE = 1000
+
+# Thumbnails: an on-disk LRU cache (default <storage base>/.thumbnails) bounded in size.
+FILES_THUMBNAIL_CACHE_DIR = os.getenv("FILES_THUMBNAIL_CACHE_DIR")
+FILES_THUMBNAIL_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # 1GB
+FILES_THUMBNAIL_SIZES = (128, 256, 512)
+FILES_THUMBNAIL_PREGENERATE_SIZES = (256,)
+
+# Trash: `manage.py purge_trash` permanently removes soft-deleted nodes (rows and files) after
+# the retention period, in throttled batches. Abandoned upload sessions are dropped too.
+FILES_TRASH_RETENTION_DAYS = 30
+FILES_PURGE_BATCH_SIZE = 500
+FILES_PURGE_PAUSE_SECONDS = 0.5
+FILES_UPLOAD_SESSION_MAX_AGE_DAYS = 7
+
+# Shared-node permissions resolved by sharing.permissions are cached (in the default cache) for
+# this long; changing a share invalidates its recipient's entries immediately.
+SHARING_ACL_CACHE_SECONDS = 300
+# Most node x user pairs one bulk grant/revoke/change-level request may cover.
+SHARING_BULK_MAX_SHARES = 10_000
+
+# Most nodes a single batch request (batch-delete, batch-move, ...) may name.
+FILES_BATCH_MAX_ITEMS = 1000
+
+# Text extracted from plain-text and PDF uploads for content search (files.search).
+FILES_SEARCH_MAX_INDEXED_BYTES = 50 * 1024 * 1024  # 50MB
+FILES_SEARCH_MAX_TEXT_CHARS = 1_000_000
+
+# Per-user storage quota, unless overridden on the user's StorageQuota row (None = unlimited).
+FILES_DEFAULT_QUOTA_BYTES = 10 * 1024 * 1024 * 1024  # 10GB
+
+# Request metrics (metrics app): per-request Server-Timing headers and per-route histograms at
+# /metrics/ (Prometheus format), which needs `Authorization: Bearer <METRICS_TOKEN>`.
+# METRICS_SERVER_TIMING is set below DEBUG, which it defaults to.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Most SQL queries an endpoint ("<method> <URL name>") may run. Over-budget requests log a
+# warning, or fail when METRICS_ENFORCE_QUERY_BUDGETS is set, so query-count regressions break
+# the build.
+METRICS_QUERY_BUDGETS = {
+    "GET files-list": 3,
+    "GET files-detail": 3,
+    "GET files-details-by-path": 3,
+    "GET sharing-shared-with-me": 3,
+    # A directory shared with the requester: one more query to resolve the share (cold cache).
+    "GET files-children": 4,
+}
+METRICS_ENFORCE_QUERY_BUDGETS = os.getenv("METRICS_ENFORCE_QUERY_BUDGETS") == "1"
+
 ALLOWED_UPLOAD_MIME_TYPES = ["image/jpeg", "image/png", "application/pdf", "text/plain"]
 
 # Quick-start development settings - unsuitable for production
@@ -24,6 +117,10 @@ SECRET_KEY = "django-insecure-oyb7p641v9)-f+^s!qi_l*h_^8rjd*by+)*s36xgo4&4k3(3xo
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# Server-Timing headers reveal query counts and timings to clients: on with DEBUG, or with
+# METRICS_SERVER_TIMING=1.
+METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "1" if DEBUG else "0") == "1"
+
 ALLOWED_HOSTS = []
 
 
@@ -36,16 +133,20 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework_simplejwt.token_blacklist",
     "authentication",
     "files",
+    "jobs",
+    "metrics",
     "sharing",
     "public",
     "corsheaders",
 ]
 
 MIDDLEWARE = [
+    "metrics.middleware.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.security.SecurityMiddleware",
@@ -81,6 +182,10 @@ REST_FRAMEWORK = {
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
+    "DEFAULT_RENDERER_CLASSES": (
+        "metrics.renderers.TimedJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
 }
 
 
@@ -105,6 +210,16 @@ DATABASES = {
     }
 }
 
+# Local runs without PostgreSQL (e.g. `DB_ENGINE=sqlite manage.py benchmark`). Name search
+# and content search fall back to plain scans there.
+if os.getenv("DB_ENGINE") == "sqlite":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+        }
+    }
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
     "http://127.0.0.1:5173",
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from metrics.views import metrics_view
 from public.views import PublicPageServeView
 
 urlpatterns = [
@@ -18,4 +19,6 @@ urlpatterns = [
     path("api/sharing/", include("sharing.urls")),
     # Public pages
     path("api/public-pages/", include("public.urls")),
+    # Prometheus scrape endpoint
+    path("metrics/", metrics_view, name="metrics"),
 ]
@@ -0,0 +1,94 @@
+from collections import defaultdict
+
+from django.db.models import (
+    BigIntegerField,
+    Case,
+    Count,
+    F,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+
+
+def _subtree_total(model, expression, deleted_at):
+    """
+    Correlated subquery aggregating `expression` over the descendants of the outer directory
+    that share its deletion state (live ones for a live directory, the ones deleted together
+    with it for a soft-deleted one).
+    """
+    descendants = (
+        model.objects.filter(
+            owner_id=OuterRef("owner_id"),
+            tree_path__startswith=OuterRef("tree_path"),
+            deleted_at=deleted_at,
+        )
+        .exclude(pk=OuterRef("pk"))
+        .order_by()
+        .values("owner_id")
+        .annotate(total=expression)
+        .values("total")
+    )
+    return Coalesce(Subquery(descendants), Value(0), output_field=IntegerField())
+
+
+def reconcile_aggregates(model, owner_ids):
+    """
+    Recomputes total_size_bytes and descendant_count of every directory of the given owners
+    with two set-based UPDATEs per owner. `model` is the FileSystemNode class (or its
+    historical version inside a migration).
+    """
+    updated = 0
+    for owner_id in owner_ids:
+        directories = model.objects.filter(owner_id=owner_id, is_directory=True)
+        updated += directories.filter(deleted_at__isnull=True).update(
+            total_size_bytes=_subtree_total(model, Sum("size_bytes"), None),
+            descendant_count=_subtree_total(model, Count("pk"), None),
+        )
+        updated += directories.filter(deleted_at__isnull=False).update(
+            total_size_bytes=_subtree_total(model, Sum("size_bytes"), OuterRef("deleted_at")),
+            descendant_count=_subtree_total(model, Count("pk"), OuterRef("deleted_at")),
+        )
+    return updated
+
+
+class AncestorAggregateDeltas:
+    """
+    Accumulates the aggregate changes of several subtree operations (e.g. a batch of moves)
+    and applies them to every affected ancestor in a single UPDATE. Changes that cancel out,
+    such as a move between two folders under the same ancestor, are never written.
+    """
+
+    def __init__(self):
+        self.deltas = defaultdict(lambda: [0, 0])
+
+    def add(self, node, sign=1):
+        size_delta, count_delta = node.subtree_totals
+        self.add_totals(node.ancestor_ids, sign * size_delta, sign * count_delta)
+
+    def add_totals(self, ancestor_ids, size_delta, count_delta):
+        for ancestor_id in ancestor_ids:
+            self.deltas[ancestor_id][0] += size_delta
+            self.deltas[ancestor_id][1] += count_delta
+
+    def apply(self, model):
+        changed = {pk: delta for pk, delta in self.deltas.items() if any(delta)}
+        self.deltas.clear()
+        if not changed:
+            return 0
+
+        def delta_expression(index):
+            return Case(
+                *[When(pk=pk, then=Value(delta[index])) for pk, delta in changed.items()],
+                default=Value(0),
+                output_field=BigIntegerField(),
+            )
+
+        return model.objects.filter(pk__in=changed).update(
+            total_size_bytes=F("total_size_bytes") + delta_expression(0),
+            descendant_count=F("descendant_count") + delta_expression(1),
+        )
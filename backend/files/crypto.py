@@ -0,0 +1,295 @@
+import base64
+import binascii
+import os
+import struct
+import tempfile
+import threading
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+
+# On-disk format: a header (magic, random file id, plaintext chunk size) followed by chunks of
+# nonce || AES-256-GCM ciphertext || tag. Every chunk has its own random nonce and is bound to
+# its file and position through the associated data, so chunks can't be reordered or moved
+# between files, and any range can be decrypted without touching the rest of the file.
+_MAGIC = b"SFSAEAD1"
+_HEADER = struct.Struct(">8s16sI")
+_NONCE_SIZE = 12
+_TAG_SIZE = 16
+_CHUNK_OVERHEAD = _NONCE_SIZE + _TAG_SIZE
+
+
+class CorruptFileError(IOError):
+    """
+    Raised when an encrypted file fails authentication or doesn't match its expected size.
+    """
+
+
+def _chunk_aad(file_id, index):
+    return file_id + struct.pack(">Q", index)
+
+
+def encryption_enabled():
+    return bool(settings.SECURE_FILES_MASTER_KEY)
+
+
+def _master_key():
+    try:
+        key = base64.urlsafe_b64decode(settings.SECURE_FILES_MASTER_KEY)
+    except (binascii.Error, TypeError, ValueError):
+        key = b""
+    if len(key) != 32:
+        raise ImproperlyConfigured("SECURE_FILES_MASTER_KEY must be 32 bytes, base64-encoded.")
+    return key
+
+
+def wrap_key(data_key, context):
+    nonce = os.urandom(_NONCE_SIZE)
+    return nonce + AESGCM(_master_key()).encrypt(nonce, data_key, context)
+
+
+def unwrap_key(wrapped_key, context):
+    wrapped_key = bytes(wrapped_key)
+    try:
+        return AESGCM(_master_key()).decrypt(
+            wrapped_key[:_NONCE_SIZE], wrapped_key[_NONCE_SIZE:], context
+        )
+    except InvalidTag:
+        raise ImproperlyConfigured("A data key could not be unwrapped with the master key.")
+
+
+_data_keys = {}
+_data_keys_lock = threading.Lock()
+
+
+def get_user_data_key(user_id):
+    """
+    Returns the user's 256-bit data key, creating it (wrapped by the master key) on first use.
+    Unwrapped keys are cached for the lifetime of the process.
+    """
+    with _data_keys_lock:
+        if user_id in _data_keys:
+            return _data_keys[user_id]
+
+    from .models import UserDataKey
+
+    context = f"securefs:user-data-key:{user_id}".encode()
+    record = UserDataKey.objects.filter(user_id=user_id).first()
+    if record is None:
+        try:
+            # A savepoint, so losing the race doesn't break the caller's transaction.
+            with transaction.atomic():
+                record = UserDataKey.objects.create(
+                    user_id=user_id, wrapped_key=wrap_key(os.urandom(32), context)
+                )
+        except IntegrityError:
+            # Another request created it first.
+            record = UserDataKey.objects.get(user_id=user_id)
+
+    data_key = unwrap_key(record.wrapped_key, context)
+    with _data_keys_lock:
+        _data_keys[user_id] = data_key
+    return data_key
+
+
+def _plaintext_size(ciphertext_size, chunk_size):
+    body = max(ciphertext_size - _HEADER.size, 0)
+    full_chunks, remainder = divmod(body, chunk_size + _CHUNK_OVERHEAD)
+    return full_chunks * chunk_size + max(remainder - _CHUNK_OVERHEAD, 0)
+
+
+class EncryptedFileWriter:
+    """
+    Encrypts plaintext written to it into `path` in a single streaming pass.
+
+    With `append_at`, an existing file is reopened and truncated to that plaintext offset
+    (the trailing partial chunk is decrypted and re-encrypted with a fresh nonce), which is
+    how resumable uploads keep appending to an encrypted staging file.
+    """
+
+    def __init__(self, path, key, append_at=None):
+        self._aead = AESGCM(key)
+        self._buffer = bytearray()
+
+        if append_at is None:
+            self._file_id = os.urandom(16)
+            self._chunk_size = settings.SECURE_FILES_ENCRYPTION_CHUNK_SIZE
+            self._index = 0
+            self._fh = open(path, "wb")
+            self._fh.write(_HEADER.pack(_MAGIC, self._file_id, self._chunk_size))
+            return
+
+        self._fh = open(path, "r+b")
+        self._file_id, self._chunk_size = _read_header(self._fh)
+        self._index, remainder = divmod(append_at, self._chunk_size)
+        if remainder:
+            self._buffer += _decrypt_chunk(
+                self._aead, self._fh, self._file_id, self._chunk_size, self._index
+            )[:remainder]
+        self._fh.truncate(_HEADER.size + self._index * (self._chunk_size + _CHUNK_OVERHEAD))
+        self._fh.seek(0, os.SEEK_END)
+
+    def _emit(self, plaintext):
+        nonce = os.urandom(_NONCE_SIZE)
+        ciphertext = self._aead.encrypt(nonce, plaintext, _chunk_aad(self._file_id, self._index))
+        self._fh.write(nonce + ciphertext)
+        self._index += 1
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= self._chunk_size:
+            self._emit(bytes(self._buffer[: self._chunk_size]))
+            del self._buffer[: self._chunk_size]
+
+    def close(self):
+        if self._fh.closed:
+            return
+        if self._buffer:
+            self._emit(bytes(self._buffer))
+            self._buffer.clear()
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _read_header(fh):
+    fh.seek(0)
+    header = fh.read(_HEADER.size)
+    if len(header) != _HEADER.size:
+        raise CorruptFileError("Encrypted file header is truncated.")
+    magic, file_id, chunk_size = _HEADER.unpack(header)
+    if magic != _MAGIC or not chunk_size:
+        raise CorruptFileError("Not an encrypted SecureFS file.")
+    return file_id, chunk_size
+
+
+def _decrypt_chunk(aead, fh, file_id, chunk_size, index):
+    fh.seek(_HEADER.size + index * (chunk_size + _CHUNK_OVERHEAD))
+    sealed = fh.read(chunk_size + _CHUNK_OVERHEAD)
+    if len(sealed) <= _CHUNK_OVERHEAD:
+        raise CorruptFileError(f"Encrypted chunk {index} is missing.")
+    try:
+        return aead.decrypt(sealed[:_NONCE_SIZE], sealed[_NONCE_SIZE:], _chunk_aad(file_id, index))
+    except InvalidTag:
+        raise CorruptFileError(f"Encrypted chunk {index} failed authentication.")
+
+
+class EncryptedFileReader:
+    """
+    Seekable, read-only plaintext view of an encrypted file. Only the chunks overlapping the
+    bytes actually read are decrypted, so ranged reads cost O(range), not O(file).
+
+    `size` is the trusted plaintext size (e.g. from the database); a file whose ciphertext
+    length doesn't match it is rejected, which catches truncation at chunk boundaries.
+    """
+
+    def __init__(self, path, key, size=None):
+        self._aead = AESGCM(key)
+        self._fh = open(path, "rb")
+        try:
+            self._file_id, self._chunk_size = _read_header(self._fh)
+            actual_size = _plaintext_size(os.fstat(self._fh.fileno()).st_size, self._chunk_size)
+            if size is not None and size != actual_size:
+                raise CorruptFileError("Encrypted file size does not match the expected size.")
+        except BaseException:
+            self._fh.close()
+            raise
+        self.size = actual_size
+        self._position = 0
+        self._cached_index = None
+        self._cached_chunk = b""
+
+    def _chunk(self, index):
+        if index != self._cached_index:
+            self._cached_chunk = _decrypt_chunk(
+                self._aead, self._fh, self._file_id, self._chunk_size, index
+            )
+            self._cached_index = index
+        return self._cached_chunk
+
+    def read(self, size=-1):
+        end = self.size if size is None or size < 0 else min(self.size, self._position + size)
+        parts = []
+        while self._position < end:
+            index, offset = divmod(self._position, self._chunk_size)
+            data = self._chunk(index)[offset : offset + end - self._position]
+            parts.append(data)
+            self._position += len(data)
+        return b"".join(parts)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self._position = max(offset, 0)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def close(self):
+        self._fh.close()
+
+    @property
+    def closed(self):
+        return self._fh.closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class EncryptedFileSystemStorage(FileSystemStorage):
+    """
+    Drop-in FileSystemStorage that encrypts file contents at rest with a per-user data key.
+    """
+
+    encrypted = True
+
+    def __init__(self, data_key, **kwargs):
+        super().__init__(**kwargs)
+        self.data_key = data_key
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        os.close(fd)
+        try:
+            with EncryptedFileWriter(tmp_path, self.data_key) as writer:
+                for chunk in content.chunks():
+                    writer.write(chunk)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return str(name).replace("\\", "/")
+
+    def _open(self, name, mode="rb"):
+        return File(EncryptedFileReader(self.path(name), self.data_key), name)
+
+    def size(self, name):
+        with open(self.path(name), "rb") as fh:
+            _, chunk_size = _read_header(fh)
+        return _plaintext_size(os.path.getsize(self.path(name)), chunk_size)
@@ -0,0 +1,163 @@
+import json
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
+from rest_framework import renderers
+
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class PassthroughRenderer(renderers.BaseRenderer):
+    """
+    Lets file-serving actions accept any `Accept` header. Successful responses are plain
+    Django file responses; only error payloads ever reach this renderer.
+    """
+
+    media_type = "*/*"
+    format = "file"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        return json.dumps(data).encode()
+
+
+class _FileRange:
+    """
+    Read-only view of `length` bytes of an open file starting at `start`.
+
+    It exposes fileno() so WSGI servers with a sendfile()-based `wsgi.file_wrapper` (gunicorn,
+    uWSGI) still send the range zero-copy: they start at the descriptor's current offset and
+    stop after Content-Length bytes. Other servers fall back to bounded read() calls.
+    """
+
+    def __init__(self, fh, start, length):
+        self._fh = fh
+        self._remaining = length
+        fh.seek(start)
+        if hasattr(fh, "fileno"):
+            self.fileno = fh.fileno
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._fh.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._fh.close()
+
+
+def parse_range(header, size):
+    """
+    Parses a single-range `Range` header into an inclusive (start, end) pair.
+    Returns None when the header should be ignored (absent, malformed or multi-range, which
+    RFC 9110 lets servers answer with the full body) and raises ValueError when unsatisfiable.
+    """
+    match = _RANGE_RE.fullmatch((header or "").strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("Unsatisfiable range.")
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("Unsatisfiable range.")
+    return start, min(end, size - 1)
+
+
+def _sendfile_response(path):
+    """
+    Delegates the body to the front-end web server when FILES_SENDFILE_BACKEND is set.
+    nginx and Apache handle Range and conditional requests on their own.
+    """
+    backend = settings.FILES_SENDFILE_BACKEND
+    response = HttpResponse()
+    if backend == "x-accel-redirect":
+        relative_path = os.path.relpath(path, settings.SECURE_USER_FILES_STORAGE_BASE)
+        response["X-Accel-Redirect"] = settings.FILES_SENDFILE_URL_PREFIX + relative_path
+    elif backend == "x-sendfile":
+        response["X-Sendfile"] = os.path.abspath(path)
+    else:
+        raise ValueError(f"Unknown FILES_SENDFILE_BACKEND: {backend!r}")
+    return response
+
+
+def serve_file(
+    request,
+    open_file,
+    *,
+    size,
+    content_type,
+    etag,
+    last_modified,
+    filename,
+    sendfile_path=None,
+    as_attachment=True,
+):
+    """
+    Serves the file returned by `open_file()` with ETag/Last-Modified validators,
+    conditional GET and single byte ranges.
+
+    For plaintext files (`sendfile_path` set) the body is never copied through Python: it is
+    either handed to the web server (X-Accel-Redirect / X-Sendfile) or streamed with
+    FileResponse, which WSGI servers turn into sendfile(). Encrypted files are decrypted as
+    they stream, and only the chunks covering the requested range are touched.
+    """
+    last_modified_ts = int(last_modified.timestamp())
+    conditional_response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified_ts
+    )
+    if conditional_response is not None:
+        conditional_response["ETag"] = etag
+        return conditional_response
+
+    if settings.FILES_SENDFILE_BACKEND and sendfile_path:
+        response = _sendfile_response(sendfile_path)
+        response["Content-Type"] = content_type
+    else:
+        byte_range = None
+        if_range = request.headers.get("If-Range")
+        # A stale If-Range validator (or a date, which we don't compare) means "send it all".
+        if if_range is None or if_range.strip() == etag:
+            try:
+                byte_range = parse_range(request.headers.get("Range"), size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{size}"
+                return response
+
+        fh = open_file()
+        if byte_range is None:
+            response = FileResponse(fh, content_type=content_type)
+        else:
+            start, end = byte_range
+            response = FileResponse(
+                _FileRange(fh, start, end - start + 1), content_type=content_type, status=206
+            )
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response["Content-Length"] = end - start + 1
+        response["Accept-Ranges"] = "bytes"
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified_ts)
+    response["Cache-Control"] = "private, no-cache"
+    response["X-Content-Type-Options"] = "nosniff"
+    response["Content-Disposition"] = content_disposition_header(as_attachment, filename)
+    return response
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from files.trash import purge_expired_trash, purge_stale_upload_sessions
+
+
+class Command(BaseCommand):
+    help = (
+        "Permanently deletes nodes that have been in the trash longer than "
+        "FILES_TRASH_RETENTION_DAYS, and abandoned upload sessions. Meant to run from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, help="Nodes per transaction.")
+        parser.add_argument("--pause", type=float, help="Seconds to sleep between batches.")
+        parser.add_argument(
+            "--max-batches", type=int, help="Stop after this many batches (resume next run)."
+        )
+
+    def handle(self, *args, **options):
+        purged = purge_expired_trash(
+            batch_size=options["batch_size"],
+            pause=options["pause"],
+            max_batches=options["max_batches"],
+        )
+        sessions = purge_stale_upload_sessions()
+        self.stdout.write(
+            self.style.SUCCESS(f"Purged {purged} nodes and {sessions} stale upload sessions.")
+        )
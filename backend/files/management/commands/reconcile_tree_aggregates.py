@@ -0,0 +1,19 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from files.aggregates import reconcile_aggregates
+from files.models import FileSystemNode
+
+
+class Command(BaseCommand):
+    help = "Recomputes directory size and descendant-count aggregates from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--owner", type=int, action="append", help="Only reconcile this user id (repeatable)."
+        )
+
+    def handle(self, *args, **options):
+        owner_ids = options["owner"] or get_user_model().objects.values_list("pk", flat=True)
+        updated = reconcile_aggregates(FileSystemNode, owner_ids)
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {updated} directories."))
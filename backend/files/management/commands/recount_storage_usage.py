@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from files.quotas import recount
+
+
+class Command(BaseCommand):
+    help = "Rebuilds per-user storage usage counters from FileSystemNode.size_bytes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", type=int, action="append", help="Only recount this user id (repeatable)."
+        )
+
+    def handle(self, *args, **options):
+        updated = recount(options["user"])
+        self.stdout.write(self.style.SUCCESS(f"Recounted usage for {updated} users."))
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.1 on 2026-10-17 09:12
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def populate_paths(apps, schema_editor):
+    FileSystemNode = apps.get_model("files", "FileSystemNode")
+
+    level = list(FileSystemNode.objects.filter(parent__isnull=True).only("id", "name"))
+    for node in level:
+        node.logical_path = f"/{node.name}"
+        node.tree_path = f"/{node.id.hex}/"
+
+    while level:
+        FileSystemNode.objects.bulk_update(level, ["logical_path", "tree_path"], batch_size=1000)
+        parents = {node.id: node for node in level}
+        level = list(
+            FileSystemNode.objects.filter(parent_id__in=parents.keys()).only(
+                "id", "name", "parent_id"
+            )
+        )
+        for node in level:
+            parent = parents[node.parent_id]
+            node.logical_path = f"{parent.logical_path}/{node.name}"
+            node.tree_path = f"{parent.tree_path}{node.id.hex}/"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0003_remove_filesystemnode_is_public_root"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="filesystemnode",
+            name="logical_path",
+            field=models.TextField(default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="filesystemnode",
+            name="tree_path",
+            field=models.TextField(default="", editable=False),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="filesystemnode",
+            index=models.Index(
+                models.F("owner"),
+                django.db.models.functions.text.MD5("logical_path"),
+                name="files_node_owner_path_md5_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="filesystemnode",
+            index=models.Index(
+                fields=["tree_path"],
+                name="files_node_tree_path_idx",
+                opclasses=["text_pattern_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-17 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0004_filesystemnode_materialized_paths"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="filesystemnode",
+            index=models.Index(
+                fields=["owner", "parent", "-is_directory", "name", "id"],
+                name="files_node_listing_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-17 16:32
+
+from django.db import migrations, models
+
+from files.aggregates import reconcile_aggregates
+
+
+def populate_aggregates(apps, schema_editor):
+    FileSystemNode = apps.get_model("files", "FileSystemNode")
+    owner_ids = FileSystemNode.objects.values_list("owner_id", flat=True).distinct()
+    reconcile_aggregates(FileSystemNode, list(owner_ids))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0008_encryption_at_rest"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="filesystemnode",
+            name="total_size_bytes",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="filesystemnode",
+            name="descendant_count",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_aggregates, migrations.RunPython.noop),
+    ]
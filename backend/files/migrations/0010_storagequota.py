@@ -0,0 +1,58 @@
+# Generated by Django 5.2.1 on 2026-10-17 17:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_usage(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    StorageQuota = apps.get_model("files", "StorageQuota")
+    FileSystemNode = apps.get_model("files", "FileSystemNode")
+
+    StorageQuota.objects.bulk_create(
+        [StorageQuota(user_id=pk) for pk in User.objects.values_list("pk", flat=True)],
+        ignore_conflicts=True,
+    )
+    live_bytes = (
+        FileSystemNode.objects.filter(
+            owner_id=OuterRef("user_id"), is_directory=False, deleted_at__isnull=True
+        )
+        .order_by()
+        .values("owner_id")
+        .annotate(total=Sum("size_bytes"))
+        .values("total")
+    )
+    StorageQuota.objects.update(used_bytes=Coalesce(Subquery(live_bytes), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0009_filesystemnode_aggregates"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StorageQuota",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="storage_quota",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("limit_bytes", models.BigIntegerField(blank=True, null=True)),
+                ("used_bytes", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.1 on 2026-10-17 18:20
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.contrib.postgres.operations import BtreeGinExtension, TrigramExtension
+from django.db import migrations, models
+
+
+class AddPostgresIndex(migrations.AddIndex):
+    """
+    AddIndex for GIN/opclass indexes, skipped on databases other than PostgreSQL (the index
+    only speeds up search there; other backends fall back to plain scans).
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0010_storagequota"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        BtreeGinExtension(),
+        AddPostgresIndex(
+            model_name="filesystemnode",
+            index=django.contrib.postgres.indexes.GinIndex(
+                models.F("owner"),
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("name"), name="gin_trgm_ops"
+                ),
+                condition=models.Q(("deleted_at__isnull", True)),
+                name="files_node_name_trgm_idx",
+            ),
+        ),
+        AddPostgresIndex(
+            model_name="filesystemnode",
+            index=models.Index(
+                models.F("owner"),
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("name"), name="text_pattern_ops"
+                ),
+                condition=models.Q(("deleted_at__isnull", True)),
+                name="files_node_name_prefix_idx",
+            ),
+        ),
+        migrations.CreateModel(
+            name="ExtractedText",
+            fields=[
+                (
+                    "node",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="extracted_text",
+                        serialize=False,
+                        to="files.filesystemnode",
+                    ),
+                ),
+                ("content", models.TextField()),
+                ("extracted_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        AddPostgresIndex(
+            model_name="extractedtext",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.SearchVector("content", config="simple"),
+                name="files_text_search_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,156 @@
+# Generated by Django 5.2.1 on 2026-10-17 02:25
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def _on_postgres(schema_editor):
+    return schema_editor.connection.vendor == "postgresql"
+
+
+class AddIndexConcurrentlyIfPostgres(AddIndexConcurrently):
+    """
+    CREATE INDEX CONCURRENTLY on PostgreSQL, so the table stays writable while the index is
+    built; a plain AddIndex elsewhere.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if _on_postgres(schema_editor):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(
+                self, app_label, schema_editor, from_state, to_state
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if _on_postgres(schema_editor):
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(
+                self, app_label, schema_editor, from_state, to_state
+            )
+
+
+class RemoveIndexConcurrentlyIfPostgres(RemoveIndexConcurrently):
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if _on_postgres(schema_editor):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.RemoveIndex.database_forwards(
+                self, app_label, schema_editor, from_state, to_state
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if _on_postgres(schema_editor):
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.RemoveIndex.database_backwards(
+                self, app_label, schema_editor, from_state, to_state
+            )
+
+
+class AddUniqueConstraintConcurrently(migrations.AddConstraint):
+    """
+    A partial UniqueConstraint is a unique index, so on PostgreSQL it can be built with
+    CREATE UNIQUE INDEX CONCURRENTLY instead of locking writes for the whole build.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if not _on_postgres(schema_editor):
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            sql = str(self.constraint.create_sql(model, schema_editor))
+            schema_editor.execute(
+                sql.replace("CREATE UNIQUE INDEX", "CREATE UNIQUE INDEX CONCURRENTLY", 1)
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if not _on_postgres(schema_editor):
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            index_name = schema_editor.quote_name(self.constraint.name)
+            schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+
+
+def check_live_name_conflicts(apps, schema_editor):
+    """
+    Fails early, with the offending names, if live siblings share a name; a concurrent unique
+    index build would otherwise fail half way and leave an invalid index behind.
+    """
+    FileSystemNode = apps.get_model("files", "FileSystemNode")
+    conflicts = list(
+        FileSystemNode.objects.filter(deleted_at__isnull=True)
+        .values("owner_id", "parent_id", "name")
+        .annotate(copies=Count("id"))
+        .filter(copies__gt=1)
+        .order_by("owner_id", "name")[:20]
+    )
+    if conflicts:
+        listing = "\n".join(
+            f"  owner={row['owner_id']} parent={row['parent_id']} name={row['name']!r} "
+            f"({row['copies']} live nodes)"
+            for row in conflicts
+        )
+        raise RuntimeError(
+            "Live nodes with the same name in the same directory must be renamed or deleted "
+            f"before unique names can be enforced:\n{listing}"
+        )
+
+
+class Migration(migrations.Migration):
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("files", "0012_filesystemnode_trash_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_live_name_conflicts, migrations.RunPython.noop),
+        AddUniqueConstraintConcurrently(
+            model_name="filesystemnode",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("deleted_at__isnull", True), ("parent__isnull", False)),
+                fields=("owner", "parent", "name"),
+                name="files_node_unique_live_name",
+            ),
+        ),
+        AddUniqueConstraintConcurrently(
+            model_name="filesystemnode",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("deleted_at__isnull", True), ("parent__isnull", True)),
+                fields=("owner", "name"),
+                name="files_node_unique_live_root_name",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="filesystemnode",
+            unique_together=set(),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name="filesystemnode",
+            index=models.Index(
+                condition=models.Q(("deleted_at__isnull", True)),
+                fields=["owner", "parent", "-is_directory", "name", "id"],
+                name="files_node_live_listing_idx",
+            ),
+        ),
+        RemoveIndexConcurrentlyIfPostgres(
+            model_name="filesystemnode",
+            name="files_node_listing_idx",
+        ),
+        # Both duplicated the indexes Django already creates for the foreign keys.
+        RemoveIndexConcurrentlyIfPostgres(
+            model_name="filesystemnode",
+            name="files_files_owner_i_a97f7f_idx",
+        ),
+        RemoveIndexConcurrentlyIfPostgres(
+            model_name="filesystemnode",
+            name="files_files_parent__8464a3_idx",
+        ),
+    ]
@@ -1,8 +1,47 @@
 import uuid
 
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import F, Q, TextField, Value
+from django.db.models.functions import MD5, Concat, Substr, Upper
+
+
+class UserDataKey(models.Model):
+    """
+    A user's file encryption key, stored wrapped (encrypted) by SECURE_FILES_MASTER_KEY.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="data_key"
+    )
+    wrapped_key = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class Blob(models.Model):
+    """
+    Content-addressed file contents. Every file node of an owner with the same bytes points
+    at the same blob, so duplicate uploads and copies cost no extra disk space.
+    """
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="blobs"
+    )
+    sha256 = models.CharField(max_length=64)
+    size_bytes = models.BigIntegerField()
+
+    # Number of FileSystemNodes (live or soft-deleted) referencing this blob.
+    ref_count = models.BigIntegerField(default=0)
+    # Stored with the owner's data key (see files.crypto) rather than as plaintext.
+    is_encrypted = models.BooleanField(default=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [["owner", "sha256"]]
 
 
 class FileSystemNode(models.Model):
@@ -24,6 +63,15 @@ class FileSystemNode(models.Model):
     # file-only
     size_bytes = models.BigIntegerField(null=True)
     mime_type = models.CharField(max_length=100, null=True)
+    # Null for directories and for files stored before blobs existed (see open_node_contents).
+    blob = models.ForeignKey(
+        Blob, null=True, blank=True, on_delete=models.RESTRICT, related_name="nodes"
+    )
+
+    # directory-only: totals over the live descendants, maintained incrementally by
+    # update_ancestor_aggregates() and recomputed by `manage.py reconcile_tree_aggregates`.
+    total_size_bytes = models.BigIntegerField(default=0)
+    descendant_count = models.BigIntegerField(default=0)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -31,25 +79,144 @@ class FileSystemNode(models.Model):
     # For soft deletes
     deleted_at = models.DateTimeField(null=True, blank=True)
 
+    # Materialized paths, kept in sync by save() and rewritten in bulk by
+    # rewrite_descendant_paths() when a directory is renamed or moved.
+    # logical_path: "/Documents/MySubfolder/MyFile.txt"
+    # tree_path: "/<root id>/.../<own id>/", used for subtree (prefix) queries.
+    logical_path = models.TextField(editable=False, default="")
+    tree_path = models.TextField(editable=False, default="")
+
+    def refresh_paths(self):
+        """
+        Recomputes logical_path and tree_path from the parent's stored paths.
+        """
+        if self.parent is None:
+            parent_logical_path, parent_tree_path = "", "/"
+        else:
+            parent_logical_path, parent_tree_path = self.parent.logical_path, self.parent.tree_path
+
+        self.logical_path = f"{parent_logical_path}/{self.name}"
+        self.tree_path = f"{parent_tree_path}{self.id.hex}/"
+
+    def subtree(self):
+        """
+        Returns a queryset of this node and all of its descendants, live or soft-deleted.
+        """
+        return FileSystemNode.objects.filter(
+            owner_id=self.owner_id, tree_path__startswith=self.tree_path
+        )
+
     @property
-    def logical_path(self):
+    def ancestor_ids(self):
         """
-        Constructs and returns the full logical path for this node.
-        Example: /Documents/MySubfolder/MyFile.txt
+        Ids of this node's ancestors, root first, read from tree_path without a query.
         """
-        path_parts = []
-        current_node = self
-        while current_node is not None:
-            path_parts.append(current_node.name)
-            current_node = current_node.parent
+        return [uuid.UUID(hex_id) for hex_id in self.tree_path.strip("/").split("/")[:-1]]
 
-        return "/" + "/".join(reversed(path_parts))
+    @property
+    def subtree_totals(self):
+        """
+        (bytes, nodes) this node's live subtree contributes to its ancestors' aggregates.
+        """
+        if self.is_directory:
+            return self.total_size_bytes, self.descendant_count + 1
+        return self.size_bytes or 0, 1
+
+    def update_ancestor_aggregates(self, sign=1, ancestor_ids=None):
+        """
+        Adds (sign=1) or subtracts (sign=-1) this node's whole subtree to/from the size and
+        count totals of its ancestors (or of `ancestor_ids`), in a single UPDATE.
+        """
+        size_delta, count_delta = self.subtree_totals
+
+        ancestor_ids = self.ancestor_ids if ancestor_ids is None else ancestor_ids
+        if not ancestor_ids:
+            return 0
+        return FileSystemNode.objects.filter(pk__in=ancestor_ids).update(
+            total_size_bytes=F("total_size_bytes") + sign * size_delta,
+            descendant_count=F("descendant_count") + sign * count_delta,
+        )
+
+    def rewrite_descendant_paths(self, old_logical_path, old_tree_path):
+        """
+        Rewrites the stored paths of every descendant (live or soft-deleted) after this node's
+        own paths changed, as a single UPDATE over the subtree.
+        """
+        return (
+            FileSystemNode.objects.filter(tree_path__startswith=old_tree_path)
+            .exclude(pk=self.pk)
+            .update(
+                logical_path=Concat(
+                    Value(self.logical_path),
+                    Substr("logical_path", len(old_logical_path) + 1),
+                    output_field=TextField(),
+                ),
+                tree_path=Concat(
+                    Value(self.tree_path),
+                    Substr("tree_path", len(old_tree_path) + 1),
+                    output_field=TextField(),
+                ),
+            )
+        )
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or {"name", "parent"} & set(update_fields):
+            self.refresh_paths()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "logical_path", "tree_path"}
+        super().save(*args, **kwargs)
 
     class Meta:
-        unique_together = ("owner", "parent", "name", "deleted_at")
+        # Names are unique among live siblings only; any number of deleted copies may remain.
+        # Root nodes get their own constraint because NULL parents never compare equal. The
+        # unique indexes also answer sibling-name lookups with index-only scans.
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "parent", "name"],
+                name="files_node_unique_live_name",
+                condition=Q(deleted_at__isnull=True, parent__isnull=False),
+            ),
+            models.UniqueConstraint(
+                fields=["owner", "name"],
+                name="files_node_unique_live_root_name",
+                condition=Q(deleted_at__isnull=True, parent__isnull=True),
+            ),
+        ]
         indexes = [
-            models.Index(fields=["owner"]),
-            models.Index(fields=["parent"]),
+            # Directory listings: WHERE owner, parent ORDER BY -is_directory, name, id.
+            models.Index(
+                fields=["owner", "parent", "-is_directory", "name", "id"],
+                name="files_node_live_listing_idx",
+                condition=Q(deleted_at__isnull=True),
+            ),
+            # Trash listing (owner, newest first) and the purge's scan for expired rows.
+            models.Index(
+                fields=["owner", "-deleted_at", "id"],
+                name="files_node_trash_idx",
+                condition=Q(deleted_at__isnull=False),
+            ),
+            # Path lookups hash the path so deep trees never exceed the btree row size limit.
+            models.Index(F("owner"), MD5("logical_path"), name="files_node_owner_path_md5_idx"),
+            models.Index(
+                fields=["tree_path"],
+                name="files_node_tree_path_idx",
+                opclasses=["text_pattern_ops"],
+            ),
+            # Name search (files.search), PostgreSQL only: trigram GIN for substring and fuzzy
+            # matches, btree for short prefixes. Both cover live rows only.
+            GinIndex(
+                F("owner"),
+                OpClass(Upper("name"), name="gin_trgm_ops"),
+                name="files_node_name_trgm_idx",
+                condition=Q(deleted_at__isnull=True),
+            ),
+            models.Index(
+                F("owner"),
+                OpClass(Upper("name"), name="text_pattern_ops"),
+                name="files_node_name_prefix_idx",
+                condition=Q(deleted_at__isnull=True),
+            ),
         ]
 
     def clean(self):
@@ -57,3 +224,65 @@ class FileSystemNode(models.Model):
             raise ValidationError("Directories cannot have size_bytes.")
         if not self.is_directory and self.size_bytes is None:
             raise ValidationError("Files must have size_bytes set.")
+
+
+class UploadSession(models.Model):
+    """
+    A resumable, chunked upload. Byte ranges are appended to a staging file on the storage
+    volume, which is renamed into the blob store (or dropped as a duplicate) on commit;
+    the FileSystemNode is only created at that point.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="upload_sessions"
+    )
+    parent = models.ForeignKey(
+        FileSystemNode, null=True, blank=True, on_delete=models.CASCADE, related_name="+"
+    )
+    name = models.CharField(max_length=255)
+
+    # Id of the FileSystemNode created on commit.
+    node_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    size_bytes = models.BigIntegerField()
+    received_bytes = models.BigIntegerField(default=0)
+    is_encrypted = models.BooleanField(default=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class StorageQuota(models.Model):
+    """
+    Per-user storage accounting. `used_bytes` is the total size_bytes of the user's live files
+    and is updated atomically alongside uploads, deletes and restores (see files.quotas).
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="storage_quota",
+    )
+    # Null means FILES_DEFAULT_QUOTA_BYTES.
+    limit_bytes = models.BigIntegerField(null=True, blank=True)
+    used_bytes = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ExtractedText(models.Model):
+    """
+    Searchable text extracted from a file's contents (plain text and PDFs), filled in the
+    background after upload by files.search.index_node_text().
+    """
+
+    node = models.OneToOneField(
+        FileSystemNode, on_delete=models.CASCADE, primary_key=True, related_name="extracted_text"
+    )
+    content = models.TextField()
+    extracted_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(SearchVector("content", config="simple"), name="files_text_search_idx"),
+        ]
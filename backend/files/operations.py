@@ -0,0 +1,427 @@
+import os
+import uuid
+from collections import Counter, defaultdict
+from hashlib import md5
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Case, CharField, F, Q, TextField, Value, When
+from django.db.models.functions import MD5
+from django.utils import timezone
+from rest_framework import status
+
+from .models import Blob, ExtractedText, FileSystemNode
+from .quotas import QuotaExceeded, lock_available_bytes, release, reserve, subtree_size
+from .storage import link_file, node_file_path
+from .tasks import update_subtrees_deleted_at
+
+NAME_CONFLICT_DETAIL = "A file or folder with that name already exists here."
+
+
+class NodeOperationError(Exception):
+    """
+    A move/copy/delete that can't be applied to a node; carries the HTTP status to report.
+    """
+
+    def __init__(self, detail, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+class NameConflict(NodeOperationError):
+    """
+    A live sibling already has the node's name (the partial unique constraints caught it).
+    """
+
+    def __init__(self, detail=NAME_CONFLICT_DETAIL):
+        super().__init__(detail, status.HTTP_409_CONFLICT)
+
+
+def insert_node(node):
+    """
+    Inserts a new node in a savepoint. Only a failure of this INSERT is reported as a
+    NameConflict; integrity errors elsewhere in the caller's transaction propagate as-is.
+    """
+    try:
+        with transaction.atomic():
+            node.save(force_insert=True)
+    except IntegrityError:
+        raise NameConflict()
+
+
+def resolve_nodes(user, ids=(), paths=()):
+    """
+    Looks up many live nodes of `user` by id and by logical path with one query each.
+    Returns ({id: node}, {path: node}) keyed by the values as given; items that don't
+    resolve are left out.
+    """
+    parsed_ids = {}
+    for node_id in ids:
+        try:
+            parsed_ids[node_id] = uuid.UUID(str(node_id))
+        except (TypeError, ValueError):
+            continue
+    by_id = {}
+    if parsed_ids:
+        nodes = FileSystemNode.objects.filter(
+            owner=user, deleted_at__isnull=True, pk__in=parsed_ids.values()
+        ).in_bulk()
+        by_id = {node_id: nodes[pk] for node_id, pk in parsed_ids.items() if pk in nodes}
+
+    by_path = {}
+    wanted = {"/" + path.strip("/"): path for path in paths if isinstance(path, str)}
+    if wanted:
+        matches = defaultdict(list)
+        for node in FileSystemNode.objects.alias(path_digest=MD5("logical_path")).filter(
+            owner=user,
+            deleted_at__isnull=True,
+            path_digest__in=[md5(path.encode()).hexdigest() for path in wanted],
+        ):
+            matches[node.logical_path].append(node)
+        for logical_path, path in wanted.items():
+            # Several live nodes on one path means a broken tree; treat the path as unresolved.
+            if len(matches.get(logical_path, [])) == 1:
+                by_path[path] = matches[logical_path][0]
+
+    return by_id, by_path
+
+
+def plan_destinations(items, parent, replaces_node=False):
+    """
+    Checks a batch of (node, name) pairs of one owner bound for `parent` (None for the root)
+    as if they were placed there one after another, with one query for the names and one for
+    deleted ancestors. Returns a list aligned with `items` holding None for the pairs that can
+    go and the NodeOperationError of the others. With `replaces_node` (a move), a node doesn't
+    conflict with itself.
+
+    Until the background job of a large delete has stamped them, descendants of a deleted
+    directory still look live; they can't be moved or copied, nor be a destination.
+    """
+    owner_id = items[0][0].owner_id
+    parent_id = parent.pk if parent is not None else None
+    # Names only, so the live-name unique indexes answer with an index-only scan.
+    taken = set(
+        FileSystemNode.objects.filter(
+            owner_id=owner_id,
+            parent=parent,
+            name__in={name for _, name in items},
+            deleted_at__isnull=True,
+        ).values_list("name", flat=True)
+    )
+    claimed = set()
+    ancestor_ids = {pk for node, _ in items for pk in node.ancestor_ids}
+    if parent is not None:
+        ancestor_ids.update(parent.ancestor_ids)
+    deleted = set()
+    if ancestor_ids:
+        deleted = set(
+            FileSystemNode.objects.filter(
+                owner_id=owner_id, pk__in=ancestor_ids, deleted_at__isnull=False
+            ).values_list("pk", flat=True)
+        )
+    parent_deleted = parent is not None and not deleted.isdisjoint(parent.ancestor_ids)
+
+    errors = []
+    for node, name in items:
+        if parent_deleted:
+            errors.append(
+                NodeOperationError(
+                    "The destination folder is in the trash.", status.HTTP_404_NOT_FOUND
+                )
+            )
+        elif not deleted.isdisjoint(node.ancestor_ids):
+            errors.append(
+                NodeOperationError("This item is in the trash.", status.HTTP_404_NOT_FOUND)
+            )
+        elif parent is not None and parent.tree_path.startswith(node.tree_path):
+            errors.append(NodeOperationError("A directory cannot be moved or copied into itself."))
+        elif name in claimed or (
+            name in taken
+            and not (replaces_node and node.parent_id == parent_id and node.name == name)
+        ):
+            errors.append(NameConflict())
+        else:
+            claimed.add(name)
+            errors.append(None)
+    return errors
+
+
+def _single_result(results):
+    (result,) = results
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def _case(values, output_field):
+    return Case(
+        *[When(pk=pk, then=Value(value)) for pk, value in values.items()],
+        output_field=output_field,
+    )
+
+
+def move_node(node, parent, name, deltas):
+    """
+    Reparents (and optionally renames) `node`; see move_nodes().
+    """
+    if name != node.name:
+        old_name, node.name = node.name, name
+        try:
+            node.full_clean(
+                exclude=["id", "owner", "parent", "size_bytes", "mime_type", "blob"],
+                validate_constraints=False,
+            )
+        except ValidationError as exc:
+            raise NodeOperationError(exc.message_dict or exc.messages)
+        finally:
+            node.name = old_name
+    return _single_result(move_nodes([(node, name)], parent, deltas))
+
+
+def move_nodes(items, parent, deltas):
+    """
+    Moves a batch of (node, new name) pairs of one owner into `parent` (None for the root)
+    with a fixed set of statements: one query for name conflicts, one UPDATE reparenting
+    every node (new names and paths chosen with CASE) and one prefix rewrite per moved
+    directory's descendants. No file contents are touched. Aggregate changes are collected
+    in `deltas` (an AncestorAggregateDeltas) for the caller to apply once.
+
+    Returns a list aligned with `items` of the moved node or the NodeOperationError that
+    kept it in place. A node listed twice is only moved once.
+    """
+    results = [None] * len(items)
+    first_index = {}
+    for index, (node, _) in enumerate(items):
+        first_index.setdefault(node.pk, index)
+    unique = sorted(first_index.values())
+    errors = plan_destinations([items[index] for index in unique], parent, replaces_node=True)
+
+    parent_id = parent.pk if parent else None
+    moving = {}
+    for index, error in zip(unique, errors):
+        node, name = items[index]
+        if error is None and not (node.parent_id == parent_id and node.name == name):
+            moving[node.pk] = (node, name)
+        results[index] = error or node
+
+    if moving:
+        try:
+            _apply_moves(moving, parent, deltas)
+        except IntegrityError:
+            # A concurrent request took one of the names after plan_destinations() looked.
+            for index in unique:
+                if items[index][0].pk in moving:
+                    results[index] = NameConflict()
+
+    for index, (node, _) in enumerate(items):
+        results[index] = results[first_index[node.pk]]
+    return results
+
+
+def _apply_moves(moving, parent, deltas):
+    """
+    Writes the moves planned by move_nodes(); {node id: (node, new name)}. Updates the nodes
+    in memory only once the statements succeed.
+    """
+    # What each moved node takes out of its old ancestors and into its new ones: its live
+    # subtree minus the moved nodes nested in it, which are accounted for on their own.
+    contributions = {pk: list(node.subtree_totals) for pk, (node, _) in moving.items()}
+    for node, _ in moving.values():
+        nearest = next((pk for pk in reversed(node.ancestor_ids) if pk in moving), None)
+        if nearest is not None:
+            size, count = node.subtree_totals
+            contributions[nearest][0] -= size
+            contributions[nearest][1] -= count
+
+    planned = {}
+    for pk, (node, name) in moving.items():
+        moved = FileSystemNode(id=node.pk, owner_id=node.owner_id, parent=parent, name=name)
+        moved.refresh_paths()
+        planned[pk] = moved
+
+    now = timezone.now()
+    with transaction.atomic():
+        FileSystemNode.objects.filter(pk__in=moving).update(
+            parent=parent,
+            name=_case({pk: moved.name for pk, moved in planned.items()}, CharField()),
+            logical_path=_case(
+                {pk: moved.logical_path for pk, moved in planned.items()}, TextField()
+            ),
+            tree_path=_case({pk: moved.tree_path for pk, moved in planned.items()}, TextField()),
+            updated_at=now,
+        )
+        # Deepest first: a moved directory nested in another moved one must be rewritten
+        # from its own old prefix before the outer rewrite would change it.
+        directories = [node for node, _ in moving.values() if node.is_directory]
+        for node in sorted(directories, key=lambda node: len(node.tree_path), reverse=True):
+            planned[node.pk].rewrite_descendant_paths(node.logical_path, node.tree_path)
+
+    new_ancestor_ids = [*parent.ancestor_ids, parent.pk] if parent else []
+    for pk, (node, name) in moving.items():
+        size, count = contributions[pk]
+        deltas.add_totals(node.ancestor_ids, -size, -count)
+        deltas.add_totals(new_ancestor_ids, size, count)
+        node.parent, node.name, node.updated_at = parent, name, now
+        node.logical_path, node.tree_path = planned[pk].logical_path, planned[pk].tree_path
+
+
+def copy_node(node, parent, name, deltas):
+    """
+    Copies `node` and its live subtree into `parent` under `name`; see copy_nodes().
+    """
+    return _single_result(copy_nodes([(node, name)], parent, deltas))
+
+
+def copy_nodes(items, parent, deltas):
+    """
+    Copies a batch of (node, name) pairs of one owner, with their live subtrees, into
+    `parent` with a fixed set of statements: one query for name conflicts, one locking the
+    quota, one reading every subtree, and bulk INSERTs of the new rows. Copied files share
+    the original blobs (one reference each); files stored before blobs existed are
+    hard-linked. Copies count against the owner's quota, filled in request order.
+
+    Returns a list aligned with `items` of the root copy or the exception (NodeOperationError
+    or QuotaExceeded) that prevented it.
+    """
+    results = plan_destinations(items, parent)
+    owner_id = items[0][0].owner_id
+
+    room = lock_available_bytes(owner_id)
+    accepted, reserved = [], 0
+    for index, (node, name) in enumerate(items):
+        if results[index] is not None:
+            continue
+        size = subtree_size(node)
+        if room is not None and reserved + size > room:
+            results[index] = QuotaExceeded("Storage quota exceeded.")
+            continue
+        reserved += size
+        accepted.append(index)
+    if not accepted:
+        return results
+
+    roots = {items[index][0].pk: items[index][0] for index in accepted}
+    in_subtrees = Q()
+    for root in roots.values():
+        in_subtrees |= Q(tree_path__startswith=root.tree_path)
+    originals_by_root = defaultdict(list)
+    for original in FileSystemNode.objects.filter(
+        in_subtrees, owner_id=owner_id, deleted_at__isnull=True
+    ).order_by("tree_path"):
+        # A subtree nested in another copied one belongs to both copies.
+        for pk in (*original.ancestor_ids, original.pk):
+            if pk in roots:
+                originals_by_root[pk].append(original)
+
+    copies, copies_of_original, links, root_copies = [], defaultdict(list), [], {}
+    for index in accepted:
+        node, name = items[index]
+        copies_by_original = _plan_copy(originals_by_root[node.pk], node, parent, name)
+        for original in originals_by_root[node.pk]:
+            copy = copies_by_original.get(original.pk)
+            if copy is None:
+                continue
+            copies.append(copy)
+            copies_of_original[original.pk].append(copy)
+            if not original.is_directory and original.blob_id is None:
+                links.append(
+                    (node_file_path(owner_id, original.pk), node_file_path(owner_id, copy.pk))
+                )
+        root_copies[index] = copies_by_original[node.pk]
+
+    references = Counter(copy.blob_id for copy in copies if copy.blob_id is not None)
+    blobs_by_count = defaultdict(list)
+    for blob_id, count in references.items():
+        blobs_by_count[count].append(blob_id)
+
+    # A savepoint, so a failed batch leaves nothing behind.
+    try:
+        with transaction.atomic():
+            reserve(owner_id, reserved)
+            FileSystemNode.objects.bulk_create(copies, batch_size=1000)
+            ExtractedText.objects.bulk_create(
+                [
+                    ExtractedText(node_id=copy.pk, content=text.content)
+                    for text in ExtractedText.objects.filter(node_id__in=list(copies_of_original))
+                    for copy in copies_of_original[text.node_id]
+                ],
+                batch_size=100,
+            )
+            for count, blob_ids in blobs_by_count.items():
+                Blob.objects.filter(pk__in=blob_ids).update(ref_count=F("ref_count") + count)
+    except IntegrityError:
+        # A concurrent request took one of the names after plan_destinations() looked.
+        for index in accepted:
+            results[index] = NameConflict()
+        return results
+
+    linked = []
+    try:
+        for source, destination in links:
+            link_file(source, destination)
+            linked.append(destination)
+    except BaseException:
+        for destination in linked:
+            os.remove(destination)
+        raise
+
+    for index, root_copy in root_copies.items():
+        deltas.add(root_copy)
+        results[index] = root_copy
+    return results
+
+
+def _plan_copy(originals, node, parent, name):
+    """
+    Builds (unsaved) copies of `node`'s live subtree, `originals` in tree_path order, rooted
+    in `parent` under `name`. Returns {original id: copy}.
+    """
+    copies_by_original = {}
+    for original in originals:
+        if original.pk == node.pk:
+            new_parent, new_name = parent, name
+        elif original.parent_id in copies_by_original:
+            new_parent, new_name = copies_by_original[original.parent_id], original.name
+        else:
+            continue
+
+        copy = FileSystemNode(
+            id=uuid.uuid4(),
+            owner_id=original.owner_id,
+            parent=new_parent,
+            name=new_name,
+            is_directory=original.is_directory,
+            size_bytes=original.size_bytes,
+            mime_type=original.mime_type,
+            blob_id=original.blob_id,
+            total_size_bytes=original.total_size_bytes,
+            descendant_count=original.descendant_count,
+        )
+        copy.refresh_paths()
+        copies_by_original[original.pk] = copy
+    return copies_by_original
+
+
+def top_level_nodes(nodes):
+    """
+    Drops nodes that are inside another given node, keeping the first occurrence of each.
+    """
+    unique = list({node.pk: node for node in nodes}.values())
+    selected = {node.pk for node in unique}
+    return [node for node in unique if not selected.intersection(node.ancestor_ids)]
+
+
+def delete_nodes(nodes, deltas):
+    """
+    Soft-deletes several live subtrees of one owner together, with one UPDATE and a shared
+    deleted_at stamp. Each subtree can still be restored on its own afterwards.
+    """
+    nodes = top_level_nodes(nodes)
+    if not nodes:
+        return []
+    update_subtrees_deleted_at(nodes, timezone.now())
+    for node in nodes:
+        deltas.add(node, sign=-1)
+    release(nodes[0].owner_id, sum(subtree_size(node) for node in nodes))
+    return nodes
@@ -0,0 +1,112 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset ("seek") pagination over a fixed, unique ordering.
+
+    The cursor encodes the ordering values of the last row of the previous page, so every
+    page is a single range scan on the matching composite index, no matter how deep the
+    client has paged. Subclasses set `ordering`, which must end with a unique field.
+    """
+
+    ordering = ()
+    page_size = 100
+    max_page_size = 1000
+    cursor_query_param = "cursor"
+    page_size_query_param = "limit"
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_page_size(self, request):
+        raw_size = request.query_params.get(self.page_size_query_param)
+        if raw_size is None:
+            return self.page_size
+        try:
+            page_size = int(raw_size)
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: "Must be an integer."})
+        if page_size < 1:
+            raise ValidationError({self.page_size_query_param: "Must be a positive integer."})
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, field.lstrip("-")) for field in self.ordering]
+        payload = json.dumps(values, default=str, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, request, model):
+        """
+        The ordering values encoded in the request's cursor, each coerced to its model
+        field's type (None without a cursor). Anything malformed or tampered with is a 404.
+        """
+        raw_cursor = request.query_params.get(self.cursor_query_param)
+        if not raw_cursor:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(raw_cursor.encode()))
+        except (binascii.Error, ValueError):
+            raise NotFound("Invalid cursor.")
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound("Invalid cursor.")
+        coerced = []
+        for field, value in zip(self.ordering, values):
+            model_field = model._meta.get_field(field.lstrip("-"))
+            try:
+                value = model_field.to_python(value)
+            except (DjangoValidationError, TypeError, ValueError):
+                raise NotFound("Invalid cursor.")
+            if value is None:
+                raise NotFound("Invalid cursor.")
+            coerced.append(value)
+        return coerced
+
+    def get_seek_filter(self, values):
+        """
+        Builds `(a, b, c) > (va, vb, vc)` honouring each field's direction, i.e.
+        a > va OR (a = va AND b > vb) OR (a = va AND b = vb AND c > vc).
+        """
+        seek = Q()
+        equal_prefix = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            seek |= Q(**equal_prefix, **{f"{name}__{lookup}": value})
+            equal_prefix[name] = value
+        return seek
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size_for_request = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        values = self.decode_cursor(request, queryset.model)
+        if values is not None:
+            queryset = queryset.filter(self.get_seek_filter(values))
+
+        # Fetch one extra row to know whether another page exists.
+        rows = list(queryset[: self.page_size_for_request + 1])
+        self.has_next = len(rows) > self.page_size_for_request
+        page = rows[: self.page_size_for_request]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.next_cursor, "results": data})
+
+
+class DirectoryListingPagination(KeysetPagination):
+    """
+    Directory listings: folders first, then by name. Backed by `files_node_live_listing_idx`.
+    """
+
+    ordering = ("-is_directory", "name", "id")
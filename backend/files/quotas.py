@@ -0,0 +1,115 @@
+from django.conf import settings
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import FileSystemNode, StorageQuota
+
+# Allowance for multipart boundaries and form fields when pre-checking a request's declared
+# Content-Length against the remaining quota.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def _within_limit(size):
+    """
+    Rows whose usage can grow by `size` without going over their limit.
+    """
+    default_limit = settings.FILES_DEFAULT_QUOTA_BYTES
+    if default_limit is None:
+        return Q(limit_bytes__isnull=True) | Q(used_bytes__lte=F("limit_bytes") - size)
+    return Q(used_bytes__lte=Coalesce(F("limit_bytes"), Value(default_limit)) - size)
+
+
+def get_quota(user_id):
+    quota, _ = StorageQuota.objects.get_or_create(user_id=user_id)
+    return quota
+
+
+def effective_limit(quota):
+    if quota.limit_bytes is not None:
+        return quota.limit_bytes
+    return settings.FILES_DEFAULT_QUOTA_BYTES
+
+
+def has_room_for(user_id, size):
+    """
+    Cheap pre-check before any bytes are read or written. Not a reservation.
+    """
+    quota = get_quota(user_id)
+    limit = effective_limit(quota)
+    return limit is None or quota.used_bytes + size <= limit
+
+
+def lock_available_bytes(user_id):
+    """
+    Locks the user's quota row until the transaction ends and returns how many more bytes
+    fit (None for unlimited), so a batch can pick the items that fit before reserving them.
+    """
+    get_quota(user_id)
+    quota = StorageQuota.objects.select_for_update().get(user_id=user_id)
+    limit = effective_limit(quota)
+    return None if limit is None else limit - quota.used_bytes
+
+
+def reserve(user_id, size):
+    """
+    Atomically adds `size` to the user's usage, raising QuotaExceeded (and changing nothing)
+    if that would go over the limit. A single conditional UPDATE, so concurrent uploads
+    cannot overshoot the quota together.
+    """
+    if size <= 0:
+        return
+    get_quota(user_id)
+    updated = StorageQuota.objects.filter(_within_limit(size), user_id=user_id).update(
+        used_bytes=F("used_bytes") + size, updated_at=timezone.now()
+    )
+    if not updated:
+        raise QuotaExceeded("Storage quota exceeded.")
+
+
+def release(user_id, size):
+    if size <= 0:
+        return
+    StorageQuota.objects.filter(user_id=user_id).update(
+        used_bytes=F("used_bytes") - size, updated_at=timezone.now()
+    )
+
+
+def subtree_size(node):
+    """
+    Bytes held by a node's live subtree, from the maintained directory aggregates.
+    """
+    return node.total_size_bytes if node.is_directory else node.size_bytes or 0
+
+
+def recount(user_ids=None):
+    """
+    Rebuilds usage counters from FileSystemNode.size_bytes with one UPDATE.
+    """
+    from django.contrib.auth import get_user_model
+
+    users = get_user_model().objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    StorageQuota.objects.bulk_create(
+        [StorageQuota(user_id=pk) for pk in users.values_list("pk", flat=True)],
+        ignore_conflicts=True,
+    )
+
+    live_bytes = (
+        FileSystemNode.objects.filter(
+            owner_id=OuterRef("user_id"), is_directory=False, deleted_at__isnull=True
+        )
+        .order_by()
+        .values("owner_id")
+        .annotate(total=Sum("size_bytes"))
+        .values("total")
+    )
+    quotas = StorageQuota.objects.all()
+    if user_ids is not None:
+        quotas = quotas.filter(user_id__in=user_ids)
+    return quotas.update(used_bytes=Coalesce(Subquery(live_bytes), Value(0)))
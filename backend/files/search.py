@@ -0,0 +1,195 @@
+import logging
+from datetime import datetime, time
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connection
+from django.db.models import Q
+from django.db.models.functions import Upper
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from pypdf import PdfReader
+from rest_framework.exceptions import ValidationError
+
+from .models import ExtractedText, FileSystemNode
+from .pagination import KeysetPagination
+from .storage import open_node_contents
+
+logger = logging.getLogger(__name__)
+
+SEARCH_MODES = ("prefix", "substring", "fuzzy")
+TEXT_MIME_TYPES = {"text/plain", "application/pdf"}
+
+
+class SearchPagination(KeysetPagination):
+    """
+    Search results by name. Seeks on (name, id) after the match filter has narrowed the rows.
+    """
+
+    ordering = ("name", "id")
+    page_size = 50
+
+
+def _parse_int(params, name):
+    raw_value = params.get(name)
+    if raw_value in (None, ""):
+        return None
+    try:
+        return int(raw_value)
+    except ValueError:
+        raise ValidationError({name: "Must be an integer."})
+
+
+def _parse_moment(params, name):
+    raw_value = params.get(name)
+    if not raw_value:
+        return None
+    try:
+        moment = parse_datetime(raw_value)
+        if moment is None:
+            day = parse_date(raw_value)
+            moment = datetime.combine(day, time.min) if day else None
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ValidationError({name: "Must be an ISO 8601 date or datetime."})
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _name_filter(query, mode):
+    needle = query.upper()
+    if mode == "prefix":
+        return Q(name_upper__startswith=needle)
+    if mode == "fuzzy" and connection.vendor == "postgresql":
+        # pg_trgm's `%` operator, answered from files_node_name_trgm_idx.
+        return Q(name_upper__trigram_similar=needle)
+    return Q(name_upper__contains=needle)
+
+
+def _content_filter(query):
+    if connection.vendor == "postgresql":
+        matches = ExtractedText.objects.alias(
+            document=SearchVector("content", config="simple")
+        ).filter(document=SearchQuery(query, config="simple"))
+    else:
+        matches = ExtractedText.objects.filter(content__icontains=query)
+    return Q(pk__in=matches.values("node_id"))
+
+
+def search_nodes(queryset, params):
+    """
+    Narrows `queryset` (the user's live nodes) by the search parameters:
+
+    - `q`: text to match against node names (required);
+    - `mode`: `prefix`, `substring` (default) or `fuzzy` (trigram similarity);
+    - `content=1`: also match the extracted text of plain-text and PDF files;
+    - `type` (`file`/`directory`), `mime_type` (exact, or a prefix ending in "/"),
+      `min_size`/`max_size` in bytes, `modified_after`/`modified_before`,
+      and `within` (a directory id) to search one subtree only.
+    """
+    query = (params.get("q") or "").strip()
+    if not query:
+        raise ValidationError({"q": "This parameter is required."})
+    mode = params.get("mode") or "substring"
+    if mode not in SEARCH_MODES:
+        raise ValidationError({"mode": f"Must be one of: {', '.join(SEARCH_MODES)}."})
+
+    user_nodes = queryset
+    matches = _name_filter(query, mode)
+    if params.get("content") in ("1", "true"):
+        matches |= _content_filter(query)
+    queryset = queryset.alias(name_upper=Upper("name")).filter(matches)
+
+    node_type = params.get("type")
+    if node_type in ("file", "directory"):
+        queryset = queryset.filter(is_directory=node_type == "directory")
+
+    mime_type = params.get("mime_type")
+    if mime_type:
+        if mime_type.endswith("/"):
+            queryset = queryset.filter(mime_type__startswith=mime_type)
+        else:
+            queryset = queryset.filter(mime_type=mime_type)
+
+    min_size = _parse_int(params, "min_size")
+    if min_size is not None:
+        queryset = queryset.filter(size_bytes__gte=min_size)
+    max_size = _parse_int(params, "max_size")
+    if max_size is not None:
+        queryset = queryset.filter(size_bytes__lte=max_size)
+
+    modified_after = _parse_moment(params, "modified_after")
+    if modified_after is not None:
+        queryset = queryset.filter(updated_at__gte=modified_after)
+    modified_before = _parse_moment(params, "modified_before")
+    if modified_before is not None:
+        queryset = queryset.filter(updated_at__lt=modified_before)
+
+    within = params.get("within")
+    if within:
+        try:
+            directory = user_nodes.get(pk=within, is_directory=True)
+        except (FileSystemNode.DoesNotExist, DjangoValidationError):
+            raise ValidationError({"within": "Unknown directory."})
+        queryset = queryset.filter(tree_path__startswith=directory.tree_path).exclude(
+            pk=directory.pk
+        )
+
+    return queryset
+
+
+def extract_text(node):
+    """
+    Returns up to FILES_SEARCH_MAX_TEXT_CHARS characters of text from a plain-text or PDF
+    file, or None for other types.
+    """
+    limit = settings.FILES_SEARCH_MAX_TEXT_CHARS
+    if node.mime_type == "text/plain":
+        with open_node_contents(node) as contents:
+            # UTF-8 uses at most 4 bytes per character.
+            return contents.read(limit * 4).decode("utf-8", errors="replace")[:limit]
+
+    if node.mime_type == "application/pdf":
+        parts, length = [], 0
+        with open_node_contents(node) as contents:
+            for page in PdfReader(contents).pages:
+                text = page.extract_text() or ""
+                parts.append(text)
+                length += len(text)
+                if length >= limit:
+                    break
+        return "\n".join(parts)[:limit]
+
+    return None
+
+
+def index_node_text(node_id):
+    """
+    Stores the extracted text of a live plain-text or PDF file (post-upload stage).
+    """
+    node = (
+        FileSystemNode.objects.select_related("blob")
+        .filter(
+            pk=node_id,
+            deleted_at__isnull=True,
+            is_directory=False,
+            mime_type__in=TEXT_MIME_TYPES,
+            size_bytes__lte=settings.FILES_SEARCH_MAX_INDEXED_BYTES,
+        )
+        .first()
+    )
+    if node is None:
+        return
+    try:
+        text = extract_text(node)
+    except Exception:
+        logger.warning("Could not extract text from %s.", node_id, exc_info=True)
+        return
+    if text:
+        # PostgreSQL text columns cannot hold NUL characters.
+        ExtractedText.objects.update_or_create(
+            node_id=node.pk, defaults={"content": text.replace("\x00", "")}
+        )
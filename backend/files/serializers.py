@@ -1,14 +1,34 @@
 from rest_framework import serializers
 
-from .models import FileSystemNode
+from metrics.serializers import TimedSerializerMixin
 
+from .models import FileSystemNode, UploadSession
 
-class FileSystemNodeSerializer(serializers.ModelSerializer):
+
+class FileSystemNodeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     owner = serializers.HiddenField(default=serializers.CurrentUserDefault())
     parent = serializers.PrimaryKeyRelatedField(
         queryset=FileSystemNode.objects.all(), allow_null=True
     )
 
+    def __init__(self, *args, **kwargs):
+        # Optional subset of fields to render, e.g. from a `fields=` query parameter.
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get("request")
+        if "parent" in fields and request is not None and request.user.is_authenticated:
+            # New nodes may only go into the requester's own live directories.
+            fields["parent"].queryset = FileSystemNode.objects.filter(
+                owner=request.user, is_directory=True, deleted_at__isnull=True
+            )
+        return fields
+
     class Meta:
         model = FileSystemNode
         fields = [
@@ -20,6 +40,8 @@ class FileSystemNodeSerializer(serializers.ModelSerializer):
             "is_directory",
             "size_bytes",
             "mime_type",
+            "total_size_bytes",
+            "descendant_count",
             "created_at",
             "updated_at",
             "deleted_at",
@@ -27,11 +49,19 @@ class FileSystemNodeSerializer(serializers.ModelSerializer):
         read_only_fields = [
             "id",
             "logical_path",
+            "total_size_bytes",
+            "descendant_count",
             "created_at",
             "updated_at",
             "deleted_at",
         ]
 
+    def validate_name(self, value):
+        # Names are joined with "/" into the stored logical_path.
+        if "/" in value:
+            raise serializers.ValidationError("Names cannot contain '/'.")
+        return value
+
     def validate(self, data):
         is_directory = data.get("is_directory", getattr(self.instance, "is_directory", None))
         size_bytes = data.get("size_bytes", getattr(self.instance, "size_bytes", None))
@@ -56,3 +86,28 @@ class FileSystemNodeSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError({"mime_type": "Files must have mime_type set."})
 
         return data
+
+
+class TrashNodeSerializer(FileSystemNodeSerializer):
+    expires_at = serializers.SerializerMethodField()
+
+    class Meta(FileSystemNodeSerializer.Meta):
+        fields = FileSystemNodeSerializer.Meta.fields + ["expires_at"]
+
+    def get_expires_at(self, node):
+        return node.deleted_at + self.context["retention_period"]
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = [
+            "id",
+            "parent",
+            "name",
+            "size_bytes",
+            "received_bytes",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = fields
@@ -0,0 +1,192 @@
+import hashlib
+import os
+import shutil
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .crypto import (
+    EncryptedFileReader,
+    EncryptedFileSystemStorage,
+    encryption_enabled,
+    get_user_data_key,
+)
+from .models import Blob
+
+
+def user_storage_dir(user_id):
+    """
+    Returns (and creates) the directory holding a user's physical files.
+    """
+    location = os.path.join(settings.SECURE_USER_FILES_STORAGE_BASE, str(user_id))
+    os.makedirs(location, exist_ok=True)
+    return location
+
+
+def node_file_path(owner_id, node_id):
+    """
+    Legacy location of a file node's contents: <storage base>/<user id>/<node id>.
+    """
+    return os.path.join(user_storage_dir(owner_id), str(node_id))
+
+
+def blob_file_path(owner_id, sha256):
+    """
+    Location of a blob: <storage base>/<user id>/blobs/<first 2 hex chars>/<sha256>.
+    """
+    return os.path.join(user_storage_dir(owner_id), "blobs", sha256[:2], sha256)
+
+
+def staging_dir(owner_id):
+    location = os.path.join(user_storage_dir(owner_id), "staging")
+    os.makedirs(location, exist_ok=True)
+    return location
+
+
+def get_blob_storage(owner_id):
+    """
+    Storage for an owner's blobs: EncryptedFileSystemStorage with the owner's data key when
+    encryption at rest is enabled, a plain FileSystemStorage otherwise.
+    """
+    location = os.path.join(user_storage_dir(owner_id), "blobs")
+    if encryption_enabled():
+        return EncryptedFileSystemStorage(data_key=get_user_data_key(owner_id), location=location)
+    return FileSystemStorage(location=location)
+
+
+def blob_name(sha256):
+    return f"{sha256[:2]}/{sha256}"
+
+
+def open_node_contents(node):
+    """
+    Opens a file node's plaintext contents as a seekable binary file object. Encrypted blobs
+    are decrypted lazily, chunk by chunk, as they are read.
+    """
+    if node.blob_id is None:
+        return open(node_file_path(node.owner_id, node.id), "rb")
+
+    blob = node.blob
+    path = blob_file_path(node.owner_id, blob.sha256)
+    if blob.is_encrypted:
+        return EncryptedFileReader(path, get_user_data_key(node.owner_id), size=blob.size_bytes)
+    return open(path, "rb")
+
+
+def node_sendfile_path(node):
+    """
+    Path a web server may send verbatim for this node, or None when the contents are
+    encrypted on disk and must go through open_node_contents().
+    """
+    if node.blob_id is None:
+        return node_file_path(node.owner_id, node.id)
+    if node.blob.is_encrypted:
+        return None
+    return blob_file_path(node.owner_id, node.blob.sha256)
+
+
+def hash_uploaded_file(uploaded_file):
+    hasher = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        hasher.update(chunk)
+    uploaded_file.seek(0)
+    return hasher.hexdigest()
+
+
+def _lock_or_create_blob(owner_id, sha256, size_bytes, is_encrypted):
+    """
+    Locks the owner's blob for `sha256`, creating it if needed. When a concurrent upload of
+    the same contents inserts it first, the failed INSERT is rolled back to a savepoint and
+    the other request's row is locked instead, so the race never surfaces as an error.
+    """
+    blobs = Blob.objects.select_for_update()
+    try:
+        return blobs.get(owner_id=owner_id, sha256=sha256)
+    except Blob.DoesNotExist:
+        pass
+    try:
+        with transaction.atomic():
+            return Blob.objects.create(
+                owner_id=owner_id, sha256=sha256, size_bytes=size_bytes, is_encrypted=is_encrypted
+            )
+    except IntegrityError:
+        return blobs.get(owner_id=owner_id, sha256=sha256)
+
+
+def acquire_blob(owner_id, sha256, size_bytes, is_encrypted, write_contents):
+    """
+    Returns the owner's blob for `sha256` with one more reference. The contents are only
+    written (by calling `write_contents(destination)`) when no blob with that hash exists yet,
+    so duplicates cost no extra disk or write I/O. Must run inside a transaction.
+    """
+    blob = _lock_or_create_blob(owner_id, sha256, size_bytes, is_encrypted)
+
+    destination = blob_file_path(owner_id, sha256)
+    if not os.path.exists(destination):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            write_contents(destination)
+        except BaseException:
+            if os.path.exists(destination):
+                os.remove(destination)
+            raise
+        blob.is_encrypted = is_encrypted
+
+    Blob.objects.filter(pk=blob.pk).update(
+        ref_count=F("ref_count") + 1, is_encrypted=blob.is_encrypted
+    )
+    blob.ref_count += 1
+    return blob
+
+
+@transaction.atomic
+def store_uploaded_file(owner_id, uploaded_file):
+    """
+    Stores a Django UploadedFile as (or links it to) a blob. The hash computed while the
+    upload was streamed in (see HashingUploadHandler) is used when available. Unencrypted
+    uploads that Django already buffered to a temporary file are renamed into place.
+    """
+    sha256 = getattr(uploaded_file, "sha256", None) or hash_uploaded_file(uploaded_file)
+    storage = get_blob_storage(owner_id)
+    return acquire_blob(
+        owner_id,
+        sha256,
+        uploaded_file.size,
+        getattr(storage, "encrypted", False),
+        lambda destination: storage.save(blob_name(sha256), uploaded_file),
+    )
+
+
+@transaction.atomic
+def store_staged_file(owner_id, staged_path, sha256, size_bytes, is_encrypted):
+    """
+    Links a fully written staging file (e.g. a committed upload session) to a blob,
+    hard-linking it into place if the contents are new. The staging file itself is only
+    removed once the transaction commits, so a rolled-back commit can simply be retried.
+    """
+    blob = acquire_blob(
+        owner_id,
+        sha256,
+        size_bytes,
+        is_encrypted,
+        lambda destination: link_file(staged_path, destination),
+    )
+    transaction.on_commit(lambda: _remove_if_exists(staged_path))
+    return blob
+
+
+def link_file(source, destination):
+    # Hard links share the inode, so no bytes are copied; fall back to a copy across devices.
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def _remove_if_exists(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,119 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from jobs.queue import enqueue, job
+
+from .models import FileSystemNode
+from .thumbnails import generate_thumbnails
+
+
+@job(name="files.process_uploaded_file")
+def process_uploaded_file(node_id):
+    """
+    Post-upload pipeline, run after the upload response has been sent. Each stage must be
+    safe to repeat, since a failed job is retried as a whole.
+    """
+    from .search import index_node_text
+
+    index_node_text(node_id)
+
+    node = (
+        FileSystemNode.objects.select_related("blob")
+        .filter(pk=node_id, deleted_at__isnull=True)
+        .first()
+    )
+    if node is not None:
+        generate_thumbnails(node)
+
+
+def enqueue_upload_processing(node):
+    return enqueue(process_uploaded_file, str(node.pk), idempotency_key=f"upload:{node.pk}")
+
+
+def _parse_deleted_at(value):
+    return parse_datetime(value) if value else None
+
+
+@job(name="files.update_subtree_deleted_at_in_batches")
+def update_subtree_deleted_at_in_batches(owner_id, tree_path, from_deleted_at, to_deleted_at):
+    """
+    Moves the descendants of the subtree root at `tree_path` whose deleted_at equals
+    `from_deleted_at` to `to_deleted_at` (ISO 8601 strings or None), FILES_SUBTREE_BATCH_SIZE
+    rows per transaction so no statement holds locks for long. The root was updated when the
+    job was enqueued; each batch first checks (with the root locked) that it still has
+    `to_deleted_at`, so a restore or delete of the root in the meantime stops the job.
+    """
+    from_deleted_at = _parse_deleted_at(from_deleted_at)
+    to_deleted_at = _parse_deleted_at(to_deleted_at)
+    root = FileSystemNode.objects.filter(owner_id=owner_id, tree_path=tree_path)
+    pending = FileSystemNode.objects.filter(
+        owner_id=owner_id, tree_path__startswith=tree_path, deleted_at=from_deleted_at
+    ).exclude(tree_path=tree_path)
+    while True:
+        with transaction.atomic():
+            root_deleted_at = root.select_for_update().values_list("deleted_at", flat=True)
+            if list(root_deleted_at) != [to_deleted_at]:
+                return
+            batch_ids = list(
+                pending.values_list("pk", flat=True)[: settings.FILES_SUBTREE_BATCH_SIZE]
+            )
+            if not batch_ids:
+                return
+            FileSystemNode.objects.filter(pk__in=batch_ids, deleted_at=from_deleted_at).update(
+                deleted_at=to_deleted_at, updated_at=timezone.now()
+            )
+
+
+def update_subtree_deleted_at(node, to_deleted_at):
+    """
+    Soft-deletes (`to_deleted_at` set) or restores (`to_deleted_at` None) `node` and every
+    descendant that shares its current state. Restores only bring back the nodes that were
+    deleted together with `node`, i.e. those stamped with the same deleted_at.
+
+    Subtrees up to FILES_SUBTREE_SYNC_LIMIT nodes are updated with a single UPDATE. Larger
+    ones have `node` itself updated right away (which hides or reveals the whole subtree for
+    path lookups) and the descendants updated in batches by a background job.
+    """
+    update_subtrees_deleted_at([node], to_deleted_at)
+
+
+def update_subtrees_deleted_at(nodes, to_deleted_at):
+    """
+    update_subtree_deleted_at() for several disjoint subtrees of one owner whose roots share
+    the same deleted_at, using one UPDATE for all of them.
+    """
+    if not nodes:
+        return
+    owner_id, from_deleted_at = nodes[0].owner_id, nodes[0].deleted_at
+    in_subtrees = Q()
+    for node in nodes:
+        in_subtrees |= Q(tree_path__startswith=node.tree_path)
+    subtrees = FileSystemNode.objects.filter(
+        in_subtrees, owner_id=owner_id, deleted_at=from_deleted_at
+    )
+    now = timezone.now()
+
+    if (
+        subtrees[: settings.FILES_SUBTREE_SYNC_LIMIT + 1].count()
+        <= settings.FILES_SUBTREE_SYNC_LIMIT
+    ):
+        subtrees.update(deleted_at=to_deleted_at, updated_at=now)
+    else:
+        FileSystemNode.objects.filter(pk__in=[node.pk for node in nodes]).update(
+            deleted_at=to_deleted_at, updated_at=now
+        )
+        for node in nodes:
+            enqueue(
+                update_subtree_deleted_at_in_batches,
+                owner_id,
+                node.tree_path,
+                from_deleted_at.isoformat() if from_deleted_at else None,
+                to_deleted_at.isoformat() if to_deleted_at else None,
+            )
+
+    for node in nodes:
+        node.deleted_at = to_deleted_at
+        node.updated_at = now
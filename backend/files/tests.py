@@ -1,3 +1,931 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from hashlib import md5
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import pypdfium2
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import QuerySet
+from django.db.models.functions import MD5
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from files import thumbnails
+from files.aggregates import reconcile_aggregates
+from files.archives import ARCHIVE_CHUNK_SIZE
+from files.crypto import CorruptFileError, get_user_data_key
+from files.models import Blob, FileSystemNode, StorageQuota, UploadSession, UserDataKey
+from files.pagination import DirectoryListingPagination
+from files.quotas import recount
+from files.storage import (
+    blob_file_path,
+    open_node_contents,
+    store_staged_file,
+    store_uploaded_file,
+)
+from files.trash import purge_expired_trash
+from files.uploads import session_file_path
+from jobs.queue import run_due_jobs
+
+User = get_user_model()
+
+
+def make_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+class FilesTestCase(APITestCase):
+    """
+    Authenticated as `user`, with throwaway storage directories and jobs run inline.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.storage_dir = tempfile.mkdtemp()
+        cls.settings_override = override_settings(
+            SECURE_USER_FILES_STORAGE_BASE=cls.storage_dir,
+            PUBLIC_PAGES_STORAGE_BASE=cls.storage_dir,
+            FILES_THUMBNAIL_CACHE_DIR=None,
+            JOBS_MODE="eager",
+        )
+        cls.settings_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.settings_override.disable()
+        shutil.rmtree(cls.storage_dir, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="alice", email="a@x.com", password="pw")
+        self.client.force_authenticate(self.user)
+
+    def make_dir(self, name, parent=None, owner=None):
+        return FileSystemNode.objects.create(
+            owner=owner or self.user, parent=parent, name=name, is_directory=True
+        )
+
+    def upload(self, name, contents, parent=None):
+        data = {"file": SimpleUploadedFile(name, contents, content_type="text/plain")}
+        if parent is not None:
+            data["parent"] = str(parent.pk)
+        return self.client.post("/api/files/upload/", data, format="multipart")
+
+
+class DirectoryListingPaginationTests(FilesTestCase):
+    def test_pages_through_children(self):
+        for index in range(5):
+            self.make_dir(f"dir-{index}")
+        names, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            body = self.client.get("/api/files/", params).json()
+            names += [item["name"] for item in body["results"]]
+            cursor = body["next"]
+            if cursor is None:
+                break
+        self.assertEqual(names, [f"dir-{index}" for index in range(5)])
+
+    def test_tampered_cursor_is_not_found(self):
+        for values in (
+            [True, "name", "not-a-uuid"],
+            ["maybe", "name", "2b7c5e5e-8c5a-4b8e-9a7e-6f0d2c1e3a4b"],
+            [True, "name", None],
+            [True, "name"],
+        ):
+            with self.subTest(values=values):
+                response = self.client.get(
+                    "/api/files/", {"limit": 2, "cursor": make_cursor(values)}
+                )
+                self.assertEqual(response.status_code, 404)
+
+        response = self.client.get("/api/files/", {"limit": 2, "cursor": "%%%"})
+        self.assertEqual(response.status_code, 404)
+
+
+class UploadSessionTests(FilesTestCase):
+    def start_upload(self, name, contents):
+        session = self.client.post(
+            "/api/files/uploads/", {"name": name, "size_bytes": len(contents)}, format="json"
+        ).json()
+        response = self.client.put(
+            f"/api/files/uploads/{session['id']}/",
+            data=contents,
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=f"bytes 0-{len(contents) - 1}/{len(contents)}",
+        )
+        self.assertEqual(response.status_code, 200)
+        return session["id"]
+
+    def put_chunk(self, session_id, body, content_range, **extra):
+        return self.client.put(
+            f"/api/files/uploads/{session_id}/",
+            data=body,
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=content_range,
+            **extra,
+        )
+
+    def test_rejects_bodies_shorter_than_their_range(self):
+        session = self.client.post(
+            "/api/files/uploads/", {"name": "notes.txt", "size_bytes": 10}, format="json"
+        ).json()
+        for body in (b"", b"abc"):
+            with self.subTest(body=body):
+                response = self.put_chunk(session["id"], body, "bytes 0-9/10")
+                self.assertEqual(response.status_code, 400)
+
+        response = self.put_chunk(session["id"], b"abc", "bytes 0-2/10")
+        self.assertEqual(response.json()["received_bytes"], 3)
+        response = self.put_chunk(session["id"], b"defghij", "bytes 3-9/10")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["received_bytes"], 10)
+
+    def test_commit_can_be_retried_after_a_name_conflict(self):
+        session_id = self.start_upload("report.txt", b"quarterly numbers\n")
+        staged_path = session_file_path(UploadSession.objects.get(pk=session_id))
+
+        def store_then_conflict(owner_id, *args, **kwargs):
+            # Another request creates the same name between the check and the save.
+            blob = store_staged_file(owner_id, *args, **kwargs)
+            FileSystemNode.objects.create(owner_id=owner_id, name="report.txt", size_bytes=1)
+            return blob
+
+        with mock.patch("files.views.store_staged_file", store_then_conflict):
+            response = self.client.post(f"/api/files/uploads/{session_id}/commit/")
+        self.assertEqual(response.status_code, 409)
+        self.assertTrue(os.path.exists(staged_path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f"/api/files/uploads/{session_id}/commit/")
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(os.path.exists(staged_path))
+
+        download = self.client.get(f"/api/files/{response.json()['id']}/download/")
+        self.assertEqual(b"".join(download.streaming_content), b"quarterly numbers\n")
+
+
+class UploadFileTests(FilesTestCase):
+    def test_concurrent_identical_uploads_share_a_blob(self):
+        self.assertEqual(self.upload("first.txt", b"same bytes\n").status_code, 201)
+
+        # The second upload doesn't see the blob at first, as if the first upload committed
+        # between its lookup and its INSERT.
+        real_get, missed = QuerySet.get, []
+
+        def get_missing_once(queryset, *args, **kwargs):
+            if queryset.model is Blob and not missed:
+                missed.append(True)
+                raise Blob.DoesNotExist
+            return real_get(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, "get", get_missing_once):
+            response = self.upload("second.txt", b"same bytes\n")
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(missed)
+        blob = Blob.objects.get(owner=self.user)
+        self.assertEqual(blob.ref_count, 2)
+
+    def test_name_taken_after_the_check_is_a_conflict(self):
+        real_store = store_uploaded_file
+
+        def store_then_conflict(owner_id, uploaded_file):
+            blob = real_store(owner_id, uploaded_file)
+            FileSystemNode.objects.create(owner_id=owner_id, name="taken.txt", size_bytes=1)
+            return blob
+
+        with mock.patch("files.views.store_uploaded_file", store_then_conflict):
+            response = self.upload("taken.txt", b"contents\n")
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Blob.objects.exists())
+
+
+@override_settings(FILES_DEFAULT_QUOTA_BYTES=100_000)
+class QuotaTests(FilesTestCase):
+    def used_bytes(self):
+        return StorageQuota.objects.get(user=self.user).used_bytes
+
+    def test_rejects_declared_sizes_over_the_quota_before_reading_them(self):
+        with mock.patch("files.views.HashingUploadHandler") as handler:
+            response = self.upload("big.bin", b"x" * 200_000)
+        self.assertEqual(response.status_code, 413)
+        handler.assert_not_called()
+        self.assertFalse(Blob.objects.exists())
+
+        response = self.client.post(
+            "/api/files/uploads/", {"name": "big.bin", "size_bytes": 100_001}, format="json"
+        )
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_uploads_count_against_the_quota(self):
+        self.assertEqual(self.upload("small.bin", b"x" * 30_000).status_code, 201)
+        self.assertEqual(self.used_bytes(), 30_000)
+
+        # Within the multipart allowance, so only the reservation catches it.
+        response = self.upload("medium.bin", b"x" * 80_000)
+        self.assertEqual(response.status_code, 507)
+        self.assertEqual(self.used_bytes(), 30_000)
+        self.assertEqual(self.upload("fits.bin", b"x" * 70_000).status_code, 201)
+        self.assertEqual(self.used_bytes(), 100_000)
+
+    def test_recount_rebuilds_the_counters(self):
+        self.upload("small.bin", b"x" * 30_000)
+        StorageQuota.objects.filter(user=self.user).update(used_bytes=12345)
+        recount([self.user.pk])
+        self.assertEqual(self.used_bytes(), 30_000)
+
+
+class CreateNodeTests(FilesTestCase):
+    def mkdir(self, name, parent):
+        return self.client.post(
+            "/api/files/",
+            {"name": name, "is_directory": True, "parent": str(parent.pk)},
+            format="json",
+        )
+
+    def test_creates_inside_own_directory(self):
+        parent = self.make_dir("docs")
+        self.assertEqual(self.mkdir("notes", parent).status_code, 201)
+        parent.refresh_from_db()
+        self.assertEqual(parent.descendant_count, 1)
+
+    def test_rejects_parents_that_cannot_hold_new_nodes(self):
+        other = User.objects.create_user(username="bob", email="b@x.com", password="pw")
+        foreign = self.make_dir("theirs", owner=other)
+        trashed = self.make_dir("trashed")
+        FileSystemNode.objects.filter(pk=trashed.pk).update(deleted_at=timezone.now())
+        a_file = FileSystemNode.objects.create(
+            owner=self.user, name="a.txt", size_bytes=1, mime_type="text/plain"
+        )
+
+        for parent in (foreign, trashed, a_file):
+            with self.subTest(parent=parent.name):
+                response = self.mkdir("sneaky", parent)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("parent", response.json())
+
+        foreign.refresh_from_db()
+        self.assertEqual((foreign.descendant_count, foreign.total_size_bytes), (0, 0))
+
+
+class BatchTransferTests(FilesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.destination = self.make_dir("dst")
+
+    def make_file(self, name, parent=None, size=10):
+        blob = Blob.objects.create(
+            owner=self.user, sha256=f"{name}-{parent and parent.pk}", size_bytes=size
+        )
+        return FileSystemNode.objects.create(
+            owner=self.user,
+            parent=parent,
+            name=name,
+            size_bytes=size,
+            mime_type="text/plain",
+            blob=blob,
+        )
+
+    def finish_setup(self):
+        reconcile_aggregates(FileSystemNode, [self.user.pk])
+        recount([self.user.pk])
+
+    def assert_aggregates_consistent(self):
+        def snapshot():
+            return dict(
+                FileSystemNode.objects.filter(owner=self.user, is_directory=True).values_list(
+                    "pk", "total_size_bytes"
+                )
+            )
+
+        maintained = snapshot()
+        reconcile_aggregates(FileSystemNode, [self.user.pk])
+        self.assertEqual(maintained, snapshot())
+
+    def batch(self, action, nodes):
+        response = self.client.post(
+            f"/api/files/batch-{action}/",
+            {"ids": [str(node.pk) for node in nodes], "parent": str(self.destination.pk)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        return [result["status"] for result in response.json()["results"]]
+
+    def count_queries(self, action, file_count):
+        source = self.make_dir(f"{action}-{file_count}")
+        files = [
+            self.make_file(f"{action}-{file_count}-{index}.txt", source)
+            for index in range(file_count)
+        ]
+        self.finish_setup()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.batch(action, files), [200] * file_count)
+        return len(queries)
+
+    def test_move_query_count_does_not_grow_with_the_batch(self):
+        self.assertEqual(self.count_queries("move", 2), self.count_queries("move", 20))
+
+    def test_copy_query_count_does_not_grow_with_the_batch(self):
+        self.assertEqual(self.count_queries("copy", 2), self.count_queries("copy", 20))
+
+    def test_moves_nested_items_and_keeps_aggregates(self):
+        outer = self.make_dir("outer")
+        inner = self.make_dir("inner", outer)
+        deep = self.make_file("deep.txt", inner, size=7)
+        self.make_file("stays.txt", outer, size=5)
+        loose = self.make_file("loose.txt", size=3)
+        self.finish_setup()
+
+        self.assertEqual(self.batch("move", [outer, inner, loose, inner]), [200] * 4)
+
+        paths = set(
+            FileSystemNode.objects.filter(owner=self.user).values_list("logical_path", flat=True)
+        )
+        self.assertEqual(
+            paths,
+            {
+                "/dst",
+                "/dst/outer",
+                "/dst/outer/stays.txt",
+                "/dst/inner",
+                "/dst/inner/deep.txt",
+                "/dst/loose.txt",
+            },
+        )
+        deep.refresh_from_db()
+        self.assertEqual(
+            deep.tree_path, f"/{self.destination.pk.hex}/{inner.pk.hex}/{deep.pk.hex}/"
+        )
+        self.assert_aggregates_consistent()
+        self.destination.refresh_from_db()
+        self.assertEqual(self.destination.total_size_bytes, 15)
+
+    def test_reports_conflicts_per_item(self):
+        first = self.make_dir("first")
+        second = self.make_dir("second")
+        clash_a = self.make_file("same.txt", first)
+        clash_b = self.make_file("same.txt", second)
+        self.make_file("taken.txt", self.destination)
+        taken = self.make_file("taken.txt", first)
+        self.finish_setup()
+
+        self.assertEqual(self.batch("move", [clash_a, clash_b, taken]), [200, 409, 409])
+        self.assertEqual(self.batch("copy", [self.destination]), [400])
+        self.assert_aggregates_consistent()
+
+    @override_settings(FILES_DEFAULT_QUOTA_BYTES=130)
+    def test_copies_fill_the_quota_in_request_order(self):
+        source = self.make_dir("src")
+        big = self.make_file("big.txt", source, size=40)
+        small = self.make_file("small.txt", source, size=5)
+        bigger = self.make_file("bigger.txt", source, size=30)
+        self.finish_setup()
+
+        self.assertEqual(self.batch("copy", [big, bigger, small]), [200, 507, 200])
+        self.assertEqual(StorageQuota.objects.get(user=self.user).used_bytes, 120)
+        self.assert_aggregates_consistent()
+
+
+def response_body(response):
+    if response.streaming:
+        return b"".join(response.streaming_content)
+    return response.content
+
+
+class ThumbnailTests(FilesTestCase):
+    def upload_image(self, name="photo.png", size=(300, 150)):
+        buffer = io.BytesIO()
+        Image.new("RGB", size, "red").save(buffer, format="PNG")
+        response = self.upload(name, buffer.getvalue())
+        self.assertEqual(response.status_code, 201)
+        return FileSystemNode.objects.get(pk=response.json()["id"])
+
+    def upload_pdf(self, name="slides.pdf"):
+        document = pypdfium2.PdfDocument.new()
+        document.new_page(200, 100)
+        buffer = io.BytesIO()
+        document.save(buffer)
+        response = self.upload(name, buffer.getvalue())
+        self.assertEqual(response.status_code, 201)
+        return FileSystemNode.objects.get(pk=response.json()["id"])
+
+    def get_thumbnail(self, node, **headers):
+        return self.client.get(f"/api/files/{node.pk}/thumbnail/", {"size": 128}, **headers)
+
+    def test_renders_images_and_pdfs(self):
+        for node in (self.upload_image(), self.upload_pdf()):
+            with self.subTest(mime_type=node.mime_type):
+                response = self.get_thumbnail(node)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response["Content-Type"], "image/jpeg")
+                image = Image.open(io.BytesIO(response_body(response)))
+                self.assertEqual((image.format, image.size), ("JPEG", (128, 64)))
+
+                cached = self.get_thumbnail(node, HTTP_IF_NONE_MATCH=response["ETag"])
+                self.assertEqual(cached.status_code, 304)
+
+    def test_cached_thumbnails_are_read_as_they_were_written(self):
+        node = self.upload_image()
+        plain = response_body(self.get_thumbnail(node))
+        plain_path = thumbnails.thumbnail_path(node, 128)
+
+        master_key = base64.urlsafe_b64encode(b"k" * 32).decode()
+        with override_settings(SECURE_FILES_MASTER_KEY=master_key):
+            self.assertEqual(response_body(self.get_thumbnail(node)), plain)
+            encrypted_path = thumbnails.thumbnail_path(node, 128)
+            # An entry written before encryption was turned on still reads as plaintext.
+            with thumbnails.open_thumbnail(node, plain_path) as fh:
+                self.assertEqual(fh.read(), plain)
+        self.assertNotEqual(plain_path, encrypted_path)
+        with open(encrypted_path, "rb") as fh:
+            self.assertNotEqual(fh.read(), plain)
+
+        thumbnails.discard_thumbnails(self.user.pk, thumbnails.thumbnail_key(node))
+        self.assertFalse(os.path.exists(plain_path) or os.path.exists(encrypted_path))
+
+
+class DownloadTests(FilesTestCase):
+    contents = b"0123456789"
+
+    def setUp(self):
+        super().setUp()
+        response = self.upload("digits.txt", self.contents)
+        self.node = FileSystemNode.objects.get(pk=response.json()["id"])
+        self.url = f"/api/files/{self.node.pk}/download/"
+
+    def test_serves_the_whole_file_with_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response_body(response), self.contents)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["ETag"], f'"{self.node.blob.sha256}"')
+        self.assertIn("Last-Modified", response)
+
+    def test_serves_byte_ranges(self):
+        for header, content_range, body in (
+            ("bytes=2-5", "bytes 2-5/10", b"2345"),
+            ("bytes=7-", "bytes 7-9/10", b"789"),
+            ("bytes=-3", "bytes 7-9/10", b"789"),
+            ("bytes=8-100", "bytes 8-9/10", b"89"),
+        ):
+            with self.subTest(range=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response["Content-Range"], content_range)
+                self.assertEqual(response["Content-Length"], str(len(body)))
+                self.assertEqual(response_body(response), body)
+
+    def test_unsatisfiable_ranges(self):
+        for header in ("bytes=10-", "bytes=5-2", "bytes=-0"):
+            with self.subTest(range=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response["Content-Range"], "bytes */10")
+
+    def test_ignores_ranges_it_does_not_serve(self):
+        for headers in (
+            {"HTTP_RANGE": "bytes=0-1,4-5"},
+            {"HTTP_RANGE": "lines=1-2"},
+            {"HTTP_RANGE": "bytes=2-5", "HTTP_IF_RANGE": '"stale"'},
+        ):
+            with self.subTest(headers=headers):
+                response = self.client.get(self.url, **headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response_body(response), self.contents)
+
+    def test_conditional_get(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_hands_plaintext_files_to_the_web_server(self):
+        relative_path = f"{self.user.pk}/blobs/{self.node.blob.sha256[:2]}/{self.node.blob.sha256}"
+        with override_settings(FILES_SENDFILE_BACKEND="x-accel-redirect"):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-files/{relative_path}")
+        self.assertEqual(response.content, b"")
+
+        with override_settings(FILES_SENDFILE_BACKEND="x-sendfile"):
+            response = self.client.get(self.url)
+        self.assertEqual(
+            response["X-Sendfile"], os.path.abspath(os.path.join(self.storage_dir, relative_path))
+        )
+
+    def test_directories_cannot_be_downloaded(self):
+        directory = self.make_dir("docs")
+        response = self.client.get(f"/api/files/{directory.pk}/download/")
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    SECURE_FILES_MASTER_KEY=base64.urlsafe_b64encode(b"k" * 32).decode(),
+    SECURE_FILES_ENCRYPTION_CHUNK_SIZE=4,
+)
+class EncryptionTests(FilesTestCase):
+    contents = b"0123456789"
+
+    def setUp(self):
+        super().setUp()
+        response = self.upload("digits.txt", self.contents)
+        self.node = FileSystemNode.objects.select_related("blob").get(pk=response.json()["id"])
+        self.path = blob_file_path(self.user.pk, self.node.blob.sha256)
+
+    def write_blob(self, data):
+        with open(self.path, "wb") as fh:
+            fh.write(data)
+
+    def test_round_trips_through_the_encrypted_blob(self):
+        self.assertTrue(self.node.blob.is_encrypted)
+        with open(self.path, "rb") as fh:
+            self.assertNotIn(b"345", fh.read())
+
+        url = f"/api/files/{self.node.pk}/download/"
+        self.assertEqual(response_body(self.client.get(url)), self.contents)
+        # The range spans three 4-byte chunks.
+        response = self.client.get(url, HTTP_RANGE="bytes=3-8")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response_body(response), b"345678")
+        # Encrypted contents are never handed to the web server as they are on disk.
+        with override_settings(FILES_SENDFILE_BACKEND="x-accel-redirect"):
+            response = self.client.get(url)
+        self.assertNotIn("X-Accel-Redirect", response)
+        self.assertEqual(response_body(response), self.contents)
+
+    def test_detects_tampering(self):
+        with open(self.path, "rb") as fh:
+            ciphertext = fh.read()
+        self.addCleanup(self.write_blob, ciphertext)
+        # A 28-byte header, then chunks of nonce (12) + 4 bytes of ciphertext + tag (16).
+        header, first, second, last = (
+            ciphertext[:28],
+            ciphertext[28:60],
+            ciphertext[60:92],
+            ciphertext[92:],
+        )
+        flipped = bytearray(second)
+        flipped[14] ^= 1
+        tampered = {
+            "flipped byte": header + first + bytes(flipped) + last,
+            "swapped chunks": header + second + first + last,
+            "truncated": header + first + second,
+            "not encrypted": self.contents,
+        }
+        for name, data in tampered.items():
+            with self.subTest(name):
+                self.write_blob(data)
+                with self.assertRaises(CorruptFileError):
+                    with open_node_contents(self.node) as fh:
+                        fh.read()
+
+    def test_data_keys_are_wrapped_by_the_master_key(self):
+        record = UserDataKey.objects.get(user=self.user)
+        self.assertEqual(len(get_user_data_key(self.user.pk)), 32)
+        self.assertNotIn(get_user_data_key(self.user.pk), bytes(record.wrapped_key))
+
+
+class ArchiveTests(FilesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.docs = self.make_dir("docs")
+        self.reports = self.make_dir("reports", self.docs)
+        self.make_dir("empty", self.docs)
+        image = io.BytesIO()
+        Image.new("RGB", (20, 10), "red").save(image, format="PNG")
+        self.image = image.getvalue()
+        self.text = b"quarterly numbers\n" * 1000
+        self.upload("chart.png", self.image, self.reports)
+        self.upload("summary.txt", self.text, self.reports)
+        trashed = self.upload("old.txt", b"gone", self.docs).json()["id"]
+        FileSystemNode.objects.filter(pk=trashed).update(deleted_at=timezone.now())
+
+    def test_streams_the_live_subtree(self):
+        response = self.client.get(f"/api/files/{self.docs.pk}/archive/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/zip")
+        self.assertIn('filename="docs.zip"', response["Content-Disposition"])
+
+        with zipfile.ZipFile(io.BytesIO(response_body(response))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(
+                archive.namelist(),
+                [
+                    "docs/",
+                    "docs/empty/",
+                    "docs/reports/",
+                    "docs/reports/chart.png",
+                    "docs/reports/summary.txt",
+                ],
+            )
+            self.assertEqual(archive.read("docs/reports/chart.png"), self.image)
+            self.assertEqual(archive.read("docs/reports/summary.txt"), self.text)
+            # Already-compressed content is stored as is.
+            self.assertEqual(archive.getinfo("docs/reports/chart.png").compress_type, 0)
+            self.assertEqual(
+                archive.getinfo("docs/reports/summary.txt").compress_type, zipfile.ZIP_DEFLATED
+            )
+
+    def test_sends_bytes_before_reading_the_files(self):
+        reads = []
+
+        def open_contents(node):
+            contents = open_node_contents(node)
+            read = contents.read
+            contents.read = lambda size=-1: reads.append(size) or read(size)
+            return contents
+
+        with mock.patch("files.archives.open_node_contents", side_effect=open_contents):
+            response = self.client.get(f"/api/files/{self.reports.pk}/archive/")
+            chunks = iter(response.streaming_content)
+            self.assertTrue(next(chunks).startswith(b"PK"))
+            self.assertEqual(reads, [])
+
+            b"".join(chunks)
+        # Files are copied in bounded pieces, never read whole.
+        self.assertTrue(reads)
+        self.assertTrue(all(0 < size <= ARCHIVE_CHUNK_SIZE for size in reads))
+
+    def test_files_cannot_be_archived(self):
+        node = FileSystemNode.objects.get(name="summary.txt")
+        self.assertEqual(self.client.get(f"/api/files/{node.pk}/archive/").status_code, 400)
+
+
+def make_text_pdf(text):
+    """
+    A one-page PDF showing `text` in Helvetica, small enough to write out by hand.
+    """
+    stream = f"BT /F1 12 Tf 10 50 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 200 100] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+    ]
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return bytes(pdf)
+
+
+class SearchTests(FilesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.docs = self.make_dir("Reports")
+        self.archive = self.make_dir("archive", self.docs)
+        # Text is extracted by the post-upload job, which starts once the upload commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload("report-2024.txt", b"Revenue grew.", self.docs)
+            self.upload("Annual-REPORT.txt", b"x" * 5000, self.archive)
+            self.upload("invoice.pdf", make_text_pdf("Quarterly invoice for cloud storage"))
+            self.upload("notes.txt", b"Remember the quarterly review.")
+        trashed = self.upload("old-report.txt", b"gone").json()["id"]
+        FileSystemNode.objects.filter(pk=trashed).update(deleted_at=timezone.now())
+        other = User.objects.create_user(username="bob", email="b@x.com", password="pw")
+        self.make_dir("bob-report", owner=other)
+
+    def search(self, **params):
+        response = self.client.get("/api/files/search/", params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(node["name"] for node in response.json()["results"])
+
+    def test_matches_names(self):
+        self.assertEqual(
+            self.search(q="report"), ["Annual-REPORT.txt", "Reports", "report-2024.txt"]
+        )
+        self.assertEqual(self.search(q="REP", mode="prefix"), ["Reports", "report-2024.txt"])
+        self.assertEqual(self.search(q="missing"), [])
+
+    def test_filters(self):
+        self.assertEqual(
+            self.search(q="report", type="file"), ["Annual-REPORT.txt", "report-2024.txt"]
+        )
+        self.assertEqual(self.search(q="report", type="directory"), ["Reports"])
+        self.assertEqual(self.search(q="report", min_size=1000), ["Annual-REPORT.txt"])
+        self.assertEqual(self.search(q="report", max_size=1000), ["report-2024.txt"])
+        self.assertEqual(self.search(q="o", mime_type="application/pdf"), ["invoice.pdf"])
+        self.assertEqual(
+            self.search(q="report", within=str(self.docs.pk)),
+            ["Annual-REPORT.txt", "report-2024.txt"],
+        )
+        self.assertEqual(
+            self.search(q="report", modified_after="2000-01-01", modified_before="2000-01-02"), []
+        )
+
+    def test_matches_extracted_text(self):
+        self.assertEqual(self.search(q="quarterly"), [])
+        self.assertEqual(self.search(q="quarterly", content="1"), ["invoice.pdf", "notes.txt"])
+        self.assertEqual(self.search(q="revenue", content="1"), ["report-2024.txt"])
+
+    def test_pages_through_results(self):
+        names, cursor = [], None
+        while True:
+            params = {"q": "r", "limit": 2, **({"cursor": cursor} if cursor else {})}
+            body = self.client.get("/api/files/search/", params).json()
+            names += [node["name"] for node in body["results"]]
+            cursor = body["next"]
+            if cursor is None:
+                break
+        self.assertEqual(len(names), len(set(names)))
+        self.assertEqual(sorted(names), self.search(q="r"))
+
+    def test_rejects_invalid_parameters(self):
+        for params in (
+            {},
+            {"q": "report", "mode": "regex"},
+            {"q": "report", "min_size": "big"},
+            {"q": "report", "modified_after": "yesterday"},
+            {"q": "report", "within": "not-a-uuid"},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get("/api/files/search/", params)
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(FILES_SUBTREE_SYNC_LIMIT=1)
+class LargeSubtreeDeleteTests(FilesTestCase):
+    """
+    Subtrees over FILES_SUBTREE_SYNC_LIMIT nodes have their root deleted right away and the
+    descendants stamped by a background job, which these tests run by hand.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.folder = self.make_dir("folder")
+        self.inner = self.make_dir("inner", self.folder)
+        for name in ("a.txt", "b.txt"):
+            self.assertEqual(self.upload(name, b"four", self.inner).status_code, 201)
+        self.file = FileSystemNode.objects.get(name="a.txt")
+        reconcile_aggregates(FileSystemNode, [self.user.pk])
+        run_due_jobs()
+
+    def delete_folder(self):
+        response = self.client.delete(f"/api/files/{self.folder.pk}/")
+        self.assertEqual(response.status_code, 204)
+
+    def used_bytes(self):
+        return StorageQuota.objects.get(user=self.user).used_bytes
+
+    def test_restore_before_the_job_runs_keeps_the_subtree(self):
+        self.delete_folder()
+        response = self.client.post(f"/api/files/{self.folder.pk}/restore/")
+        self.assertEqual(response.status_code, 200)
+        run_due_jobs()
+
+        self.assertFalse(FileSystemNode.objects.filter(deleted_at__isnull=False).exists())
+        self.folder.refresh_from_db()
+        self.assertEqual((self.folder.total_size_bytes, self.folder.descendant_count), (8, 3))
+        self.assertEqual(self.used_bytes(), 8)
+
+    def test_pending_descendants_cannot_be_moved_or_copied(self):
+        self.delete_folder()
+        target = self.make_dir("target")
+        for action in ("move", "copy"):
+            with self.subTest(action=action):
+                response = self.client.post(
+                    f"/api/files/{self.file.pk}/{action}/",
+                    {"parent": str(target.pk)},
+                    format="json",
+                )
+                self.assertEqual(response.status_code, 404)
+                response = self.client.post(
+                    f"/api/files/{target.pk}/{action}/",
+                    {"parent": str(self.inner.pk)},
+                    format="json",
+                )
+                self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.used_bytes(), 0)
+
+        run_due_jobs()
+        self.assertEqual(FileSystemNode.objects.filter(deleted_at__isnull=True).get().pk, target.pk)
+        self.assertEqual(self.used_bytes(), 0)
+
+
+class TrashPurgeTests(FilesTestCase):
+    def trash(self, node, days_ago):
+        self.assertEqual(self.client.delete(f"/api/files/{node.pk}/").status_code, 204)
+        FileSystemNode.objects.filter(tree_path__startswith=node.tree_path).update(
+            deleted_at=timezone.now() - timedelta(days=days_ago)
+        )
+
+    def test_purges_expired_subtrees_owner_by_owner(self):
+        other = User.objects.create_user(username="bob", email="b@x.com", password="pw")
+        outer = self.make_dir("outer")
+        inner = self.make_dir("inner", outer)
+        self.assertEqual(self.upload("deep.txt", b"deep\n", inner).status_code, 201)
+        self.assertEqual(self.upload("shallow.txt", b"shallow\n", outer).status_code, 201)
+        recent = self.make_dir("recent")
+        theirs = self.make_dir("theirs", owner=other)
+        self.trash(outer, days_ago=60)
+        self.trash(recent, days_ago=1)
+        FileSystemNode.objects.filter(pk=theirs.pk).update(
+            deleted_at=timezone.now() - timedelta(days=60)
+        )
+
+        self.assertEqual(purge_expired_trash(batch_size=2, pause=0), 5)
+        self.assertEqual(list(FileSystemNode.objects.values_list("name", flat=True)), ["recent"])
+        self.assertFalse(Blob.objects.exists())
+
+    def test_removes_staging_files_of_uploads_into_purged_directories(self):
+        folder = self.make_dir("folder")
+        session = self.client.post(
+            "/api/files/uploads/",
+            {"name": "big.bin", "size_bytes": 10, "parent": str(folder.pk)},
+            format="json",
+        ).json()
+        staged_path = session_file_path(UploadSession.objects.get(pk=session["id"]))
+        self.assertTrue(os.path.exists(staged_path))
+        self.trash(folder, days_ago=60)
+
+        self.assertEqual(purge_expired_trash(pause=0), 1)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(staged_path))
+
+
+@skipUnless(connection.vendor == "postgresql", "Query plans are only checked on PostgreSQL.")
+class QueryPlanTests(FilesTestCase):
+    """
+    The hot lookups must be answerable from their indexes. Sequential scans are disabled for
+    the EXPLAIN, so a plan without the index means the query can't use it at all. Sibling-name
+    checks read only the indexed columns and must not touch the table.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.folder = self.make_dir("folder")
+        for index in range(20):
+            self.make_dir(f"dir-{index}", self.folder)
+
+    def assert_uses_index(self, queryset, index_name, index_only=False):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            if index_only:
+                # Bitmap scans always visit the heap; without them, an index that covers
+                # the query is planned as an index-only scan.
+                cursor.execute("SET LOCAL enable_bitmapscan = off")
+        plan = queryset.explain()
+        self.assertIn(f"Index Only Scan using {index_name}" if index_only else index_name, plan)
+        self.assertNotIn("Seq Scan", plan)
+
+    def test_sibling_name_lookup(self):
+        # As in operations.plan_destinations.
+        for parent, index_name in (
+            (self.folder, "files_node_unique_live_name"),
+            (None, "files_node_unique_live_root_name"),
+        ):
+            with self.subTest(index_name=index_name):
+                siblings = FileSystemNode.objects.filter(
+                    owner=self.user,
+                    parent=parent,
+                    name__in=["dir-1", "new"],
+                    deleted_at__isnull=True,
+                ).values_list("name", flat=True)
+                self.assert_uses_index(siblings, index_name, index_only=True)
+
+    def test_logical_path_lookup(self):
+        # As in views.get_nodes_along_path and operations.resolve_nodes.
+        prefixes = ["/folder", "/folder/dir-1"]
+        nodes = FileSystemNode.objects.alias(path_digest=MD5("logical_path")).filter(
+            owner=self.user,
+            deleted_at__isnull=True,
+            path_digest__in=[md5(prefix.encode()).hexdigest() for prefix in prefixes],
+        )
+        self.assert_uses_index(nodes, "files_node_owner_path_md5_idx")
+
+    def test_keyset_children_listing(self):
+        paginator = DirectoryListingPagination()
+        children = FileSystemNode.objects.filter(
+            owner=self.user, parent=self.folder, deleted_at__isnull=True
+        ).order_by(*paginator.ordering)
+        last = children[4]
+        page = children.filter(
+            paginator.get_seek_filter(
+                [getattr(last, field.lstrip("-")) for field in paginator.ordering]
+            )
+        )[:21]
+        self.assert_uses_index(page, "files_node_live_listing_idx")
@@ -0,0 +1,250 @@
+import fcntl
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import pypdfium2
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from jobs.queue import enqueue, job
+
+from .crypto import EncryptedFileReader, EncryptedFileWriter, encryption_enabled, get_user_data_key
+from .storage import open_node_contents
+
+logger = logging.getLogger(__name__)
+
+IMAGE_MIME_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+PDF_MIME_TYPE = "application/pdf"
+# Bump when rendering changes, so clients don't keep thumbnails cached under old ETags.
+RENDER_VERSION = 1
+
+
+class ThumbnailUnavailable(Exception):
+    pass
+
+
+def thumbnail_cache_dir():
+    return settings.FILES_THUMBNAIL_CACHE_DIR or os.path.join(
+        settings.SECURE_USER_FILES_STORAGE_BASE, ".thumbnails"
+    )
+
+
+def can_thumbnail(node):
+    if node.is_directory:
+        return False
+    return node.mime_type == PDF_MIME_TYPE or node.mime_type in IMAGE_MIME_TYPES
+
+
+def thumbnail_key(node):
+    """
+    Identifies the rendered contents: the blob hash, so identical files share thumbnails.
+    """
+    if node.blob_id is not None:
+        return node.blob.sha256
+    return f"node-{node.id.hex}"
+
+
+def thumbnail_etag(node, size):
+    return f'"{thumbnail_key(node)}-{size}-v{RENDER_VERSION}"'
+
+
+# Suffix of cached thumbnails written encrypted. Readers go by the file name rather than the
+# current setting, so turning encryption on or off never serves a file with the wrong reader.
+ENCRYPTED_SUFFIX = ".enc.jpg"
+
+
+def _cache_path(owner_id, key, size, encrypted):
+    """
+    <cache dir>/<owner id>/<first 2 chars of key>/<key>-<size>.jpg (or .enc.jpg)
+    """
+    filename = f"{key}-{size}{ENCRYPTED_SUFFIX if encrypted else '.jpg'}"
+    return os.path.join(thumbnail_cache_dir(), str(owner_id), key[:2], filename)
+
+
+def thumbnail_path(node, size):
+    return _cache_path(node.owner_id, thumbnail_key(node), size, encryption_enabled())
+
+
+def discard_thumbnails(owner_id, key):
+    """
+    Removes every cached size of a thumbnail, e.g. once its blob has been purged.
+    """
+    for size in settings.FILES_THUMBNAIL_SIZES:
+        for encrypted in (False, True):
+            try:
+                os.remove(_cache_path(owner_id, key, size, encrypted))
+            except FileNotFoundError:
+                pass
+
+
+def render_thumbnail(node, size):
+    """
+    Renders a JPEG no larger than size x size from the first frame (or PDF page).
+    """
+    if not can_thumbnail(node):
+        raise ThumbnailUnavailable("No preview available for this file.")
+    try:
+        with open_node_contents(node) as contents:
+            if node.mime_type == PDF_MIME_TYPE:
+                page = pypdfium2.PdfDocument(contents)[0]
+                image = page.render(scale=size / max(page.get_size())).to_pil()
+            else:
+                image = Image.open(contents)
+                # Lets the JPEG decoder downscale while decoding instead of afterwards.
+                image.draft("RGB", (size, size))
+                image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size))
+    except (OSError, ValueError, RuntimeError, Image.DecompressionBombError) as exc:
+        raise ThumbnailUnavailable(f"Could not render a preview: {exc}")
+
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=85, optimize=True)
+    return output.getvalue()
+
+
+def _write_atomically(path, data, owner_id):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    try:
+        if path.endswith(ENCRYPTED_SUFFIX):
+            os.close(fd)
+            with EncryptedFileWriter(tmp_path, get_user_data_key(owner_id)) as writer:
+                writer.write(data)
+        else:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+_render_locks = {}
+_render_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _render_lock(path):
+    """
+    Serializes renders of one thumbnail: a thread lock within the process and an flock()
+    on a sibling lock file across worker processes.
+    """
+    with _render_locks_guard:
+        lock, users = _render_locks.get(path, (None, 0))
+        lock = lock or threading.Lock()
+        _render_locks[path] = (lock, users + 1)
+    try:
+        with lock, open(f"{path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+    finally:
+        with _render_locks_guard:
+            lock, users = _render_locks[path]
+            if users == 1:
+                del _render_locks[path]
+            else:
+                _render_locks[path] = (lock, users - 1)
+
+
+def ensure_thumbnail(node, size):
+    """
+    Returns the path of the cached thumbnail, rendering it first if needed. Concurrent
+    callers asking for the same missing thumbnail wait for one render instead of each
+    doing their own. Cache hits refresh the file's mtime, which drives LRU eviction.
+    """
+    if not can_thumbnail(node):
+        raise ThumbnailUnavailable("No preview available for this file.")
+    path = thumbnail_path(node, size)
+    try:
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _render_lock(path):
+        if os.path.exists(path):
+            return path
+        _write_atomically(path, render_thumbnail(node, size), node.owner_id)
+
+    # At most one eviction pass per minute, however many thumbnails are rendered.
+    enqueue(evict_thumbnails, idempotency_key=f"thumbnails:evict:{int(time.time() // 60)}")
+    return path
+
+
+def open_thumbnail(node, path):
+    if path.endswith(ENCRYPTED_SUFFIX):
+        return EncryptedFileReader(path, get_user_data_key(node.owner_id))
+    return open(path, "rb")
+
+
+def thumbnail_size(node, path):
+    if path.endswith(ENCRYPTED_SUFFIX):
+        with open_thumbnail(node, path) as reader:
+            return reader.size
+    return os.path.getsize(path)
+
+
+def generate_thumbnails(node):
+    """
+    Post-upload stage: pre-renders FILES_THUMBNAIL_PREGENERATE_SIZES for previewable files.
+    """
+    if not can_thumbnail(node):
+        return
+    for size in settings.FILES_THUMBNAIL_PREGENERATE_SIZES:
+        try:
+            ensure_thumbnail(node, size)
+        except ThumbnailUnavailable as exc:
+            logger.info("No thumbnail for %s: %s", node.pk, exc)
+            return
+
+
+@job(name="files.evict_thumbnails")
+def evict_thumbnails():
+    """
+    Deletes least recently used thumbnails until the cache is back under 90% of
+    FILES_THUMBNAIL_CACHE_MAX_BYTES. Stale lock files are removed along the way.
+    """
+    entries, total = [], 0
+    stale_before = time.time() - 3600
+    for directory, _, filenames in os.walk(thumbnail_cache_dir()):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if filename.endswith(".jpg"):
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+            elif filename.endswith(".lock") and stat.st_mtime < stale_before:
+                os.remove(path)
+
+    limit = settings.FILES_THUMBNAIL_CACHE_MAX_BYTES
+    if total <= limit:
+        return 0
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= limit * 0.9:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,157 @@
+import os
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from .models import Blob, FileSystemNode, UploadSession
+from .pagination import KeysetPagination
+from .storage import blob_file_path, node_file_path
+from .thumbnails import discard_thumbnails
+from .uploads import forget_hasher, session_file_path
+
+
+class TrashPagination(KeysetPagination):
+    """
+    Trash listing: most recently deleted first. Backed by `files_node_trash_idx`.
+    """
+
+    ordering = ("-deleted_at", "id")
+
+
+def retention_period():
+    return timedelta(days=settings.FILES_TRASH_RETENTION_DAYS)
+
+
+def trash_roots(owner):
+    """
+    The user's deleted items as they were deleted: nodes whose parent is live (or that have
+    none), or was deleted separately. Their descendants were deleted along with them.
+    """
+    return FileSystemNode.objects.filter(owner=owner, deleted_at__isnull=False).filter(
+        Q(parent__isnull=True)
+        | Q(parent__deleted_at__isnull=True)
+        | ~Q(parent__deleted_at=F("deleted_at"))
+    )
+
+
+def _unlink(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _release_blobs(references):
+    """
+    Drops purged nodes' blob references and deletes blobs nobody references any more.
+    Files are unlinked before the row deletions commit, while the rows are still locked, so
+    a concurrent upload of the same content (which locks the row in acquire_blob) waits and
+    then writes a fresh copy.
+    """
+    by_count = defaultdict(list)
+    for blob_id, count in references.items():
+        by_count[count].append(blob_id)
+    for count, blob_ids in by_count.items():
+        Blob.objects.filter(pk__in=blob_ids).update(ref_count=F("ref_count") - count)
+
+    unreferenced = list(
+        Blob.objects.select_for_update()
+        .filter(pk__in=list(references), ref_count__lte=0)
+        .exclude(
+            pk__in=FileSystemNode.objects.filter(blob_id__in=list(references)).values("blob_id")
+        )
+    )
+    Blob.objects.filter(pk__in=[blob.pk for blob in unreferenced]).delete()
+    for blob in unreferenced:
+        _unlink(blob_file_path(blob.owner_id, blob.sha256))
+        discard_thumbnails(blob.owner_id, blob.sha256)
+    return len(unreferenced)
+
+
+def purge_batch(owner_id, cutoff, batch_size):
+    """
+    Hard-deletes up to `batch_size` of the owner's nodes soft-deleted before `cutoff`,
+    deepest first so no delete cascades into a subtree. Only that owner's expired rows
+    (found through `files_node_trash_idx`) are sorted. Returns the number of nodes removed.
+    """
+    with transaction.atomic():
+        batch = list(
+            FileSystemNode.objects.filter(owner_id=owner_id, deleted_at__lt=cutoff)
+            .order_by(Length("tree_path").desc())
+            .values("id", "owner_id", "is_directory", "blob_id")[:batch_size]
+        )
+        if not batch:
+            return 0
+
+        # Upload sessions into purged directories would go with them by cascade, leaving
+        # their staging files behind.
+        sessions = list(
+            UploadSession.objects.filter(
+                parent_id__in=[row["id"] for row in batch if row["is_directory"]]
+            ).only("id", "owner_id")
+        )
+        UploadSession.objects.filter(pk__in=[session.pk for session in sessions]).delete()
+        FileSystemNode.objects.filter(pk__in=[row["id"] for row in batch]).delete()
+        references = Counter(row["blob_id"] for row in batch if row["blob_id"] is not None)
+        if references:
+            _release_blobs(references)
+
+    for session in sessions:
+        forget_hasher(session)
+        _unlink(session_file_path(session))
+    # Files stored before blobs existed belong to exactly one node.
+    for row in batch:
+        if not row["is_directory"] and row["blob_id"] is None:
+            _unlink(node_file_path(row["owner_id"], row["id"]))
+            discard_thumbnails(row["owner_id"], f"node-{row['id'].hex}")
+    return len(batch)
+
+
+def purge_expired_trash(batch_size=None, pause=None, max_batches=None):
+    """
+    Permanently removes nodes that have been in the trash longer than the retention period,
+    owner by owner, in transactions of `batch_size` nodes with `pause` seconds between them
+    so the purge never holds locks for long or saturates the disk.
+    """
+    batch_size = batch_size or settings.FILES_PURGE_BATCH_SIZE
+    pause = settings.FILES_PURGE_PAUSE_SECONDS if pause is None else pause
+    cutoff = timezone.now() - retention_period()
+    owner_ids = list(
+        FileSystemNode.objects.filter(deleted_at__lt=cutoff)
+        .order_by("owner_id")
+        .values_list("owner_id", flat=True)
+        .distinct()
+    )
+
+    purged = batches = 0
+    for owner_id in owner_ids:
+        while max_batches is None or batches < max_batches:
+            removed = purge_batch(owner_id, cutoff, batch_size)
+            if not removed:
+                break
+            purged += removed
+            batches += 1
+            if removed == batch_size and pause:
+                time.sleep(pause)
+    return purged
+
+
+def purge_stale_upload_sessions():
+    """
+    Deletes resumable upload sessions untouched for FILES_UPLOAD_SESSION_MAX_AGE_DAYS,
+    along with their staging files.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.FILES_UPLOAD_SESSION_MAX_AGE_DAYS)
+    removed = 0
+    for session in UploadSession.objects.filter(updated_at__lt=cutoff).iterator():
+        forget_hasher(session)
+        _unlink(session_file_path(session))
+        session.delete()
+        removed += 1
+    return removed
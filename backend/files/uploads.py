@@ -0,0 +1,176 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db.models import F
+from django.utils import timezone
+
+from .crypto import EncryptedFileReader, EncryptedFileWriter, get_user_data_key
+from .models import UploadSession
+from .storage import staging_dir
+
+_CHUNK_SIZE = 64 * 1024
+_MAX_CACHED_HASHERS = 1024
+
+# Running SHA-256 state per upload session, keyed by session id and valid for one offset.
+# hashlib objects cannot be persisted, so a session resumed on another worker (or after a
+# restart) rebuilds its hasher once from the bytes already on disk.
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+def _take_hasher(session, offset):
+    with _hashers_lock:
+        cached = _hashers.pop(session.id, None)
+    if cached is not None and cached[0] == offset:
+        return cached[1]
+
+    hasher = hashlib.sha256()
+    with open_staged_file(session) as fh:
+        remaining = offset
+        while remaining:
+            data = fh.read(min(_CHUNK_SIZE, remaining))
+            if not data:
+                break
+            hasher.update(data)
+            remaining -= len(data)
+    return hasher
+
+
+def _keep_hasher(session, offset, hasher):
+    with _hashers_lock:
+        _hashers[session.id] = (offset, hasher)
+        while len(_hashers) > _MAX_CACHED_HASHERS:
+            _hashers.popitem(last=False)
+
+
+def forget_hasher(session):
+    with _hashers_lock:
+        _hashers.pop(session.id, None)
+
+
+def session_file_path(session):
+    """
+    Staging file a session's chunks are appended to until it is committed into a blob.
+    """
+    return os.path.join(staging_dir(session.owner_id), str(session.id))
+
+
+def create_staged_file(session):
+    path = session_file_path(session)
+    if session.is_encrypted:
+        EncryptedFileWriter(path, get_user_data_key(session.owner_id)).close()
+    else:
+        open(path, "wb").close()
+
+
+def open_staged_file(session):
+    """
+    Opens the plaintext of a session's staging file for reading.
+    """
+    path = session_file_path(session)
+    if session.is_encrypted:
+        return EncryptedFileReader(path, get_user_data_key(session.owner_id))
+    return open(path, "rb")
+
+
+class _PlainAppender:
+    def __init__(self, path, append_at):
+        self._fh = open(path, "r+b")
+        self._fh.truncate(append_at)
+        self._fh.seek(append_at)
+
+    def write(self, data):
+        self._fh.write(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._fh.close()
+
+
+def append_chunk(session, stream, start, length):
+    """
+    Appends up to `length` bytes from `stream` at `start` (which must be the session's
+    acknowledged offset) to its staging file, encrypting them on the way when the session
+    is encrypted, and updates the running hash. Bytes beyond the acknowledged offset left by
+    an interrupted request are discarded first. Progress is recorded even if the stream ends
+    early, so the client can resume from it. Returns the new acknowledged offset.
+    """
+    path = session_file_path(session)
+    hasher = _take_hasher(session, start)
+    written = 0
+
+    if session.is_encrypted:
+        appender = EncryptedFileWriter(path, get_user_data_key(session.owner_id), append_at=start)
+    else:
+        appender = _PlainAppender(path, start)
+
+    try:
+        with appender:
+            while written < length:
+                data = stream.read(min(_CHUNK_SIZE, length - written))
+                if not data:
+                    break
+                appender.write(data)
+                hasher.update(data)
+                written += len(data)
+    finally:
+        if written:
+            UploadSession.objects.filter(pk=session.pk).update(
+                received_bytes=F("received_bytes") + written, updated_at=timezone.now()
+            )
+            session.received_bytes = start + written
+
+    _keep_hasher(session, session.received_bytes, hasher)
+    return session.received_bytes
+
+
+def final_digest(session):
+    """
+    Returns the hex SHA-256 of a fully received session.
+    """
+    hasher = _take_hasher(session, session.received_bytes)
+    forget_hasher(session)
+    return hasher.hexdigest()
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    Computes the SHA-256 of multipart file fields while Django streams them in, so storing
+    the upload as a blob needs no second read. Install it first in `request.upload_handlers`;
+    it passes every chunk on to the default handlers, which still build the UploadedFile.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.digests = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.digests[self.field_name] = self.hasher.hexdigest()
+        return None
+
+
+def hashed_upload(request, field_name):
+    """
+    Returns request.FILES[field_name] (or None) with a `sha256` attribute when it was hashed
+    by a HashingUploadHandler installed before the body was parsed.
+    """
+    uploaded_file = request.FILES.get(field_name)
+    if uploaded_file is None:
+        return None
+    for handler in request.upload_handlers:
+        if isinstance(handler, HashingUploadHandler) and field_name in handler.digests:
+            uploaded_file.sha256 = handler.digests[field_name]
+    return uploaded_file
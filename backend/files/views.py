@@ -1,35 +1,104 @@
 import os
 import re
 import uuid
+from hashlib import md5
+
 import magic
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.core.files.storage import FileSystemStorage
-from django.db import IntegrityError
-from django.utils import timezone
+from django.db import IntegrityError, transaction
+from django.db.models.functions import MD5
 from django.http import Http404
+from django.utils import timezone
 from django.utils.text import get_valid_filename
-
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.exceptions import MethodNotAllowed
+from rest_framework.exceptions import MethodNotAllowed, PermissionDenied
+from rest_framework.exceptions import ValidationError as DRFValidationError
+from rest_framework.generics import get_object_or_404
 from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
-from .models import FileSystemNode
-from .serializers import FileSystemNodeSerializer
+from sharing.permissions import get_permission_resolver
+from sharing.serializers import SharedNodeSerializer
+
+from .aggregates import AncestorAggregateDeltas
+from .archives import archive_response
+from .crypto import encryption_enabled
+from .downloads import PassthroughRenderer, serve_file
+from .models import FileSystemNode, UploadSession
+from .operations import (
+    NAME_CONFLICT_DETAIL,
+    NameConflict,
+    NodeOperationError,
+    copy_node,
+    copy_nodes,
+    delete_nodes,
+    insert_node,
+    move_node,
+    move_nodes,
+    resolve_nodes,
+)
+from .pagination import DirectoryListingPagination
+from .quotas import (
+    MULTIPART_OVERHEAD_BYTES,
+    QuotaExceeded,
+    has_room_for,
+    release,
+    reserve,
+    subtree_size,
+)
+from .search import SearchPagination, search_nodes
+from .serializers import FileSystemNodeSerializer, TrashNodeSerializer, UploadSessionSerializer
+from .storage import (
+    node_sendfile_path,
+    open_node_contents,
+    store_staged_file,
+    store_uploaded_file,
+)
+from .tasks import enqueue_upload_processing, update_subtree_deleted_at
+from .thumbnails import (
+    ThumbnailUnavailable,
+    ensure_thumbnail,
+    open_thumbnail,
+    thumbnail_etag,
+    thumbnail_size,
+)
+from .trash import TrashPagination, retention_period, trash_roots
+from .uploads import (
+    HashingUploadHandler,
+    append_chunk,
+    create_staged_file,
+    final_digest,
+    forget_hasher,
+    hashed_upload,
+    open_staged_file,
+    session_file_path,
+)
 
 _NAME_RE = re.compile(r"^[\w.\- ]{1,255}$")
+_CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+# Detail actions other users may run on a node shared with them, with the access each needs
+# (see sharing.permissions). Every other action only reaches the user's own nodes.
+_SHARED_NODE_ACTIONS = {
+    "retrieve": "view",
+    "download": "view",
+    "archive": "view",
+    "children": "view",
+    "thumbnail": "view",
+    "rename": "edit",
+}
 
 
-def get_node_by_path(path: str, user):
+def _split_path(path):
     if not isinstance(path, str):
         raise Http404("Invalid path format.")
 
     normalized_path = path.strip("/")
     if not normalized_path:
-        return None
+        return []
 
     segments = [seg for seg in normalized_path.split("/") if seg]
 
@@ -37,31 +106,87 @@ def get_node_by_path(path: str, user):
         if not _NAME_RE.fullmatch(seg_name):
             raise Http404(f"Invalid path segment: '{seg_name}'")
 
-    current_parent_node = None
-    resolved_node = None
+    return segments
 
-    for i, name_segment in enumerate(segments):
-        try:
-            query_params = {
-                "owner": user,
-                "parent": current_parent_node,
-                "name": name_segment,
-                "deleted_at__isnull": True,
-            }
-            resolved_node = FileSystemNode.objects.get(**query_params)
-
-            if i < len(segments) - 1 and not resolved_node.is_directory:
-                raise Http404(f"Path component '{name_segment}' is a file, not a directory.")
-
-            current_parent_node = resolved_node
-        except FileSystemNode.DoesNotExist:
-            raise Http404(f"Path not found. Component '{name_segment}' in '{path}' does not exist.")
-        except FileSystemNode.MultipleObjectsReturned:
+
+def get_nodes_along_path(path: str, user):
+    """
+    Resolves `path` for `user` with a single lookup on the materialized logical_path and
+    returns the list of nodes from the top-level ancestor down to the target.
+    Returns an empty list for the root path.
+    """
+    segments = _split_path(path)
+    if not segments:
+        return []
+
+    prefixes = ["/" + "/".join(segments[: i + 1]) for i in range(len(segments))]
+    candidates = {}
+    for node in FileSystemNode.objects.alias(path_digest=MD5("logical_path")).filter(
+        owner=user,
+        deleted_at__isnull=True,
+        path_digest__in=[md5(prefix.encode()).hexdigest() for prefix in prefixes],
+    ):
+        candidates.setdefault(node.logical_path, []).append(node)
+
+    chain = []
+    for prefix, name_segment in zip(prefixes, segments):
+        if chain and not chain[-1].is_directory:
+            break
+        parent_id = chain[-1].id if chain else None
+        matches = [node for node in candidates.get(prefix, []) if node.parent_id == parent_id]
+        if not matches:
+            break
+        if len(matches) > 1:
             raise Http404(
                 f"Data integrity error: Multiple nodes found for '{name_segment}' in '{path}'."
             )
+        chain.append(matches[0])
+
+    if len(chain) < len(segments):
+        if chain and not chain[-1].is_directory:
+            raise Http404(f"Path component '{chain[-1].name}' is a file, not a directory.")
+        raise Http404(
+            f"Path not found. Component '{segments[len(chain)]}' in '{path}' does not exist."
+        )
+
+    return chain
+
+
+def _quota_exceeded_response():
+    return Response(
+        {"detail": "Storage quota exceeded."}, status=status.HTTP_507_INSUFFICIENT_STORAGE
+    )
+
+
+def _too_large_for_quota_response():
+    """
+    The answer to a declared size that can't fit, given before the body is read: 413 tells
+    the client to stop sending rather than retry later.
+    """
+    return Response(
+        {"detail": "This upload would exceed your storage quota."},
+        status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+    )
+
+
+def _name_conflict_response(detail=NAME_CONFLICT_DETAIL):
+    # Also the answer when a write loses a race for a name: the live-name unique
+    # constraints raise IntegrityError after the pre-check passed.
+    return Response({"detail": detail}, status=status.HTTP_409_CONFLICT)
+
+
+def _content_length(request):
+    try:
+        return int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return 0
 
-    return resolved_node
+
+def get_node_by_path(path: str, user):
+    chain = get_nodes_along_path(path, user)
+    if not chain:
+        return None
+    return chain[-1]
 
 
 class FileSystemNodeViewSet(viewsets.ModelViewSet):
@@ -71,6 +196,49 @@ class FileSystemNodeViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return FileSystemNode.objects.filter(owner=self.request.user, deleted_at__isnull=True)
 
+    def get_object(self):
+        access = _SHARED_NODE_ACTIONS.get(self.action)
+        if access is None:
+            return super().get_object()
+
+        node = get_object_or_404(
+            FileSystemNode.objects.select_related("blob"),
+            pk=self.kwargs["pk"],
+            deleted_at__isnull=True,
+        )
+        resolver = get_permission_resolver(self.request)
+        if not resolver.can(node, access):
+            if resolver.can(node, "view"):
+                raise PermissionDenied("You only have view access to this item.")
+            raise Http404("No FileSystemNode matches the given query.")
+        return node
+
+    def serialize_node(self, node, fields=None):
+        """
+        Owners get the full representation; users a node is shared with don't see where it
+        sits in the owner's tree.
+        """
+        if node.owner_id == self.request.user.pk:
+            return self.get_serializer(node, fields=fields).data
+        return SharedNodeSerializer(node).data
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.serialize_node(self.get_object()))
+
+    def get_requested_fields(self, serializer_class=FileSystemNodeSerializer):
+        """
+        Parses the optional `fields=a,b,c` query parameter. Returns None when absent.
+        """
+        raw_fields = self.request.query_params.get("fields")
+        if not raw_fields:
+            return None
+
+        fields = [name.strip() for name in raw_fields.split(",") if name.strip()]
+        unknown = set(fields) - set(serializer_class.Meta.fields)
+        if unknown:
+            raise DRFValidationError({"fields": f"Unknown fields: {', '.join(sorted(unknown))}."})
+        return fields
+
     def list(self, request, *args, **kwargs):
         user = request.user
         path_param = request.query_params.get("path", "/")
@@ -98,14 +266,78 @@ class FileSystemNodeViewSet(viewsets.ModelViewSet):
         except ValueError as e:
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+        fields = self.get_requested_fields()
         children = (
             self.get_queryset()
             .filter(parent=parent_node_for_listing)
-            .order_by("-is_directory", "name")
+            .order_by("-is_directory", "name", "id")
         )
-        serializer = self.get_serializer(children, many=True)
+        if fields is not None:
+            # Only load the columns that will be rendered (plus the ordering keys).
+            model_fields = {f.name for f in FileSystemNode._meta.concrete_fields}
+            children = children.only(
+                "id", "is_directory", "name", *(name for name in fields if name in model_fields)
+            )
+
+        paginator = DirectoryListingPagination()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(children, request, view=self)
+            serializer = self.get_serializer(page, many=True, fields=fields)
+            return paginator.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(children, many=True, fields=fields)
         return Response(serializer.data)
 
+    @action(detail=True, methods=["get"], url_path="children")
+    def children(self, request, pk=None):
+        """
+        Lists a directory by id, which also works for directories shared with the user (and
+        any directory below one). Access is checked once on the directory, since a share on
+        it covers everything inside.
+        """
+        directory = self.get_object()
+        if not directory.is_directory:
+            return Response(
+                {"detail": "Only directories can be listed."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        is_owner = directory.owner_id == request.user.pk
+        fields = self.get_requested_fields()
+        children = FileSystemNode.objects.filter(
+            owner_id=directory.owner_id, parent=directory, deleted_at__isnull=True
+        ).order_by("-is_directory", "name", "id")
+
+        def serialize(nodes):
+            if is_owner:
+                return self.get_serializer(nodes, many=True, fields=fields).data
+            return SharedNodeSerializer(nodes, many=True).data
+
+        paginator = DirectoryListingPagination()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(children, request, view=self)
+            return paginator.get_paginated_response(serialize(page))
+        return Response(serialize(children))
+
+    @action(detail=False, methods=["get"], url_path="search")
+    def search(self, request):
+        """
+        Searches the user's live nodes by name (and optionally extracted text); see
+        files.search.search_nodes for the parameters. Results are keyset-paginated by name.
+        """
+        queryset = search_nodes(self.get_queryset(), request.query_params)
+        fields = self.get_requested_fields()
+        if fields is not None:
+            model_fields = {f.name for f in FileSystemNode._meta.concrete_fields}
+            queryset = queryset.only(
+                "id", "name", *(name for name in fields if name in model_fields)
+            )
+
+        paginator = SearchPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=False, methods=["get"], url_path="details-by-path")
     def details_by_path(self, request):
         user = request.user
@@ -139,19 +371,83 @@ class FileSystemNodeViewSet(viewsets.ModelViewSet):
         except ValueError as e:
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = self.get_serializer(node)
+        serializer = self.get_serializer(node, fields=self.get_requested_fields())
         return Response(serializer.data)
 
+    def create(self, request, *args, **kwargs):
+        try:
+            return super().create(request, *args, **kwargs)
+        except QuotaExceeded:
+            return _quota_exceeded_response()
+        except IntegrityError:
+            return _name_conflict_response()
+
     def perform_create(self, serializer):
-        serializer.save()
+        with transaction.atomic():
+            node = serializer.save()
+            reserve(node.owner_id, subtree_size(node))
+            node.update_ancestor_aggregates()
 
     def destroy(self, request, *args, **kwargs):
         node = self.get_object()
-        node.deleted_at = timezone.now()
-        node.save(update_fields=["deleted_at", "updated_at"])
-        # TODO: Implement recursive soft-delete for directory children
+        with transaction.atomic():
+            update_subtree_deleted_at(node, timezone.now())
+            node.update_ancestor_aggregates(sign=-1)
+            release(node.owner_id, subtree_size(node))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=["get"], url_path="trash")
+    def trash(self, request):
+        """
+        Lists the user's deleted items (each with everything deleted along with it), most
+        recent first, with the time each will be purged. Restore one with `restore`.
+        """
+        paginator = TrashPagination()
+        page = paginator.paginate_queryset(trash_roots(request.user), request, view=self)
+        serializer = TrashNodeSerializer(
+            page,
+            many=True,
+            fields=self.get_requested_fields(TrashNodeSerializer),
+            context={**self.get_serializer_context(), "retention_period": retention_period()},
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=["post"], url_path="restore")
+    def restore(self, request, pk=None):
+        try:
+            node = FileSystemNode.objects.select_related("parent").get(
+                pk=pk, owner=request.user, deleted_at__isnull=False
+            )
+        except (FileSystemNode.DoesNotExist, ValidationError):
+            raise Http404("No deleted node matches the given query.")
+
+        if node.parent is not None and node.parent.deleted_at is not None:
+            return Response(
+                {"detail": "The parent directory is deleted. Restore it first."},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        if FileSystemNode.objects.filter(
+            owner=request.user,
+            parent=node.parent,
+            name=node.name,
+            deleted_at__isnull=True,
+        ).exists():
+            return _name_conflict_response()
+
+        try:
+            with transaction.atomic():
+                reserve(node.owner_id, subtree_size(node))
+                update_subtree_deleted_at(node, None)
+                node.update_ancestor_aggregates()
+        except QuotaExceeded:
+            return _quota_exceeded_response()
+        except IntegrityError:
+            return _name_conflict_response()
+
+        serializer = self.get_serializer(node)
+        return Response(serializer.data)
+
     def update(self, request, *args, **kwargs):
         raise MethodNotAllowed("PUT")
 
@@ -166,8 +462,17 @@ class FileSystemNodeViewSet(viewsets.ModelViewSet):
     )
     def upload_file(self, request):
         user = request.user
+        # Reject uploads that can't fit before a single byte of the body is read.
+        try:
+            declared_size = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            declared_size = 0
+        if not has_room_for(user.id, declared_size - MULTIPART_OVERHEAD_BYTES):
+            return _too_large_for_quota_response()
+
+        request.upload_handlers.insert(0, HashingUploadHandler(request))
         parent_id_str = request.data.get("parent", None)
-        uploaded_file = request.FILES.get("file")
+        uploaded_file = hashed_upload(request, "file")
 
         if not uploaded_file:
             return Response(
@@ -207,14 +512,10 @@ class FileSystemNodeViewSet(viewsets.ModelViewSet):
             owner=user,
             parent=parent_node_instance,
             name=sanitized_db_filename,
-            is_directory=False,
             deleted_at__isnull=True,
         ).exists():
-            return Response(
-                {
-                    "detail": f"A file named '{sanitized_db_filename}' already exists in this location."
-                },
-                status=status.HTTP_409_CONFLICT,
+            return _name_conflict_response(
+                f"A file named '{sanitized_db_filename}' already exists in this location."
             )
 
         node_id_for_disk = uuid.uuid4()
@@ -229,26 +530,335 @@ class FileSystemNodeViewSet(viewsets.ModelViewSet):
             mime_type=detected_mime_type,
         )
 
-        physical_disk_filename = str(node.id)
-        user_storage_dir_segment = str(user.id)
-        relative_user_dir = user_storage_dir_segment
+        try:
+            with transaction.atomic():
+                reserve(user.id, node.size_bytes)
+                node.blob = store_uploaded_file(user.id, uploaded_file)
+                insert_node(node)
+                node.update_ancestor_aggregates()
+                enqueue_upload_processing(node)
+        except QuotaExceeded:
+            return _quota_exceeded_response()
+        except NameConflict:
+            return _name_conflict_response(
+                f"A file named '{sanitized_db_filename}' already exists in this location."
+            )
+        except Exception as e:
+            return Response(
+                {"detail": "Failed to save file."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        serializer = self.get_serializer(node)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path="download",
+        renderer_classes=[JSONRenderer, PassthroughRenderer],
+    )
+    def download(self, request, pk=None):
+        node = self.get_object()
+        if node.is_directory:
+            return Response(
+                {"detail": "Directories cannot be downloaded."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        sendfile_path = node_sendfile_path(node)
+        if sendfile_path is not None and not os.path.isfile(sendfile_path):
+            raise Http404("File contents not found.")
+
+        if node.blob_id is not None:
+            etag = f'"{node.blob.sha256}"'
+        else:
+            # File contents never change for a given node, so its id is a strong validator.
+            etag = f'"{node.id.hex}-{node.size_bytes}"'
+
+        return serve_file(
+            request,
+            lambda: open_node_contents(node),
+            sendfile_path=sendfile_path,
+            size=node.size_bytes,
+            content_type=node.mime_type or "application/octet-stream",
+            etag=etag,
+            last_modified=node.created_at,
+            filename=node.name,
+        )
+
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path="archive",
+        renderer_classes=[JSONRenderer, PassthroughRenderer],
+    )
+    def archive(self, request, pk=None):
+        """
+        Streams a directory and everything under it as a ZIP64 archive.
+        """
+        node = self.get_object()
+        if not node.is_directory:
+            return Response(
+                {"detail": "Only directories can be archived; use download for files."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return archive_response(node)
+
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path="thumbnail",
+        renderer_classes=[JSONRenderer, PassthroughRenderer],
+    )
+    def thumbnail(self, request, pk=None):
+        """
+        A JPEG preview of an image or PDF: `?size=` one of FILES_THUMBNAIL_SIZES (default
+        the smallest). Rendered on first request if the background job hasn't yet.
+        """
+        node = self.get_object()
+        try:
+            size = int(request.query_params.get("size", min(settings.FILES_THUMBNAIL_SIZES)))
+        except ValueError:
+            size = None
+        if size not in settings.FILES_THUMBNAIL_SIZES:
+            return Response(
+                {"detail": f"'size' must be one of {list(settings.FILES_THUMBNAIL_SIZES)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            path = ensure_thumbnail(node, size)
+        except ThumbnailUnavailable as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_404_NOT_FOUND)
 
-        fs_storage_location = os.path.join(
-            settings.SECURE_USER_FILES_STORAGE_BASE, relative_user_dir
+        return serve_file(
+            request,
+            lambda: open_thumbnail(node, path),
+            sendfile_path=None if encryption_enabled() else path,
+            size=thumbnail_size(node, path),
+            content_type="image/jpeg",
+            etag=thumbnail_etag(node, size),
+            last_modified=node.created_at,
+            filename=f"{os.path.splitext(node.name)[0]}-{size}.jpg",
+            as_attachment=False,
         )
-        os.makedirs(fs_storage_location, exist_ok=True)
 
-        fs = FileSystemStorage(location=fs_storage_location)
-        actual_filename_on_disk = None
+    @action(detail=False, methods=["post"], url_path="uploads")
+    def create_upload_session(self, request):
+        """
+        Starts a resumable upload: {"name", "parent", "size_bytes"}. The returned session id
+        is then used to PUT byte ranges and finally to commit.
+        """
+        user = request.user
+        parent_id_str = request.data.get("parent", None)
+
+        sanitized_db_filename = get_valid_filename(request.data.get("name") or "")
+        if not _NAME_RE.fullmatch(sanitized_db_filename):
+            return Response(
+                {"detail": "Invalid filename characters or length after sanitization."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
         try:
-            actual_filename_on_disk = fs.save(physical_disk_filename, uploaded_file)
-            node.save()
-        except Exception as e:
-            if actual_filename_on_disk and fs.exists(actual_filename_on_disk):
-                fs.delete(actual_filename_on_disk)
+            size_bytes = int(request.data.get("size_bytes"))
+            if size_bytes < 0:
+                raise ValueError
+        except (TypeError, ValueError):
             return Response(
-                {"detail": "Failed to save file."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"detail": "'size_bytes' must be a non-negative integer."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        parent_node_instance = None
+        if parent_id_str:
+            try:
+                parent_node_instance = FileSystemNode.objects.get(
+                    pk=parent_id_str, owner=user, is_directory=True, deleted_at__isnull=True
+                )
+            except (FileSystemNode.DoesNotExist, ValidationError):
+                return Response(
+                    {"detail": "Invalid or non-existent parent directory specified."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        if FileSystemNode.objects.filter(
+            owner=user,
+            parent=parent_node_instance,
+            name=sanitized_db_filename,
+            deleted_at__isnull=True,
+        ).exists():
+            return _name_conflict_response(
+                f"A file named '{sanitized_db_filename}' already exists in this location."
+            )
+
+        if not has_room_for(user.id, size_bytes):
+            return _too_large_for_quota_response()
+
+        session = UploadSession.objects.create(
+            owner=user,
+            parent=parent_node_instance,
+            name=sanitized_db_filename,
+            size_bytes=size_bytes,
+            is_encrypted=encryption_enabled(),
+        )
+        # Chunks are appended to the staging file, so it exists from the start.
+        create_staged_file(session)
+
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+    def get_upload_session(self, session_id):
+        try:
+            return UploadSession.objects.get(pk=session_id, owner=self.request.user)
+        except (UploadSession.DoesNotExist, ValidationError):
+            raise Http404("Upload session not found.")
+
+    @action(
+        detail=False,
+        methods=["get", "put", "delete"],
+        url_path=r"uploads/(?P<session_id>[^/.]+)",
+    )
+    def upload_session(self, request, session_id=None):
+        """
+        GET reports the acknowledged offset to resume from, DELETE aborts the upload and
+        PUT appends the raw request body at `Content-Range: bytes <start>-<end>/<total>`.
+        """
+        session = self.get_upload_session(session_id)
+
+        if request.method == "GET":
+            return Response(UploadSessionSerializer(session).data)
+
+        if request.method == "DELETE":
+            forget_hasher(session)
+            if os.path.exists(session_file_path(session)):
+                os.remove(session_file_path(session))
+            session.delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        match = _CONTENT_RANGE_RE.fullmatch(request.headers.get("Content-Range", ""))
+        if not match:
+            return Response(
+                {"detail": "A 'Content-Range: bytes <start>-<end>/<total>' header is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        start, end, total = (int(value) for value in match.groups())
+        if total != session.size_bytes or end < start or end >= total:
+            return Response(
+                {"detail": "Content-Range does not fit the declared upload size."},
+                status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            )
+        length = end - start + 1
+        # DRF has no stream for an empty body (or one without a Content-Length).
+        if request.stream is None or _content_length(request) < length:
+            return Response(
+                {"detail": "The request body is shorter than its Content-Range."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        with transaction.atomic():
+            # Serializes concurrent PUTs to the same session.
+            session = UploadSession.objects.select_for_update().get(pk=session.pk)
+            if start != session.received_bytes:
+                return Response(
+                    {
+                        "detail": "Chunks must be sent in order from the acknowledged offset.",
+                        "received_bytes": session.received_bytes,
+                    },
+                    status=status.HTTP_409_CONFLICT,
+                )
+            received_bytes = append_chunk(session, request.stream, start, length)
+
+        if received_bytes < start + length:
+            # The body ended early; what did arrive is kept, so the client resumes from there.
+            return Response(
+                {
+                    "detail": "The request body ended before the end of its Content-Range.",
+                    "received_bytes": received_bytes,
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(UploadSessionSerializer(session).data)
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path=r"uploads/(?P<session_id>[^/.]+)/commit",
+    )
+    def commit_upload_session(self, request, session_id=None):
+        """
+        Turns a fully received session into a file node. An optional "sha256" in the body is
+        checked against the hash computed while the chunks were written. Contents the user
+        already stored are deduplicated and the staged copy is discarded.
+        """
+        session = self.get_upload_session(session_id)
+
+        if session.received_bytes != session.size_bytes:
+            return Response(
+                {
+                    "detail": "Upload is incomplete.",
+                    "received_bytes": session.received_bytes,
+                },
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        if session.parent is not None and session.parent.deleted_at is not None:
+            return Response(
+                {"detail": "The target directory has been deleted."},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        if FileSystemNode.objects.filter(
+            owner=request.user,
+            parent=session.parent,
+            name=session.name,
+            deleted_at__isnull=True,
+        ).exists():
+            return _name_conflict_response(
+                f"A file named '{session.name}' already exists in this location."
+            )
+
+        path = session_file_path(session)
+        digest = final_digest(session)
+        expected_digest = request.data.get("sha256")
+        if expected_digest and expected_digest.lower() != digest:
+            return Response(
+                {"detail": "Checksum mismatch.", "sha256": digest},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            with open_staged_file(session) as fh:
+                detected_mime_type = magic.from_buffer(fh.read(2048), mime=True)
+        except Exception:
+            return Response(
+                {"detail": "Could not determine file type."}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        node = FileSystemNode(
+            id=session.node_id,
+            owner=request.user,
+            parent=session.parent,
+            name=session.name,
+            is_directory=False,
+            size_bytes=session.size_bytes,
+            mime_type=detected_mime_type,
+        )
+
+        try:
+            with transaction.atomic():
+                reserve(request.user.id, session.size_bytes)
+                node.blob = store_staged_file(
+                    request.user.id, path, digest, session.size_bytes, session.is_encrypted
+                )
+                insert_node(node)
+                node.update_ancestor_aggregates()
+                session.delete()
+                enqueue_upload_processing(node)
+        except QuotaExceeded:
+            return _quota_exceeded_response()
+        except NameConflict:
+            return _name_conflict_response(
+                f"A file named '{session.name}' already exists in this location."
             )
 
         serializer = self.get_serializer(node)
@@ -277,18 +887,15 @@ class FileSystemNodeViewSet(viewsets.ModelViewSet):
 
         if (
             FileSystemNode.objects.filter(
-                owner=request.user,
-                parent=node.parent,
+                owner_id=node.owner_id,
+                parent_id=node.parent_id,
                 name=sanitized_new_name,
                 deleted_at__isnull=True,
             )
             .exclude(pk=node.pk)
             .exists()
         ):
-            return Response(
-                {"detail": "A file or folder with that name already exists here."},
-                status=status.HTTP_409_CONFLICT,
-            )
+            return _name_conflict_response()
 
         node.name = sanitized_new_name
         try:
@@ -309,6 +916,194 @@ class FileSystemNodeViewSet(viewsets.ModelViewSet):
                 {"detail": exc.message_dict or exc.messages}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        node.save(update_fields=["name", "updated_at"])
-        serializer = self.get_serializer(node)
-        return Response(serializer.data)
+        old_logical_path, old_tree_path = node.logical_path, node.tree_path
+        try:
+            with transaction.atomic():
+                node.save(update_fields=["name", "updated_at"])
+                if node.is_directory:
+                    node.rewrite_descendant_paths(old_logical_path, old_tree_path)
+        except IntegrityError:
+            return _name_conflict_response()
+
+        return Response(self.serialize_node(node))
+
+    def run_transfer(self, request, operation, success_status):
+        node = self.get_object()
+        parent = self.get_batch_destination(request)
+
+        new_name = request.data.get("name") or node.name
+        sanitized_new_name = get_valid_filename(new_name)
+        if not _NAME_RE.fullmatch(sanitized_new_name):
+            return Response(
+                {"detail": "Invalid new name format after sanitization."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        deltas = AncestorAggregateDeltas()
+        try:
+            with transaction.atomic():
+                node = operation(node, parent, sanitized_new_name, deltas)
+                deltas.apply(FileSystemNode)
+        except NodeOperationError as exc:
+            return Response({"detail": exc.detail}, status=exc.status_code)
+        except QuotaExceeded:
+            return _quota_exceeded_response()
+        return Response(self.get_serializer(node).data, status=success_status)
+
+    @action(detail=True, methods=["post"], url_path="move")
+    def move(self, request, pk=None):
+        """
+        Moves a node (and its subtree) into another directory: {"parent": <id or null>,
+        "name": <optional new name>}. Only metadata changes; no file contents are rewritten.
+        """
+        return self.run_transfer(request, move_node, status.HTTP_200_OK)
+
+    @action(detail=True, methods=["post"], url_path="copy")
+    def copy(self, request, pk=None):
+        """
+        Copies a node (and its subtree) into a directory; same body as `move`. Copies share
+        the original file contents on disk.
+        """
+        return self.run_transfer(request, copy_node, status.HTTP_201_CREATED)
+
+    def get_batch_items(self, request):
+        """
+        Resolves the `ids` and `paths` lists of a batch request body. Returns a list of
+        (item key, node or None) in request order, or raises DRF ValidationError.
+        """
+        ids = request.data.get("ids") or []
+        paths = request.data.get("paths") or []
+        if not isinstance(ids, list) or not isinstance(paths, list):
+            raise DRFValidationError({"detail": "'ids' and 'paths' must be lists."})
+        if not all(isinstance(value, str) for value in ids + paths):
+            raise DRFValidationError({"detail": "'ids' and 'paths' must contain strings."})
+        if not ids and not paths:
+            raise DRFValidationError({"detail": "Provide 'ids' or 'paths'."})
+        if len(ids) + len(paths) > settings.FILES_BATCH_MAX_ITEMS:
+            raise DRFValidationError(
+                {"detail": f"At most {settings.FILES_BATCH_MAX_ITEMS} items per request."}
+            )
+
+        by_id, by_path = resolve_nodes(request.user, ids, paths)
+        return [({"id": node_id}, by_id.get(node_id)) for node_id in ids] + [
+            ({"path": path}, by_path.get(path)) for path in paths
+        ]
+
+    def get_batch_destination(self, request):
+        """
+        The live directory named by `parent` in a move/copy request body (None for the root).
+        """
+        parent_id = request.data.get("parent")
+        if not parent_id:
+            return None
+        try:
+            return FileSystemNode.objects.get(
+                pk=parent_id, owner=request.user, is_directory=True, deleted_at__isnull=True
+            )
+        except (FileSystemNode.DoesNotExist, ValidationError):
+            raise DRFValidationError(
+                {"detail": "Invalid or non-existent parent directory specified."}
+            )
+
+    @staticmethod
+    def batch_result(key, status_code, detail=None, node_data=None):
+        result = {**key, "status": status_code}
+        if detail is not None:
+            result["detail"] = detail
+        if node_data is not None:
+            result["node"] = node_data
+        return result
+
+    @action(detail=False, methods=["post"], url_path="batch-details")
+    def batch_details(self, request):
+        """
+        Details of many nodes: {"ids": [...], "paths": [...]}, honouring `?fields=`. Ids may
+        also name nodes shared with the user; their access is checked with one query.
+        """
+        fields = self.get_requested_fields()
+        items = self.get_batch_items(request)
+        shared = get_permission_resolver(request).accessible_nodes(
+            [key["id"] for key, node in items if node is None and "id" in key]
+        )
+        results = []
+        for key, node in items:
+            node = node or shared.get(key.get("id"))
+            if node is None:
+                results.append(self.batch_result(key, status.HTTP_404_NOT_FOUND, "Not found."))
+            else:
+                data = self.serialize_node(node, fields=fields)
+                results.append(self.batch_result(key, status.HTTP_200_OK, node_data=data))
+        return Response({"results": results})
+
+    @action(detail=False, methods=["post"], url_path="batch-delete")
+    def batch_delete(self, request):
+        """
+        Soft-deletes many nodes in one transaction: {"ids": [...], "paths": [...]}.
+        """
+        items = self.get_batch_items(request)
+        deltas = AncestorAggregateDeltas()
+        with transaction.atomic():
+            delete_nodes([node for _, node in items if node is not None], deltas)
+            deltas.apply(FileSystemNode)
+
+        results = [
+            (
+                self.batch_result(key, status.HTTP_204_NO_CONTENT)
+                if node is not None
+                else self.batch_result(key, status.HTTP_404_NOT_FOUND, "Not found.")
+            )
+            for key, node in items
+        ]
+        return Response({"results": results})
+
+    def run_batch_transfer(self, request, operation):
+        """
+        Applies a set-based batch operation (move_nodes or copy_nodes) to the items of a
+        batch request, keeping their names.
+        """
+        items = self.get_batch_items(request)
+        parent = self.get_batch_destination(request)
+        nodes = [node for _, node in items if node is not None]
+        deltas = AncestorAggregateDeltas()
+        with transaction.atomic():
+            outcomes = iter(
+                operation([(node, node.name) for node in nodes], parent, deltas) if nodes else []
+            )
+            deltas.apply(FileSystemNode)
+            outcomes = [None if node is None else next(outcomes) for _, node in items]
+            # Read the results back once, with their final paths and aggregates.
+            fresh = FileSystemNode.objects.in_bulk(
+                [outcome.pk for outcome in outcomes if isinstance(outcome, FileSystemNode)]
+            )
+
+        results = []
+        for (key, _), outcome in zip(items, outcomes):
+            if outcome is None:
+                results.append(self.batch_result(key, status.HTTP_404_NOT_FOUND, "Not found."))
+            elif isinstance(outcome, NodeOperationError):
+                results.append(self.batch_result(key, outcome.status_code, outcome.detail))
+            elif isinstance(outcome, QuotaExceeded):
+                results.append(
+                    self.batch_result(
+                        key, status.HTTP_507_INSUFFICIENT_STORAGE, "Storage quota exceeded."
+                    )
+                )
+            else:
+                node_data = self.get_serializer(fresh[outcome.pk]).data
+                results.append(self.batch_result(key, status.HTTP_200_OK, node_data=node_data))
+        return Response({"results": results})
+
+    @action(detail=False, methods=["post"], url_path="batch-move")
+    def batch_move(self, request):
+        """
+        Moves many nodes into one directory in one transaction:
+        {"ids": [...], "paths": [...], "parent": <directory id or null for the root>}.
+        """
+        return self.run_batch_transfer(request, move_nodes)
+
+    @action(detail=False, methods=["post"], url_path="batch-copy")
+    def batch_copy(self, request):
+        """
+        Copies many nodes into one directory in one transaction; same body as batch-move.
+        """
+        return self.run_batch_transfer(request, copy_nodes)
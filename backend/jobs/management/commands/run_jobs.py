@@ -0,0 +1,51 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from jobs.queue import claim_jobs, execute
+
+
+def _execute_and_close(claimed_job):
+    try:
+        return execute(claimed_job)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs on a pool of worker threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4, help="Worker threads.")
+        parser.add_argument(
+            "--poll-interval", type=float, default=1.0, help="Seconds to sleep when idle."
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit once no jobs are due instead of polling."
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options["concurrency"]
+        completed = 0
+        running = set()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="jobs") as pool:
+            while True:
+                close_old_connections()
+                free_slots = concurrency - len(running)
+                if free_slots:
+                    for claimed_job in claim_jobs(free_slots):
+                        running.add(pool.submit(_execute_and_close, claimed_job))
+
+                if running:
+                    done, running = wait(
+                        running, timeout=options["poll_interval"], return_when=FIRST_COMPLETED
+                    )
+                    completed += len(done)
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+
+        self.stdout.write(self.style.SUCCESS(f"Ran {completed} jobs."))
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("jobs", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="job",
+            index=models.Index(
+                condition=models.Q(("status__in", ["succeeded", "failed"])),
+                fields=["updated_at"],
+                name="jobs_job_finished_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    A unit of background work: a registered job function (see jobs.queue) and its JSON
+    arguments. Rows are claimed by workers with SELECT ... FOR UPDATE SKIP LOCKED.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        RUNNING = "running"
+        SUCCEEDED = "succeeded"
+        FAILED = "failed"
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # Enqueueing twice with the same key returns the existing job instead of adding one.
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True, unique=True)
+
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    # A running job whose lease has expired (its worker died) is picked up again.
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["run_after", "id"],
+                name="jobs_job_pending_idx",
+                condition=Q(status="pending"),
+            ),
+            models.Index(
+                fields=["locked_until"],
+                name="jobs_job_running_idx",
+                condition=Q(status="running"),
+            ),
+            # Retention cleanup: finished jobs by age.
+            models.Index(
+                fields=["updated_at"],
+                name="jobs_job_finished_idx",
+                condition=Q(status__in=["succeeded", "failed"]),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
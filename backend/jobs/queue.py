@@ -0,0 +1,243 @@
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def job(name=None, max_attempts=5):
+    """
+    Registers a function as a job so it can be enqueued by name. Arguments must be
+    JSON-serializable. Jobs may run more than once (after a crash or a retry), so they
+    should be idempotent.
+    """
+
+    def register(func):
+        job_name = name or f"{func.__module__}.{func.__qualname__}"
+        _registry[job_name] = func
+        func.job_name = job_name
+        func.max_attempts = max_attempts
+        return func
+
+    return register
+
+
+def get_job_function(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f"No job registered as '{name}'.")
+
+
+def enqueue(func, *args, idempotency_key=None, delay=None, **kwargs):
+    """
+    Adds a job for `func` (a function registered with @job). The row is written in the
+    current transaction, so the job only exists if that transaction commits. With an
+    `idempotency_key`, an existing job with the same key is returned instead.
+    """
+    fields = {
+        "name": func.job_name,
+        "args": list(args),
+        "kwargs": kwargs,
+        "max_attempts": func.max_attempts,
+        "run_after": timezone.now() + (delay or timedelta(0)),
+    }
+    if idempotency_key is None:
+        queued_job = Job.objects.create(**fields)
+    else:
+        queued_job, created = Job.objects.get_or_create(
+            idempotency_key=idempotency_key, defaults=fields
+        )
+        if not created:
+            return queued_job
+
+    transaction.on_commit(_notify_local_worker)
+    return queued_job
+
+
+def claim_jobs(limit):
+    """
+    Marks up to `limit` due jobs as running and returns them. Concurrent workers skip each
+    other's locked rows, so a job is never handed out twice while its lease is valid.
+
+    Claiming counts the attempt, so a job that kills its worker (its lease expires without
+    an outcome) still runs out of attempts: once it has none left it is failed, not claimed.
+    """
+    now = timezone.now()
+    due = Q(status=Job.Status.PENDING, run_after__lte=now) | Q(
+        status=Job.Status.RUNNING, locked_until__lt=now
+    )
+    with transaction.atomic():
+        claimed = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(due)
+            .order_by("run_after", "id")[:limit]
+        )
+        exhausted = [
+            claimed_job.pk
+            for claimed_job in claimed
+            if claimed_job.attempts >= claimed_job.max_attempts
+        ]
+        if exhausted:
+            Job.objects.filter(pk__in=exhausted).update(
+                status=Job.Status.FAILED,
+                locked_until=None,
+                last_error="The lease of the last attempt expired before the job finished.",
+                updated_at=now,
+            )
+            claimed = [claimed_job for claimed_job in claimed if claimed_job.pk not in exhausted]
+        if claimed:
+            Job.objects.filter(pk__in=[claimed_job.pk for claimed_job in claimed]).update(
+                status=Job.Status.RUNNING,
+                attempts=F("attempts") + 1,
+                locked_until=now + timedelta(seconds=settings.JOBS_LEASE_SECONDS),
+                updated_at=now,
+            )
+    for claimed_job in claimed:
+        claimed_job.status = Job.Status.RUNNING
+        claimed_job.attempts += 1
+    return claimed
+
+
+def retry_delay(attempts):
+    """
+    Exponential backoff: JOBS_RETRY_BASE_SECONDS, doubled per attempt, capped at an hour.
+    """
+    return timedelta(seconds=min(settings.JOBS_RETRY_BASE_SECONDS * 2 ** (attempts - 1), 3600))
+
+
+def execute(claimed_job):
+    """
+    Runs a claimed job and records the outcome: succeeded, pending again (with backoff) or
+    failed once max_attempts is reached. The attempt was counted when the job was claimed.
+    """
+    attempts = claimed_job.attempts
+    now = timezone.now()
+    try:
+        get_job_function(claimed_job.name)(*claimed_job.args, **claimed_job.kwargs)
+    except Exception:
+        logger.exception(
+            "Job %s (%s) failed on attempt %d.", claimed_job.pk, claimed_job.name, attempts
+        )
+        outcome = {"last_error": traceback.format_exc(limit=20)}
+        if attempts < claimed_job.max_attempts:
+            delay = retry_delay(attempts)
+            outcome.update(status=Job.Status.PENDING, run_after=now + delay)
+            _notify_local_worker(delay)
+        else:
+            outcome.update(status=Job.Status.FAILED)
+    else:
+        outcome = {"status": Job.Status.SUCCEEDED, "last_error": ""}
+
+    Job.objects.filter(pk=claimed_job.pk).update(
+        locked_until=None, updated_at=timezone.now(), **outcome
+    )
+    claimed_job.status = outcome["status"]
+    schedule_cleanup()
+    return claimed_job
+
+
+@job(name="jobs.purge_finished_jobs")
+def purge_finished_jobs(batch_size=None):
+    """
+    Deletes succeeded and failed jobs last updated more than JOBS_RETENTION_DAYS ago, in
+    batches (via `jobs_job_finished_idx`), which also frees their idempotency keys. Returns
+    the number of jobs deleted.
+    """
+    batch_size = batch_size or settings.JOBS_CLEANUP_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(days=settings.JOBS_RETENTION_DAYS)
+    expired = Job.objects.filter(
+        status__in=[Job.Status.SUCCEEDED, Job.Status.FAILED], updated_at__lt=cutoff
+    )
+    deleted = 0
+    while True:
+        batch = list(expired.order_by("updated_at").values_list("pk", flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        deleted += Job.objects.filter(pk__in=batch).delete()[0]
+
+
+_last_cleanup_slot = None
+
+
+def schedule_cleanup():
+    """
+    Enqueues purge_finished_jobs at most once per JOBS_CLEANUP_INTERVAL_SECONDS. The
+    idempotency key covers all processes; the remembered slot saves this one the query.
+    """
+    global _last_cleanup_slot
+    slot = int(time.time() // settings.JOBS_CLEANUP_INTERVAL_SECONDS)
+    if slot == _last_cleanup_slot:
+        return
+    _last_cleanup_slot = slot
+    enqueue(purge_finished_jobs, idempotency_key=f"jobs:purge:{slot}")
+
+
+def run_due_jobs(limit=None):
+    """
+    Claims and runs due jobs one after another until none are left (or `limit` ran).
+    Returns the number of jobs run.
+    """
+    run = 0
+    while limit is None or run < limit:
+        claimed = claim_jobs(1)
+        if not claimed:
+            return run
+        execute(claimed[0])
+        run += 1
+    return run
+
+
+_local_pool = None
+_local_pool_lock = threading.Lock()
+
+
+def _run_in_pool():
+    try:
+        run_due_jobs()
+    except Exception:
+        logger.exception("Local job worker failed.")
+    finally:
+        close_old_connections()
+        connection.close()
+
+
+def _notify_local_worker(delay=None):
+    """
+    Wakes the in-process worker pool (JOBS_MODE "thread"), or runs due jobs right away in
+    the calling thread (JOBS_MODE "eager", for tests and local runs). In "external" mode
+    jobs wait for `manage.py run_jobs`.
+    """
+    global _local_pool
+    mode = settings.JOBS_MODE
+    if mode == "eager":
+        if delay is None:
+            run_due_jobs()
+        return
+    if mode != "thread":
+        return
+
+    if delay is not None:
+        timer = threading.Timer(delay.total_seconds(), _notify_local_worker)
+        timer.daemon = True
+        timer.start()
+        return
+
+    with _local_pool_lock:
+        if _local_pool is None:
+            _local_pool = ThreadPoolExecutor(
+                max_workers=settings.JOBS_LOCAL_WORKERS, thread_name_prefix="jobs"
+            )
+    _local_pool.submit(_run_in_pool)
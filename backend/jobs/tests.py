@@ -0,0 +1,90 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from jobs import queue
+from jobs.models import Job
+
+
+@queue.job(name="jobs.tests.noop")
+def noop():
+    pass
+
+
+@override_settings(JOBS_MODE="external", JOBS_RETENTION_DAYS=7)
+class PurgeFinishedJobsTests(TestCase):
+    def make_job(self, status, age):
+        queued_job = Job.objects.create(name=noop.job_name, status=status)
+        Job.objects.filter(pk=queued_job.pk).update(updated_at=timezone.now() - age)
+        return queued_job
+
+    def test_deletes_only_finished_jobs_past_the_retention(self):
+        old = timedelta(days=8)
+        expired = [
+            self.make_job(Job.Status.SUCCEEDED, old),
+            self.make_job(Job.Status.FAILED, old),
+            self.make_job(Job.Status.SUCCEEDED, old),
+        ]
+        kept = [
+            self.make_job(Job.Status.PENDING, old),
+            self.make_job(Job.Status.RUNNING, old),
+            self.make_job(Job.Status.SUCCEEDED, timedelta(days=1)),
+        ]
+
+        self.assertEqual(queue.purge_finished_jobs(batch_size=2), len(expired))
+        self.assertEqual(
+            set(Job.objects.values_list("pk", flat=True)), {queued_job.pk for queued_job in kept}
+        )
+
+    def test_finishing_jobs_schedules_one_cleanup_per_interval(self):
+        queue.enqueue(noop)
+        queue.enqueue(noop)
+        with mock.patch.object(queue, "_last_cleanup_slot", None):
+            self.assertEqual(queue.run_due_jobs(limit=2), 2)
+        cleanups = Job.objects.filter(name=queue.purge_finished_jobs.job_name)
+        self.assertEqual(cleanups.count(), 1)
+        self.assertEqual(cleanups.get().status, Job.Status.PENDING)
+
+
+@queue.job(name="jobs.tests.fail", max_attempts=2)
+def fail():
+    raise RuntimeError("Boom.")
+
+
+@override_settings(JOBS_MODE="external")
+class AttemptTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(queue, "schedule_cleanup")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_failed_runs_are_retried_until_max_attempts(self):
+        queued_job = queue.enqueue(fail)
+        with self.assertLogs("jobs.queue", "ERROR"):
+            self.assertEqual(queue.run_due_jobs(), 1)
+        queued_job.refresh_from_db()
+        self.assertEqual((queued_job.status, queued_job.attempts), (Job.Status.PENDING, 1))
+
+        Job.objects.filter(pk=queued_job.pk).update(run_after=timezone.now())
+        with self.assertLogs("jobs.queue", "ERROR"):
+            self.assertEqual(queue.run_due_jobs(), 1)
+        queued_job.refresh_from_db()
+        self.assertEqual((queued_job.status, queued_job.attempts), (Job.Status.FAILED, 2))
+
+    def test_jobs_that_kill_their_worker_run_out_of_attempts(self):
+        queued_job = queue.enqueue(fail)
+        for attempt in (1, 2):
+            # The worker dies while running the job, so no outcome is recorded.
+            (claimed,) = queue.claim_jobs(1)
+            self.assertEqual(claimed.attempts, attempt)
+            self.assertEqual(Job.objects.get(pk=queued_job.pk).attempts, attempt)
+            Job.objects.filter(pk=queued_job.pk).update(
+                locked_until=timezone.now() - timedelta(seconds=1)
+            )
+
+        self.assertEqual(queue.claim_jobs(1), [])
+        queued_job.refresh_from_db()
+        self.assertEqual((queued_job.status, queued_job.attempts), (Job.Status.FAILED, 2))
+        self.assertIn("lease", queued_job.last_error)
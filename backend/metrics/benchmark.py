@@ -0,0 +1,325 @@
+import math
+import os
+import random
+import statistics
+import time
+import uuid
+from dataclasses import dataclass, field
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from files.aggregates import reconcile_aggregates
+from files.models import FileSystemNode
+from files.quotas import recount
+from files.views import get_node_by_path
+from public.models import PublicPage
+from sharing.models import PermissionLevel, SharePermission
+
+# Dataset sizes. "wide": files in one directory; "depth": length of the directory chain;
+# "users": other users, each with a tree of `dirs_per_user` x `files_per_dir` files;
+# "shares": files shared with the benchmark user (plus one whole directory); "pages": published
+# pages.
+SCALES = {
+    "small": {
+        "wide": 1_000,
+        "depth": 20,
+        "users": 20,
+        "dirs_per_user": 5,
+        "files_per_dir": 10,
+        "shares": 200,
+        "pages": 20,
+    },
+    "medium": {
+        "wide": 10_000,
+        "depth": 50,
+        "users": 100,
+        "dirs_per_user": 10,
+        "files_per_dir": 20,
+        "shares": 2_000,
+        "pages": 200,
+    },
+    "large": {
+        "wide": 100_000,
+        "depth": 100,
+        "users": 500,
+        "dirs_per_user": 20,
+        "files_per_dir": 50,
+        "shares": 20_000,
+        "pages": 2_000,
+    },
+}
+
+MIME_TYPES = ("text/plain", "application/pdf", "image/jpeg", "image/png")
+# Files in each directory removed by the destroy scenario.
+DESTROY_SUBTREE_FILES = 50
+BULK_BATCH_SIZE = 2000
+
+
+@dataclass
+class Dataset:
+    user: object
+    wide_dir: FileSystemNode
+    deep_top: FileSystemNode
+    deep_leaf: FileSystemNode
+    destroy_targets: list
+    page: PublicPage
+    shared_dir: FileSystemNode
+    shared_dir_file: FileSystemNode
+    counts: dict = field(default_factory=dict)
+
+
+class TreeBuilder:
+    """
+    Builds FileSystemNode rows in memory, with their materialized paths, for bulk_create().
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.nodes = []
+
+    def directory(self, owner, parent, name):
+        return self._add(owner, parent, name, is_directory=True)
+
+    def file(self, owner, parent, name):
+        return self._add(
+            owner,
+            parent,
+            name,
+            size_bytes=self.rng.randint(1_000, 5_000_000),
+            mime_type=self.rng.choice(MIME_TYPES),
+        )
+
+    def _add(self, owner, parent, name, is_directory=False, size_bytes=None, mime_type=None):
+        node = FileSystemNode(
+            id=uuid.uuid4(),
+            owner=owner,
+            parent=parent,
+            name=name,
+            is_directory=is_directory,
+            size_bytes=size_bytes,
+            mime_type=mime_type,
+        )
+        node.refresh_paths()
+        self.nodes.append(node)
+        return node
+
+    def save(self):
+        FileSystemNode.objects.bulk_create(self.nodes, batch_size=BULK_BATCH_SIZE)
+        count, self.nodes = len(self.nodes), []
+        return count
+
+
+def build_dataset(scale, iterations, pages_dir, seed=0):
+    """
+    Creates the benchmark tree with bulk inserts: one user with a wide directory, a deep
+    directory chain, subtrees for the destroy scenario and published pages, plus many other
+    users with their own trees, a share of which is shared with the first user.
+    """
+    sizes = SCALES[scale]
+    rng = random.Random(seed)
+    User = get_user_model()
+    users = User.objects.bulk_create(
+        [
+            User(username=f"bench{index}", email=f"bench{index}@example.com")
+            for index in range(sizes["users"] + 1)
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    user, others = users[0], users[1:]
+
+    tree = TreeBuilder(rng)
+    wide_dir = tree.directory(user, None, "wide")
+    for index in range(sizes["wide"]):
+        tree.file(user, wide_dir, f"file-{index:07d}.txt")
+
+    deep_top = parent = tree.directory(user, None, "deep-0")
+    for depth in range(1, sizes["depth"]):
+        parent = tree.directory(user, parent, f"deep-{depth}")
+    deep_leaf = tree.file(user, parent, "leaf.txt")
+
+    destroy_targets = []
+    for index in range(iterations):
+        target = tree.directory(user, None, f"destroy-{index}")
+        for file_index in range(DESTROY_SUBTREE_FILES):
+            tree.file(user, target, f"file-{file_index}.txt")
+        destroy_targets.append(target)
+
+    shareable, directories = [], []
+    for other in others:
+        for dir_index in range(sizes["dirs_per_user"]):
+            directory = tree.directory(other, None, f"dir-{dir_index}")
+            directories.append(directory)
+            for file_index in range(sizes["files_per_dir"]):
+                shareable.append(tree.file(other, directory, f"file-{file_index}.txt"))
+    node_count = tree.save()
+
+    shared = rng.sample(shareable, min(sizes["shares"], len(shareable)))
+    shared_dir = rng.choice(directories)
+    shared.append(shared_dir)
+    SharePermission.objects.bulk_create(
+        [
+            SharePermission(
+                node=node,
+                shared_with_user=user,
+                granted_by_user_id=node.owner_id,
+                permission_level=rng.choice(PermissionLevel.values),
+            )
+            for node in shared
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+
+    pages = PublicPage.objects.bulk_create(
+        [PublicPage(owner=user, name=f"page-{index}.html") for index in range(sizes["pages"])],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    owner_dir = os.path.join(pages_dir, str(user.pk))
+    os.makedirs(owner_dir, exist_ok=True)
+    for page in pages:
+        with open(os.path.join(owner_dir, f"{page.physical_storage_filename}.html"), "w") as fh:
+            fh.write(f"<html><body><h1>{page.name}</h1></body></html>")
+
+    user_ids = [each.pk for each in users]
+    reconcile_aggregates(FileSystemNode, user_ids)
+    recount(user_ids)
+
+    return Dataset(
+        user=user,
+        wide_dir=wide_dir,
+        deep_top=deep_top,
+        deep_leaf=deep_leaf,
+        destroy_targets=destroy_targets,
+        page=pages[len(pages) // 2],
+        shared_dir=shared_dir,
+        shared_dir_file=next(node for node in shareable if node.parent_id == shared_dir.pk),
+        counts={"users": len(users), "nodes": node_count, "shares": len(shared)},
+    )
+
+
+def _percentile(ordered, fraction):
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(durations, query_counts, status_codes):
+    milliseconds = sorted(duration * 1000 for duration in durations)
+    return {
+        "iterations": len(milliseconds),
+        "min_ms": round(milliseconds[0], 3),
+        "median_ms": round(statistics.median(milliseconds), 3),
+        "p95_ms": round(_percentile(milliseconds, 0.95), 3),
+        "max_ms": round(milliseconds[-1], 3),
+        "mean_ms": round(statistics.fmean(milliseconds), 3),
+        "queries": {
+            "min": min(query_counts),
+            "median": statistics.median(query_counts),
+            "max": max(query_counts),
+        },
+        "status_codes": sorted(set(status_codes)),
+    }
+
+
+def measure(action, iterations, warmup=0):
+    """
+    Runs `action(iteration)` `warmup` times untimed and `iterations` times timed, recording
+    wall time and SQL query count per call. `action` returns an HTTP status code or None.
+    """
+    for iteration in range(warmup):
+        action(-1 - iteration)
+    durations, query_counts, status_codes = [], [], []
+    for iteration in range(iterations):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            status_code = action(iteration)
+            durations.append(time.perf_counter() - started)
+        query_counts.append(len(queries))
+        if status_code is not None:
+            status_codes.append(status_code)
+    return summarize(durations, query_counts, status_codes)
+
+
+def scenarios(dataset):
+    """
+    The benchmarked operations, as (name, action, warmup) tuples. Read-only scenarios get a
+    warmup call; the mutating ones work on a fresh target per iteration.
+    """
+    user = dataset.user
+    client = APIClient()
+    client.force_authenticate(user)
+    anonymous = APIClient()
+
+    def deep_path():
+        return FileSystemNode.objects.get(pk=dataset.deep_leaf.pk).logical_path
+
+    leaf_path = deep_path()
+
+    def get_node_by_path_deep(iteration):
+        get_node_by_path(leaf_path, user)
+
+    def list_root(iteration):
+        return client.get("/api/files/").status_code
+
+    def list_wide_page(iteration):
+        return client.get("/api/files/", {"path": "/wide", "limit": 100}).status_code
+
+    def list_wide_full(iteration):
+        return client.get("/api/files/", {"path": "/wide"}).status_code
+
+    def details_by_path_deep(iteration):
+        return client.get("/api/files/details-by-path/", {"path": leaf_path}).status_code
+
+    def upload_file(iteration):
+        upload = SimpleUploadedFile(
+            f"upload-{iteration}.txt", b"benchmark upload\n" * 64, content_type="text/plain"
+        )
+        return client.post(
+            "/api/files/upload/",
+            {"file": upload, "parent": str(dataset.wide_dir.pk)},
+            format="multipart",
+        ).status_code
+
+    def rename_deep_top(iteration):
+        # Renaming the top of the chain rewrites the stored paths of every node below it.
+        return client.patch(
+            f"/api/files/{dataset.deep_top.pk}/rename/",
+            {"name": f"deep-renamed-{iteration}"},
+            format="json",
+        ).status_code
+
+    def destroy_subtree(iteration):
+        target = dataset.destroy_targets[iteration]
+        return client.delete(f"/api/files/{target.pk}/").status_code
+
+    def shared_with_me(iteration):
+        return client.get("/api/sharing/shared-with-me/").status_code
+
+    def list_shared_directory(iteration):
+        return client.get(f"/api/files/{dataset.shared_dir.pk}/children/").status_code
+
+    def retrieve_in_shared_directory(iteration):
+        # Access is inherited from the share on the parent directory.
+        return client.get(f"/api/files/{dataset.shared_dir_file.pk}/").status_code
+
+    def public_page(iteration):
+        response = anonymous.get(f"/published/{user.username}/{dataset.page.name}/")
+        if hasattr(response, "close"):
+            response.close()
+        return response.status_code
+
+    return [
+        ("get_node_by_path", get_node_by_path_deep, 1),
+        ("list_root", list_root, 1),
+        ("list_wide_first_page", list_wide_page, 1),
+        ("list_wide_full", list_wide_full, 1),
+        ("details_by_path", details_by_path_deep, 1),
+        ("upload_file", upload_file, 0),
+        ("rename", rename_deep_top, 0),
+        ("destroy", destroy_subtree, 0),
+        ("shared_with_me", shared_with_me, 1),
+        ("list_shared_directory", list_shared_directory, 1),
+        ("retrieve_in_shared_directory", retrieve_in_shared_directory, 1),
+        ("public_page", public_page, 1),
+    ]
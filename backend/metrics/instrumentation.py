@@ -0,0 +1,77 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """
+    What one request spent its time on. Filled in by QueryRecorder and measure_serialization()
+    while MetricsMiddleware has it installed as the current request's metrics.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.total_seconds = None
+        self._serialize_depth = 0
+
+    def finish(self):
+        self.total_seconds = time.perf_counter() - self.started
+
+
+def current_metrics():
+    """
+    The RequestMetrics of the request being handled, or None outside of one.
+    """
+    return _current.get()
+
+
+@contextmanager
+def recording(metrics):
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+class QueryRecorder:
+    """
+    connection.execute_wrapper() hook counting the queries of the current request and the
+    time they take. Queries outside a request (jobs, management commands) pass straight through.
+    """
+
+    def __call__(self, execute, sql, params, many, context):
+        metrics = _current.get()
+        if metrics is None:
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            metrics.queries += 1
+            metrics.sql_seconds += time.perf_counter() - started
+
+
+@contextmanager
+def measure_serialization():
+    """
+    Adds the time spent in the block to the current request's serialization time. Nested
+    blocks (a serializer rendered inside another) are only counted once.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    metrics._serialize_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics._serialize_depth -= 1
+        if not metrics._serialize_depth:
+            metrics.serialize_seconds += time.perf_counter() - started
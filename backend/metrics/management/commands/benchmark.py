@@ -0,0 +1,129 @@
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.utils import timezone
+
+from metrics.benchmark import SCALES, build_dataset, measure, scenarios
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the file-tree API on a synthetic dataset and prints the results as JSON. "
+        "Runs against a throwaway test database (test_<NAME> on PostgreSQL, in-memory on "
+        "SQLite with DB_ENGINE=sqlite); your data is never touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+        parser.add_argument("--iterations", type=int, default=20, help="Timed runs per scenario.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed for the generated dataset.")
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            help="Only run this scenario (repeatable). Default: all.",
+        )
+        parser.add_argument("--output", help="Write the JSON results here instead of stdout.")
+        parser.add_argument(
+            "--keepdb", action="store_true", help="Reuse the test database between runs."
+        )
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        if iterations < 1:
+            raise CommandError("--iterations must be at least 1.")
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options["keepdb"])
+        try:
+            with (
+                tempfile.TemporaryDirectory() as files_dir,
+                tempfile.TemporaryDirectory() as pages_dir,
+                # Uploads only enqueue their background processing; quotas never interfere.
+                override_settings(
+                    SECURE_USER_FILES_STORAGE_BASE=files_dir,
+                    PUBLIC_PAGES_STORAGE_BASE=pages_dir,
+                    FILES_THUMBNAIL_CACHE_DIR=None,
+                    FILES_DEFAULT_QUOTA_BYTES=None,
+                    JOBS_MODE="external",
+                    METRICS_ENFORCE_QUERY_BUDGETS=False,
+                ),
+            ):
+                report = self.run_benchmark(options, iterations, pages_dir)
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options["keepdb"])
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                fh.write(output + "\n")
+            self.stderr.write(f"Results written to {options['output']}.")
+        else:
+            self.stdout.write(output)
+
+    def run_benchmark(self, options, iterations, pages_dir):
+        started = time.perf_counter()
+        dataset = build_dataset(options["scale"], iterations, pages_dir, seed=options["seed"])
+        self.stderr.write(
+            f"Built the {options['scale']} dataset in {time.perf_counter() - started:.1f}s: "
+            + ", ".join(f"{count} {name}" for name, count in dataset.counts.items())
+        )
+
+        selected = scenarios(dataset)
+        if options["scenario"]:
+            unknown = set(options["scenario"]) - {name for name, _, _ in selected}
+            if unknown:
+                raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}.")
+            selected = [entry for entry in selected if entry[0] in options["scenario"]]
+
+        results = {}
+        for name, action, warmup in selected:
+            results[name] = measure(action, iterations, warmup=warmup)
+            self.stderr.write(
+                f"{name}: median {results[name]['median_ms']}ms, "
+                f"{results[name]['queries']['median']} queries"
+            )
+
+        return {
+            "meta": {
+                "created_at": timezone.now().isoformat(),
+                "git_revision": _git_revision(),
+                "database": connection.vendor,
+                "django": django.get_version(),
+                "python": platform.python_version(),
+                "platform": sys.platform,
+                "scale": options["scale"],
+                "iterations": iterations,
+                "seed": options["seed"],
+                "dataset": dataset.counts,
+            },
+            "results": results,
+        }
@@ -0,0 +1,75 @@
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .instrumentation import QueryRecorder, RequestMetrics, recording
+from .registry import registry
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def route_label(request):
+    """
+    The URL name of the matched route (e.g. "files-list"), which keeps metric labels bounded
+    whatever ids appear in the path.
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    return match.view_name or match.route
+
+
+def server_timing(metrics):
+    return ", ".join(
+        [
+            f'db;dur={metrics.sql_seconds * 1000:.1f};desc="{metrics.queries} queries"',
+            f"serialize;dur={metrics.serialize_seconds * 1000:.1f}",
+            f"total;dur={metrics.total_seconds * 1000:.1f}",
+        ]
+    )
+
+
+class MetricsMiddleware:
+    """
+    Records the query count, SQL time, serialization time and total time of every request,
+    adds them to the response as a Server-Timing header and to the per-route histograms
+    served by the metrics endpoint. Streamed bodies are not included in the total.
+
+    Endpoints ("<method> <URL name>") listed in METRICS_QUERY_BUDGETS log a warning when they
+    run more queries than budgeted, or fail the request with QueryBudgetExceeded when
+    METRICS_ENFORCE_QUERY_BUDGETS is set (as in tests).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.recorder = QueryRecorder()
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        with recording(metrics), ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.recorder))
+            response = self.get_response(request)
+        metrics.finish()
+
+        route = route_label(request)
+        registry.observe(route, request.method, response.status_code, metrics)
+        if settings.METRICS_SERVER_TIMING:
+            response["Server-Timing"] = server_timing(metrics)
+        self.check_query_budget(f"{request.method} {route}", metrics)
+        return response
+
+    def check_query_budget(self, endpoint, metrics):
+        budget = settings.METRICS_QUERY_BUDGETS.get(endpoint)
+        if budget is None or metrics.queries <= budget:
+            return
+        message = f"{endpoint} ran {metrics.queries} queries (budget: {budget})."
+        if settings.METRICS_ENFORCE_QUERY_BUDGETS:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
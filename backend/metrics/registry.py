@@ -0,0 +1,108 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """
+    A Prometheus-style histogram per label set: cumulative bucket counts, sum and count.
+    """
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        # labels -> [per-bucket counts (the last one is +Inf), sum]
+        self._series = defaultdict(lambda: [[0] * (len(buckets) + 1), 0.0])
+
+    def observe(self, labels, value):
+        counts, _ = series = self._series[labels]
+        counts[bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", (*labels, ("le", str(bound))), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._series = defaultdict(int)
+
+    def inc(self, labels, amount=1):
+        self._series[labels] += amount
+
+    def samples(self):
+        for labels, value in sorted(self._series.items()):
+            yield self.name, labels, value
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsRegistry:
+    """
+    Per-route request metrics of this process. Each worker process keeps its own; Prometheus
+    scrapes and sums them per instance.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter("http_requests_total", "Requests handled, by route and status.")
+        self.duration = Histogram(
+            "http_request_duration_seconds", "Total time to build the response.", DURATION_BUCKETS
+        )
+        self.sql_duration = Histogram(
+            "http_request_sql_duration_seconds", "Time spent in SQL queries.", DURATION_BUCKETS
+        )
+        self.serialize_duration = Histogram(
+            "http_request_serialize_duration_seconds",
+            "Time spent serializing and rendering response data.",
+            DURATION_BUCKETS,
+        )
+        self.queries = Histogram(
+            "http_request_queries", "SQL queries run per request.", QUERY_COUNT_BUCKETS
+        )
+
+    def observe(self, route, method, status_code, metrics):
+        labels = (("route", route), ("method", method))
+        with self._lock:
+            self.requests.inc((*labels, ("status", str(status_code))))
+            self.duration.observe(labels, metrics.total_seconds)
+            self.sql_duration.observe(labels, metrics.sql_seconds)
+            self.serialize_duration.observe(labels, metrics.serialize_seconds)
+            self.queries.observe(labels, metrics.queries)
+
+    def render(self):
+        """
+        The metrics in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        with self._lock:
+            for metric, kind in (
+                (self.requests, "counter"),
+                (self.duration, "histogram"),
+                (self.sql_duration, "histogram"),
+                (self.serialize_duration, "histogram"),
+                (self.queries, "histogram"),
+            ):
+                lines.append(f"# HELP {metric.name} {metric.documentation}")
+                lines.append(f"# TYPE {metric.name} {kind}")
+                for name, labels, value in metric.samples():
+                    label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels)
+                    lines.append(f"{name}{{{label_text}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,13 @@
+from rest_framework.renderers import JSONRenderer
+
+from .instrumentation import measure_serialization
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that counts its encoding time as serialization in the request metrics.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with measure_serialization():
+            return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,12 @@
+from .instrumentation import measure_serialization
+
+
+class TimedSerializerMixin:
+    """
+    Counts the time a serializer spends turning instances into data (including queries it
+    triggers on the way) as serialization in the request metrics.
+    """
+
+    def to_representation(self, instance):
+        with measure_serialization():
+            return super().to_representation(instance)
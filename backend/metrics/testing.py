@@ -0,0 +1,24 @@
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+@contextmanager
+def assert_max_queries(max_queries, using=DEFAULT_DB_ALIAS):
+    """
+    Fails with the captured SQL if the block runs more than `max_queries` queries, so
+    N+1 regressions break the build:
+
+        with assert_max_queries(4):
+            client.get("/api/files/")
+    """
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+    if len(context) > max_queries:
+        queries = "\n".join(
+            f"{number}. {query['sql']}" for number, query in enumerate(context.captured_queries, 1)
+        )
+        raise AssertionError(
+            f"{len(context)} queries executed, at most {max_queries} expected:\n{queries}"
+        )
@@ -0,0 +1,145 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from files.models import FileSystemNode
+from metrics.middleware import QueryBudgetExceeded
+from metrics.testing import assert_max_queries
+from sharing.models import PermissionLevel, SharePermission
+
+User = get_user_model()
+
+
+class MetricsTestCase(APITestCase):
+    """
+    Alice owns /docs/reports/ with a few files and shares /docs with Bob. Requests carry
+    real JWTs, since authenticating the user is part of every endpoint's query count.
+    """
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", email="a@x.com", password="pw")
+        self.bob = User.objects.create_user(username="bob", email="b@x.com", password="pw")
+        self.docs = FileSystemNode.objects.create(owner=self.alice, name="docs", is_directory=True)
+        self.reports = FileSystemNode.objects.create(
+            owner=self.alice, parent=self.docs, name="reports", is_directory=True
+        )
+        for index in range(3):
+            FileSystemNode.objects.create(
+                owner=self.alice,
+                parent=self.reports,
+                name=f"report-{index}.txt",
+                size_bytes=10,
+                mime_type="text/plain",
+            )
+        SharePermission.objects.create(
+            node=self.docs,
+            shared_with_user=self.bob,
+            granted_by_user=self.alice,
+            permission_level=PermissionLevel.VIEW,
+        )
+        self.authenticate(self.alice)
+
+    def authenticate(self, user):
+        token = RefreshToken.for_user(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+
+@override_settings(METRICS_ENFORCE_QUERY_BUDGETS=True)
+class QueryBudgetTests(MetricsTestCase):
+    def assert_within_budget(self, endpoint, url):
+        # Cold caches: a budget has to hold for the first request too.
+        cache.clear()
+        with assert_max_queries(settings.METRICS_QUERY_BUDGETS[endpoint]):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_files_list(self):
+        self.assert_within_budget("GET files-list", "/api/files/")
+        self.assert_within_budget("GET files-list", "/api/files/?limit=2")
+
+    def test_files_detail(self):
+        self.assert_within_budget("GET files-detail", f"/api/files/{self.reports.pk}/")
+        self.authenticate(self.bob)
+        self.assert_within_budget("GET files-detail", f"/api/files/{self.reports.pk}/")
+
+    def test_files_children(self):
+        url = f"/api/files/{self.reports.pk}/children/"
+        self.assert_within_budget("GET files-children", url)
+        self.assert_within_budget("GET files-children", f"{url}?limit=2")
+
+    def test_files_children_of_a_shared_directory(self):
+        self.authenticate(self.bob)
+        for directory in (self.docs, self.reports):
+            with self.subTest(directory=directory.name):
+                url = f"/api/files/{directory.pk}/children/"
+                self.assert_within_budget("GET files-children", url)
+                self.assert_within_budget("GET files-children", f"{url}?limit=2")
+
+    def test_files_details_by_path(self):
+        self.assert_within_budget(
+            "GET files-details-by-path", "/api/files/details-by-path/?path=/docs/reports"
+        )
+
+    def test_shared_with_me(self):
+        self.authenticate(self.bob)
+        self.assert_within_budget("GET sharing-shared-with-me", "/api/sharing/shared-with-me/")
+
+
+class MetricsMiddlewareTests(MetricsTestCase):
+    @override_settings(METRICS_SERVER_TIMING=True)
+    def test_adds_server_timing(self):
+        response = self.client.get("/api/files/")
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^db;dur=[\d.]+;desc="2 queries", serialize;dur=[\d.]+, total;dur=[\d.]+$',
+        )
+
+    @override_settings(METRICS_SERVER_TIMING=False)
+    def test_server_timing_can_be_turned_off(self):
+        self.assertNotIn("Server-Timing", self.client.get("/api/files/"))
+
+    @override_settings(
+        METRICS_QUERY_BUDGETS={"GET files-list": 1}, METRICS_ENFORCE_QUERY_BUDGETS=False
+    )
+    def test_logs_requests_over_budget(self):
+        with self.assertLogs("metrics.middleware", "WARNING") as logs:
+            response = self.client.get("/api/files/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            logs.output, ["WARNING:metrics.middleware:GET files-list ran 2 queries (budget: 1)."]
+        )
+
+        with self.assertNoLogs("metrics.middleware", "WARNING"):
+            self.client.get(f"/api/files/{self.docs.pk}/")
+
+    @override_settings(
+        METRICS_QUERY_BUDGETS={"GET files-list": 1}, METRICS_ENFORCE_QUERY_BUDGETS=True
+    )
+    def test_enforced_budgets_fail_the_request(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, "GET files-list ran 2 queries"):
+            self.client.get("/api/files/")
+
+
+class MetricsEndpointTests(MetricsTestCase):
+    @override_settings(METRICS_TOKEN="scrape-token")
+    def test_requires_the_token(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get("/metrics/").status_code, 404)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer wrong-token")
+        self.assertEqual(self.client.get("/metrics/").status_code, 404)
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer scrape-token")
+        response = self.client.get("/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'http_requests_total{route="metrics",method="GET",status="404"}',
+            response.content.decode(),
+        )
+
+    @override_settings(METRICS_TOKEN=None, DEBUG=False)
+    def test_is_hidden_without_a_token_outside_debug(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get("/metrics/").status_code, 404)
@@ -0,0 +1,80 @@
+import os
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import PublicPage
+
+
+def _cache_key(username, filename):
+    return f"public:page:{md5(f'{username}/{filename}'.encode()).hexdigest()}"
+
+
+def resolve_page(username, filename, refresh=False):
+    """
+    Where `username`'s page `filename` is served from, as a dict with the file's path, size,
+    mtime_ns, a strong ETag and its Last-Modified timestamp; None when there is no such page
+    or its file is missing. Hits come from the default cache; a miss (or `refresh`) costs one
+    query and one stat. Missing pages aren't cached.
+    """
+    key = _cache_key(username, filename)
+    if not refresh:
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+
+    page = (
+        PublicPage.objects.filter(owner__username=username, name=filename)
+        .only("owner_id", "physical_storage_filename")
+        .first()
+    )
+    if page is None:
+        return None
+    path = os.path.join(
+        settings.PUBLIC_PAGES_STORAGE_BASE,
+        str(page.owner_id),
+        f"{page.physical_storage_filename}.html",
+    )
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    entry = {
+        "path": path,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        # The file is only ever replaced in place, so its size and mtime identify the content.
+        "etag": f'"{page.physical_storage_filename.hex}-{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+        "last_modified": int(stat.st_mtime),
+    }
+    cache.set(key, entry, timeout=settings.PUBLIC_PAGES_CACHE_SECONDS)
+    return entry
+
+
+def open_page(entry):
+    """
+    Opens the file of a resolve_page() entry, or returns None if it is gone or no longer the
+    content the entry describes (it was replaced after the entry was cached).
+    """
+    try:
+        fh = open(entry["path"], "rb")
+    except FileNotFoundError:
+        return None
+    stat = os.fstat(fh.fileno())
+    if (stat.st_size, stat.st_mtime_ns) != (entry["size"], entry["mtime_ns"]):
+        fh.close()
+        return None
+    return fh
+
+
+def invalidate_pages(username, *filenames):
+    """
+    Drops the cached entries of `username`'s pages `filenames` once the current transaction
+    commits. With a per-process cache (the default LocMem) this only reaches the current worker;
+    the others keep their entries for up to PUBLIC_PAGES_CACHE_SECONDS.
+    """
+    keys = [_cache_key(username, filename) for filename in filenames]
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -1,3 +1,138 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from public.cache import resolve_page
+
+User = get_user_model()
+
+PAGE = b"<!DOCTYPE html><html><body><p>Hello</p></body></html>"
+
+
+class PublicPageTestCase(APITestCase):
+    """
+    Authenticated as `user`, with a throwaway storage directory for the pages.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.storage_dir = tempfile.mkdtemp()
+        cls.settings_override = override_settings(PUBLIC_PAGES_STORAGE_BASE=cls.storage_dir)
+        cls.settings_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.settings_override.disable()
+        shutil.rmtree(cls.storage_dir, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="alice", email="a@x.com", password="pw")
+        self.client.force_authenticate(self.user)
+
+    def publish(self, name, contents=PAGE):
+        html_file = SimpleUploadedFile(name, contents, content_type="text/html")
+        response = self.client.post("/api/public-pages/", {"html_file": html_file})
+        self.assertEqual(response.status_code, 201)
+        return response.json()["id"]
+
+    def replace(self, page_id, name, contents):
+        html_file = SimpleUploadedFile(name, contents, content_type="text/html")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(f"/api/public-pages/{page_id}/", {"html_file": html_file})
+        self.assertEqual(response.status_code, 200)
+
+    def fetch(self, name, **headers):
+        response = self.client.get(f"/published/alice/{name}/", headers=headers)
+        if response.streaming:
+            response.body = b"".join(response.streaming_content)
+            response.close()
+        return response
+
+
+class PublicPageServeTests(PublicPageTestCase):
+    def test_serves_the_page_with_validators(self):
+        self.publish("index.html")
+
+        response = self.fetch("index.html")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, PAGE)
+        self.assertEqual(response["Content-Type"], "text/html")
+        self.assertIn("ETag", response)
+        self.assertIn("Last-Modified", response)
+        self.assertEqual(self.fetch("missing.html").status_code, 404)
+
+    def test_conditional_requests_are_answered_without_a_query(self):
+        self.publish("index.html")
+        first = self.fetch("index.html")
+
+        with self.assertNumQueries(0):
+            response = self.fetch("index.html", if_none_match=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], first["ETag"])
+
+        with self.assertNumQueries(0):
+            response = self.fetch("index.html", if_modified_since=first["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+        with self.assertNumQueries(0):
+            response = self.fetch("index.html", if_none_match='"something-else"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_updating_the_page_invalidates_its_entry(self):
+        page_id = self.publish("index.html")
+        etag = self.fetch("index.html")["ETag"]
+
+        updated = PAGE.replace(b"Hello", b"Hello again")
+        self.replace(page_id, "index.html", updated)
+
+        response = self.fetch("index.html", if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, updated)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_renaming_the_page_invalidates_the_old_name(self):
+        page_id = self.publish("index.html")
+        self.fetch("index.html")
+
+        self.replace(page_id, "about.html", PAGE)
+
+        self.assertEqual(self.fetch("index.html").status_code, 404)
+        self.assertEqual(self.fetch("about.html").body, PAGE)
+
+    def test_deleting_the_page_invalidates_its_entry(self):
+        page_id = self.publish("index.html")
+        self.fetch("index.html")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/api/public-pages/{page_id}/")
+
+        self.assertEqual(self.fetch("index.html").status_code, 404)
+
+    def test_a_file_changed_on_disk_is_looked_up_again(self):
+        self.publish("index.html")
+        stale = self.fetch("index.html")
+        path = resolve_page("alice", "index.html")["path"]
+
+        # Replaced behind the cache's back, e.g. by another worker whose invalidation
+        # didn't reach this process.
+        updated = PAGE.replace(b"Hello", b"Hello from elsewhere")
+        with open(path, "wb") as fh:
+            fh.write(updated)
+
+        response = self.fetch("index.html")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, updated)
+        self.assertNotEqual(response["ETag"], stale["ETag"])
+        self.assertEqual(resolve_page("alice", "index.html")["etag"], response["ETag"])
+
+        os.remove(path)
+        self.assertEqual(self.fetch("index.html").status_code, 404)
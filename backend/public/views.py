@@ -4,13 +4,15 @@ import magic
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 from django.http import FileResponse, Http404
-from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.views import View
 from rest_framework import status, viewsets
 from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from .cache import invalidate_pages, open_page, resolve_page
 from .models import PublicPage
 from .serializers import PublicPageSerializer
 
@@ -87,6 +89,7 @@ class PublicPageViewSet(viewsets.ModelViewSet):
         new_name = html_file.name
         serializer = self.get_serializer(page, data={"name": new_name}, partial=True)
         serializer.is_valid(raise_exception=True)
+        old_name = page.name
         page.name = serializer.validated_data["name"]
 
         # MIME sniff & overwrite file
@@ -121,6 +124,7 @@ class PublicPageViewSet(viewsets.ModelViewSet):
             )
 
         page.save(update_fields=["name", "updated_at"])
+        invalidate_pages(request.user.username, old_name, page.name)
         return Response(self.get_serializer(page).data)
 
     def destroy(self, request, *args, **kwargs):
@@ -138,6 +142,7 @@ class PublicPageViewSet(viewsets.ModelViewSet):
                 pass
 
         page.delete()
+        invalidate_pages(request.user.username, page.name)
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -149,18 +154,33 @@ class PublicPageServeView(View):
     """
 
     def get(self, request, username, filename):
+        # The page's location and validators come from the cache, so a matching If-None-Match
+        # is answered with a 304 without a query or touching the file. A cached entry that no
+        # longer matches the file on disk is looked up again.
+        for refresh in (False, True):
+            entry = resolve_page(username, filename, refresh=refresh)
+            if entry is None:
+                raise Http404("Public page not found")
+
+            not_modified = get_conditional_response(
+                request, etag=entry["etag"], last_modified=entry["last_modified"]
+            )
+            if not_modified is not None:
+                return self.add_headers(not_modified, entry)
 
-        page = get_object_or_404(PublicPage, owner__username=username, name=filename)
-
-        user_dir = os.path.join(settings.PUBLIC_PAGES_STORAGE_BASE, str(page.owner_id))
-
-        disk_name = f"{page.physical_storage_filename}.html"
-        file_path = os.path.join(user_dir, disk_name)
-
-        if not os.path.isfile(file_path):
+            fh = open_page(entry)
+            if fh is not None:
+                break
+        else:
             raise Http404("Public page not found")
 
-        response = FileResponse(open(file_path, "rb"), content_type="text/html")
+        response = FileResponse(fh, content_type="text/html")
+        return self.add_headers(response, entry)
+
+    @staticmethod
+    def add_headers(response, entry):
+        response["ETag"] = entry["etag"]
+        response["Last-Modified"] = http_date(entry["last_modified"])
 
         # Security hardening headers
         response["X-Content-Type-Options"] = "nosniff"
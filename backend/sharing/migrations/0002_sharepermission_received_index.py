@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-17 02:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0013_live_node_constraints"),
+        ("sharing", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="sharepermission",
+            index=models.Index(
+                fields=["shared_with_user", "-created_at", "id"], name="sharing_received_idx"
+            ),
+        ),
+    ]
@@ -1,7 +1,6 @@
 import uuid
 
 from django.conf import settings
-from django.core.exceptions import ValidationError
 from django.db import models
 from django.db.models import TextChoices
 
@@ -42,7 +41,9 @@ class SharePermission(models.Model):
 
     class Meta:
         unique_together = [["node", "shared_with_user"]]
-
-    def clean(self):
-        if self.node.is_directory:
-            raise ValidationError("Cannot share directories.")
+        indexes = [
+            # The shared-with-me feed: WHERE shared_with_user ORDER BY -created_at, id.
+            models.Index(
+                fields=["shared_with_user", "-created_at", "id"], name="sharing_received_idx"
+            ),
+        ]
@@ -0,0 +1,170 @@
+import uuid
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from files.models import FileSystemNode
+
+from .models import PermissionLevel, SharePermission
+
+OWNER = "owner"
+# Access levels from weakest to strongest; a level grants everything below it.
+_RANK = {None: 0, PermissionLevel.VIEW: 1, PermissionLevel.EDIT: 2, OWNER: 3}
+# What each kind of operation needs: reading contents, changing a node, or anything that
+# only the owner may do (deleting, moving, sharing).
+ACCESS_REQUIRED = {
+    "view": PermissionLevel.VIEW,
+    "edit": PermissionLevel.EDIT,
+    "manage": OWNER,
+}
+
+_NO_ACCESS = ""  # Cached for nodes the user can't access; None means "not cached".
+
+
+def _version_key(user_id):
+    return f"sharing:acl:version:{user_id}"
+
+
+def _acl_version(user_id):
+    """
+    The current version token of `user_id`'s cached permissions. A fresh random token (not a
+    counter) is used whenever the old one is missing, so an evicted version never brings
+    back entries cached under it.
+    """
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def _cache_key(user_id, version, node):
+    return f"sharing:acl:{user_id}:{version}:{md5(node.tree_path.encode()).hexdigest()}"
+
+
+def invalidate_permissions(user_ids):
+    """
+    Drops the cached permissions of the given users (the recipients of changed shares) once
+    the current transaction commits.
+    """
+    keys = {_version_key(user_id): uuid.uuid4().hex for user_id in set(user_ids)}
+    if keys:
+        transaction.on_commit(lambda: cache.set_many(keys, timeout=None))
+
+
+class PermissionResolver:
+    """
+    Answers "can this user do X with node N" for one request. Nodes the user owns need no
+    lookup; for the others, levels come from the per-request memo, then the shared cache,
+    then a single query for everything still unknown.
+
+    Cache entries are keyed on the user's ACL version and the node's tree_path, so changing
+    a share (invalidate_permissions) or moving the node makes old entries unreachable.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._memo = {}
+
+    def levels(self, nodes):
+        """
+        Returns {node id: OWNER, PermissionLevel value or None} for all of `nodes`.
+        """
+        result, unknown = {}, []
+        for node in nodes:
+            if node.owner_id == self.user.pk:
+                result[node.pk] = OWNER
+            elif node.pk in self._memo:
+                result[node.pk] = self._memo[node.pk]
+            else:
+                unknown.append(node)
+        if not unknown:
+            return result
+
+        version = _acl_version(self.user.pk)
+        keys = {node.pk: _cache_key(self.user.pk, version, node) for node in unknown}
+        cached = cache.get_many(keys.values())
+        missing = [node for node in unknown if keys[node.pk] not in cached]
+        fetched = self._query_levels(missing) if missing else {}
+        if missing:
+            cache.set_many(
+                {keys[node.pk]: fetched.get(node.pk) or _NO_ACCESS for node in missing},
+                timeout=settings.SHARING_ACL_CACHE_SECONDS,
+            )
+
+        for node in unknown:
+            if keys[node.pk] in cached:
+                level = cached[keys[node.pk]] or None
+            else:
+                level = fetched.get(node.pk)
+            self._memo[node.pk] = result[node.pk] = level
+        return result
+
+    def _query_levels(self, nodes):
+        """
+        Effective levels of `nodes` with one query: a share on a directory applies to its
+        whole subtree, so the shares on each node and on its ancestors (read from tree_path)
+        are fetched together and the strongest one wins.
+        """
+        lineage = {node.pk: [*node.ancestor_ids, node.pk] for node in nodes}
+        granted = dict(
+            SharePermission.objects.filter(
+                shared_with_user=self.user,
+                node_id__in={node_id for ids in lineage.values() for node_id in ids},
+            ).values_list("node_id", "permission_level")
+        )
+        levels = {}
+        for node_id, ids in lineage.items():
+            level = max((granted.get(each) for each in ids), key=_RANK.__getitem__)
+            if level is not None:
+                levels[node_id] = level
+        return levels
+
+    def level(self, node):
+        return self.levels([node])[node.pk]
+
+    def can(self, node, access):
+        return _RANK[self.level(node)] >= _RANK[ACCESS_REQUIRED[access]]
+
+    def allowed(self, nodes, access):
+        """
+        The subset of `nodes` the user has `access` to, answered with at most one query.
+        """
+        levels = self.levels(nodes)
+        required = _RANK[ACCESS_REQUIRED[access]]
+        return [node for node in nodes if _RANK[levels[node.pk]] >= required]
+
+    def accessible_nodes(self, ids, access="view"):
+        """
+        Looks up live nodes of any owner by id and keeps those the user has `access` to.
+        Returns {id as given: node}; ids that don't parse, exist or resolve are left out.
+        """
+        parsed_ids = {}
+        for node_id in ids:
+            try:
+                parsed_ids[node_id] = uuid.UUID(str(node_id))
+            except (TypeError, ValueError):
+                continue
+        if not parsed_ids:
+            return {}
+        nodes = FileSystemNode.objects.filter(
+            pk__in=parsed_ids.values(), deleted_at__isnull=True
+        ).in_bulk()
+        allowed = {node.pk for node in self.allowed(list(nodes.values()), access)}
+        return {node_id: nodes[pk] for node_id, pk in parsed_ids.items() if pk in allowed}
+
+
+def get_permission_resolver(request):
+    """
+    The PermissionResolver of `request`, created on first use so its memo lasts for the
+    whole request (DRF and Django request objects share it).
+    """
+    holder = getattr(request, "_request", request)
+    resolver = getattr(holder, "_permission_resolver", None)
+    if resolver is None or resolver.user != request.user:
+        resolver = holder._permission_resolver = PermissionResolver(request.user)
+    return resolver
@@ -1,13 +1,16 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
+from authentication.serializers import UserDetailsSerializer
 from files.models import FileSystemNode
+from metrics.serializers import TimedSerializerMixin
 from sharing.models import PermissionLevel, SharePermission
 
 User = get_user_model()
 
 
-class SharePermissionSerializer(serializers.ModelSerializer):
+class SharePermissionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     node = serializers.PrimaryKeyRelatedField(
         queryset=FileSystemNode.objects.all(),
     )
@@ -25,3 +28,60 @@ class SharePermissionSerializer(serializers.ModelSerializer):
             "updated_at",
         ]
         read_only_fields = ["id", "created_at", "updated_at"]
+
+
+class SharedNodeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    A node as seen by someone it is shared with: no parent or path inside the owner's tree.
+    """
+
+    class Meta:
+        model = FileSystemNode
+        fields = [
+            "id",
+            "name",
+            "is_directory",
+            "size_bytes",
+            "mime_type",
+            "total_size_bytes",
+            "descendant_count",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = fields
+
+
+class SharedWithMeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    One entry of the shared-with-me feed. Expects the share's node, the node's owner and
+    granted_by_user to be select_related.
+    """
+
+    node = SharedNodeSerializer(read_only=True)
+    owner = UserDetailsSerializer(source="node.owner", read_only=True)
+    granted_by = UserDetailsSerializer(source="granted_by_user", read_only=True)
+
+    class Meta:
+        model = SharePermission
+        fields = ["id", "permission_level", "created_at", "node", "owner", "granted_by"]
+        read_only_fields = fields
+
+
+class BulkShareSerializer(serializers.Serializer):
+    """
+    The body of a bulk grant, revoke or change-level request: every node in `nodes` x every
+    user in `users`. Duplicates are dropped; `permission_level` is ignored when revoking.
+    """
+
+    nodes = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+    users = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    permission_level = serializers.ChoiceField(choices=PermissionLevel.choices, required=False)
+
+    def validate(self, attrs):
+        attrs["nodes"] = list(dict.fromkeys(attrs["nodes"]))
+        attrs["users"] = list(dict.fromkeys(attrs["users"]))
+        if len(attrs["nodes"]) * len(attrs["users"]) > settings.SHARING_BULK_MAX_SHARES:
+            raise serializers.ValidationError(
+                f"At most {settings.SHARING_BULK_MAX_SHARES} node/user pairs per request."
+            )
+        return attrs
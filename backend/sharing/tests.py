@@ -1,3 +1,298 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from files.models import FileSystemNode
+from sharing.models import PermissionLevel, SharePermission
+from sharing.permissions import OWNER, PermissionResolver
+
+User = get_user_model()
+
+
+class SharingTestCase(APITestCase):
+    """
+    Alice owns /docs/reports/summary.txt and /notes.txt; Bob and Carol are other users.
+    Requests are made as Alice unless `as_user` switches.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username="alice", email="a@x.com", password="pw")
+        self.bob = User.objects.create_user(username="bob", email="b@x.com", password="pw")
+        self.carol = User.objects.create_user(username="carol", email="c@x.com", password="pw")
+        self.docs = self.make_node("docs", is_directory=True)
+        self.reports = self.make_node("reports", self.docs, is_directory=True)
+        self.summary = self.make_node("summary.txt", self.reports)
+        self.notes = self.make_node("notes.txt")
+        self.as_user(self.alice)
+
+    def make_node(self, name, parent=None, is_directory=False, owner=None):
+        return FileSystemNode.objects.create(
+            owner=owner or self.alice,
+            parent=parent,
+            name=name,
+            is_directory=is_directory,
+            size_bytes=None if is_directory else 10,
+            mime_type="" if is_directory else "text/plain",
+        )
+
+    def as_user(self, user):
+        self.client.force_authenticate(user)
+
+    def share(self, node, user, level=PermissionLevel.VIEW):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/sharing/",
+                {"node": str(node.pk), "shared_with_user": user.pk, "permission_level": level},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def revoke(self, nodes, users):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/sharing/bulk-revoke/",
+                {"nodes": [str(node.pk) for node in nodes], "users": [user.pk for user in users]},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def share_queries(self, func):
+        """
+        Runs `func` and returns the SQL queries it ran against the shares table.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        return [query["sql"] for query in queries if "sharing_sharepermission" in query["sql"]]
+
+
+class PermissionResolverTests(SharingTestCase):
+    def setUp(self):
+        super().setUp()
+        SharePermission.objects.create(
+            node=self.summary,
+            shared_with_user=self.bob,
+            granted_by_user=self.alice,
+            permission_level=PermissionLevel.EDIT,
+        )
+        self.others = self.make_node("others.txt", owner=self.carol)
+
+    def test_owned_nodes_need_no_query(self):
+        with self.assertNumQueries(0):
+            levels = PermissionResolver(self.alice).levels([self.docs, self.summary])
+        self.assertEqual(levels, {self.docs.pk: OWNER, self.summary.pk: OWNER})
+
+    def test_resolves_a_batch_with_one_query_then_from_memo_and_cache(self):
+        nodes = [self.summary, self.notes, self.others]
+        expected = {
+            self.summary.pk: PermissionLevel.EDIT,
+            self.notes.pk: None,
+            self.others.pk: None,
+        }
+
+        resolver = PermissionResolver(self.bob)
+        with self.assertNumQueries(1):
+            self.assertEqual(resolver.levels(nodes), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.levels(nodes), expected)
+        # A later request finds the answers, denials included, in the shared cache.
+        with self.assertNumQueries(0):
+            self.assertEqual(PermissionResolver(self.bob).levels(nodes), expected)
+
+    def test_allowed_filters_by_access(self):
+        resolver = PermissionResolver(self.bob)
+        self.assertEqual(resolver.allowed([self.summary, self.notes], "view"), [self.summary])
+        self.assertTrue(resolver.can(self.summary, "edit"))
+        self.assertFalse(resolver.can(self.summary, "manage"))
+
+
+class PermissionCacheInvalidationTests(SharingTestCase):
+    def get_summary(self):
+        return self.client.get(f"/api/files/{self.summary.pk}/")
+
+    def test_grant_and_revoke_reach_the_cache(self):
+        self.as_user(self.bob)
+        self.assertEqual(self.get_summary().status_code, 404)  # Caches the denial.
+
+        self.as_user(self.alice)
+        self.share(self.summary, self.bob)
+        self.as_user(self.bob)
+        self.assertEqual(self.get_summary().status_code, 200)
+
+        # Allowed again from the cache, without looking at the shares.
+        self.assertEqual(self.share_queries(lambda: self.get_summary().status_code), [])
+
+        self.as_user(self.alice)
+        self.assertEqual(self.revoke([self.summary], [self.bob]), {"revoked": 1})
+        self.as_user(self.bob)
+        self.assertEqual(self.get_summary().status_code, 404)
+
+    def test_other_users_keep_their_cached_permissions(self):
+        self.share(self.summary, self.carol)
+        self.as_user(self.carol)
+        self.assertEqual(self.get_summary().status_code, 200)
+
+        self.as_user(self.alice)
+        self.share(self.summary, self.bob)
+        self.as_user(self.carol)
+        self.assertEqual(self.share_queries(self.get_summary), [])
+
+
+class DirectoryShareTests(SharingTestCase):
+    def rename_summary(self, name="renamed.txt"):
+        return self.client.patch(
+            f"/api/files/{self.summary.pk}/rename/", {"name": name}, format="json"
+        )
+
+    def test_descendants_of_a_shared_directory_are_readable(self):
+        self.share(self.docs, self.bob)
+        self.as_user(self.bob)
+
+        self.assertEqual(self.client.get(f"/api/files/{self.summary.pk}/").status_code, 200)
+        response = self.client.get(f"/api/files/{self.reports.pk}/children/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([node["name"] for node in response.json()], ["summary.txt"])
+        # Siblings of the shared directory stay private.
+        self.assertEqual(self.client.get(f"/api/files/{self.notes.pk}/").status_code, 404)
+
+    def test_view_access_cannot_rename(self):
+        self.share(self.docs, self.bob)
+        self.as_user(self.bob)
+
+        self.assertEqual(self.rename_summary().status_code, 403)
+        self.summary.refresh_from_db()
+        self.assertEqual(self.summary.name, "summary.txt")
+
+    def test_edit_access_is_inherited_from_an_ancestor(self):
+        self.share(self.docs, self.bob, PermissionLevel.EDIT)
+        self.as_user(self.bob)
+
+        self.assertEqual(self.rename_summary().status_code, 200)
+        self.summary.refresh_from_db()
+        self.assertEqual(self.summary.name, "renamed.txt")
+
+    def test_the_closest_share_does_not_hide_a_higher_ancestor_level(self):
+        self.share(self.docs, self.bob, PermissionLevel.EDIT)
+        self.share(self.reports, self.bob, PermissionLevel.VIEW)
+        self.as_user(self.bob)
+
+        self.assertEqual(self.rename_summary().status_code, 200)
+
+    def test_revoking_the_ancestor_share_removes_access_to_descendants(self):
+        self.share(self.docs, self.bob)
+        self.as_user(self.bob)
+        self.assertEqual(self.client.get(f"/api/files/{self.summary.pk}/").status_code, 200)
+
+        self.as_user(self.alice)
+        self.revoke([self.docs], [self.bob])
+        self.as_user(self.bob)
+        self.assertEqual(self.client.get(f"/api/files/{self.summary.pk}/").status_code, 404)
+        self.assertEqual(
+            self.client.get(f"/api/files/{self.reports.pk}/children/").status_code, 404
+        )
+
+
+class BulkShareTests(SharingTestCase):
+    def bulk(self, endpoint, nodes, users, level=None):
+        body = {"nodes": [str(node.pk) for node in nodes], "users": [user.pk for user in users]}
+        if level is not None:
+            body["permission_level"] = level
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f"/api/sharing/{endpoint}/", body, format="json")
+
+    def levels(self):
+        return {
+            (share.node_id, share.shared_with_user_id): share.permission_level
+            for share in SharePermission.objects.all()
+        }
+
+    def test_grant_shares_every_pair_and_upserts_existing_shares(self):
+        self.share(self.notes, self.bob)
+
+        response = self.bulk(
+            "bulk-grant", [self.docs, self.notes], [self.bob, self.carol], PermissionLevel.EDIT
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"granted": 4})
+        self.assertEqual(
+            self.levels(),
+            {
+                (node.pk, user.pk): PermissionLevel.EDIT
+                for node in (self.docs, self.notes)
+                for user in (self.bob, self.carol)
+            },
+        )
+
+    def test_change_level_updates_only_existing_shares(self):
+        self.share(self.notes, self.bob)
+
+        response = self.bulk(
+            "bulk-change-level", [self.docs, self.notes], [self.bob], PermissionLevel.EDIT
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"updated": 1})
+        self.assertEqual(self.levels(), {(self.notes.pk, self.bob.pk): PermissionLevel.EDIT})
+
+    def test_revoke_removes_every_pair(self):
+        self.bulk("bulk-grant", [self.docs, self.notes], [self.bob, self.carol], "view")
+
+        response = self.bulk("bulk-revoke", [self.docs], [self.bob, self.carol])
+        self.assertEqual(response.json(), {"revoked": 2})
+        self.assertEqual(
+            set(self.levels()), {(self.notes.pk, self.bob.pk), (self.notes.pk, self.carol.pk)}
+        )
+
+    def test_rejects_nodes_you_do_not_own(self):
+        others = self.make_node("others.txt", owner=self.carol)
+        for endpoint in ("bulk-grant", "bulk-revoke", "bulk-change-level"):
+            with self.subTest(endpoint=endpoint):
+                response = self.bulk(endpoint, [self.notes, others], [self.bob], "view")
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(str(others.pk), response.json()["nodes"][0])
+        self.assertEqual(self.levels(), {})
+
+    @override_settings(SHARING_BULK_MAX_SHARES=3)
+    def test_limits_the_number_of_pairs(self):
+        response = self.bulk("bulk-grant", [self.docs, self.notes], [self.bob, self.carol], "view")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {"non_field_errors": ["At most 3 node/user pairs per request."]}
+        )
+        self.assertEqual(self.levels(), {})
+
+        response = self.bulk("bulk-grant", [self.docs], [self.bob, self.carol], "view")
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalidates_the_recipients_caches(self):
+        self.as_user(self.bob)
+        self.assertEqual(self.client.get(f"/api/files/{self.summary.pk}/").status_code, 404)
+
+        self.as_user(self.alice)
+        self.bulk("bulk-grant", [self.docs], [self.bob], "view")
+        self.as_user(self.bob)
+        self.assertEqual(self.client.get(f"/api/files/{self.summary.pk}/").status_code, 200)
+        self.assertEqual(
+            self.client.patch(
+                f"/api/files/{self.summary.pk}/rename/", {"name": "renamed.txt"}, format="json"
+            ).status_code,
+            403,
+        )
+
+        self.as_user(self.alice)
+        self.bulk("bulk-change-level", [self.docs], [self.bob], "edit")
+        self.as_user(self.bob)
+        self.assertEqual(
+            self.client.patch(
+                f"/api/files/{self.summary.pk}/rename/", {"name": "renamed.txt"}, format="json"
+            ).status_code,
+            200,
+        )
+
+        self.as_user(self.alice)
+        self.bulk("bulk-revoke", [self.docs], [self.bob])
+        self.as_user(self.bob)
+        self.assertEqual(self.client.get(f"/api/files/{self.summary.pk}/").status_code, 404)
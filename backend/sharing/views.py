@@ -1,6 +1,10 @@
 import re
+from itertools import product
 
+from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied, ValidationError
@@ -8,13 +12,28 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from files.models import FileSystemNode
-from files.serializers import FileSystemNodeSerializer
+from files.pagination import KeysetPagination
 from files.views import get_node_by_path
 from sharing.models import SharePermission
-from sharing.serializers import SharePermissionSerializer
+from sharing.permissions import get_permission_resolver, invalidate_permissions
+from sharing.serializers import (
+    BulkShareSerializer,
+    SharedWithMeSerializer,
+    SharePermissionSerializer,
+)
 
 _SEGMENT_RE = re.compile(r"^[^\s/]{1,255}$")
 
+User = get_user_model()
+
+
+class SharedWithMePagination(KeysetPagination):
+    """
+    Shares received, newest first. Backed by `sharing_received_idx`.
+    """
+
+    ordering = ("-created_at", "id")
+
 
 class SharePermissionViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
     permission_classes = [IsAuthenticated]
@@ -27,25 +46,117 @@ class SharePermissionViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
         node = serializer.validated_data["node"]
         shared_with_user = serializer.validated_data["shared_with_user"]
 
-        if node.owner != self.request.user:
+        if not get_permission_resolver(self.request).can(node, "manage"):
             raise PermissionDenied("You can only share your own files.")
 
-        if node.is_directory:
-            raise ValidationError("Cannot share directories.")
+        if node.deleted_at is not None:
+            raise ValidationError("Cannot share deleted files.")
 
         if shared_with_user == self.request.user:
             raise ValidationError("Cannot share with yourself.")
 
         serializer.save(granted_by_user=self.request.user)
+        invalidate_permissions([shared_with_user.pk])
+
+    def get_bulk_request(self, request, require_level=True, live_only=True):
+        """
+        Validates a bulk share request body. Returns (node ids, user ids, permission level);
+        every node must belong to the requesting user, which is checked with one query.
+        """
+        serializer = BulkShareSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        node_ids = serializer.validated_data["nodes"]
+        user_ids = serializer.validated_data["users"]
+        level = serializer.validated_data.get("permission_level")
+        if require_level and level is None:
+            raise ValidationError({"permission_level": ["This field is required."]})
+
+        owned = FileSystemNode.objects.filter(pk__in=node_ids, owner=request.user)
+        if live_only:
+            owned = owned.filter(deleted_at__isnull=True)
+        owned_ids = set(owned.values_list("pk", flat=True))
+        unknown = [str(node_id) for node_id in node_ids if node_id not in owned_ids]
+        if unknown:
+            raise ValidationError(
+                {"nodes": [f"Not found or not shareable by you: {', '.join(unknown)}."]}
+            )
+        if request.user.pk in user_ids:
+            raise ValidationError({"users": ["Cannot share with yourself."]})
+        return node_ids, user_ids, level
+
+    @action(detail=False, methods=["post"], url_path="bulk-grant")
+    def bulk_grant(self, request):
+        """
+        Shares every node in `nodes` with every user in `users` at `permission_level`,
+        replacing the level of pairs that are already shared. One upsert in one transaction.
+        """
+        node_ids, user_ids, level = self.get_bulk_request(request)
+        found_ids = set(User.objects.filter(pk__in=user_ids).values_list("pk", flat=True))
+        unknown = [str(user_id) for user_id in user_ids if user_id not in found_ids]
+        if unknown:
+            raise ValidationError({"users": [f"Unknown users: {', '.join(unknown)}."]})
+
+        shares = [
+            SharePermission(
+                node_id=node_id,
+                shared_with_user_id=user_id,
+                granted_by_user=request.user,
+                permission_level=level,
+            )
+            for node_id, user_id in product(node_ids, user_ids)
+        ]
+        with transaction.atomic():
+            SharePermission.objects.bulk_create(
+                shares,
+                update_conflicts=True,
+                unique_fields=["node", "shared_with_user"],
+                update_fields=["permission_level", "granted_by_user", "updated_at"],
+            )
+            invalidate_permissions(user_ids)
+        return Response({"granted": len(shares)})
+
+    @action(detail=False, methods=["post"], url_path="bulk-revoke")
+    def bulk_revoke(self, request):
+        """
+        Removes the shares of every node in `nodes` with every user in `users`, including
+        nodes in the trash. Pairs that aren't shared are ignored.
+        """
+        node_ids, user_ids, _ = self.get_bulk_request(request, require_level=False, live_only=False)
+        with transaction.atomic():
+            revoked, _ = SharePermission.objects.filter(
+                node_id__in=node_ids, shared_with_user_id__in=user_ids
+            ).delete()
+            invalidate_permissions(user_ids)
+        return Response({"revoked": revoked})
+
+    @action(detail=False, methods=["post"], url_path="bulk-change-level")
+    def bulk_change_level(self, request):
+        """
+        Sets `permission_level` on the existing shares of every node in `nodes` with every
+        user in `users`. Pairs that aren't shared are left alone.
+        """
+        node_ids, user_ids, level = self.get_bulk_request(request)
+        with transaction.atomic():
+            updated = SharePermission.objects.filter(
+                node_id__in=node_ids, shared_with_user_id__in=user_ids
+            ).update(
+                permission_level=level, granted_by_user=request.user, updated_at=timezone.now()
+            )
+            invalidate_permissions(user_ids)
+        return Response({"updated": updated})
 
     @action(detail=False, methods=["get"], url_path="shared-with-me")
     def shared_with_me(self, request):
         """
-        Lists FileSystemNode objects shared with you.
+        Lists the live nodes shared with you, most recently shared first, with the share's
+        permission level, the owner and who granted it. Cursor-paginated (`cursor`, `limit`);
+        each page is one query.
         """
-        shared_nodes = FileSystemNode.objects.filter(
-            shares__shared_with_user=request.user, deleted_at__isnull=True, is_directory=False
-        ).distinct()
+        shares = SharePermission.objects.filter(
+            shared_with_user=request.user, node__deleted_at__isnull=True
+        ).select_related("node__owner", "granted_by_user")
 
-        serializer = FileSystemNodeSerializer(shared_nodes, many=True)
-        return Response(serializer.data)
+        paginator = SharedWithMePagination()
+        page = paginator.paginate_queryset(shares, request, view=self)
+        serializer = SharedWithMeSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
@@ -1,8 +1,9 @@
 import React, { useEffect, useState } from "react";
 import { listSharedWithMe } from "../services/fileService"; // Assuming this calls GET /api/sharing/shared-with-me/
-import type { FileNode, ApiError } from "../types";
+import type { ApiError, SharedWithMeEntry, User } from "../types";
 import {
   File as FileIcon,
+  Folder,
   User as UserIcon,
   AlertCircle,
   Loader2,
@@ -10,9 +11,12 @@ import {
 import { Link } from "react-router-dom";
 
 interface GroupedSharedFiles {
-  [ownerUsername: string]: FileNode[];
+  [owner: string]: SharedWithMeEntry[];
 }
 
+const displayName = (user: User): string =>
+  [user.first_name, user.last_name].filter(Boolean).join(" ") || user.email;
+
 const SharedWithMePage: React.FC = () => {
   console.log("[SharedWithMePage] Rendering page.");
   const [groupedFiles, setGroupedFiles] = useState<GroupedSharedFiles>({});
@@ -24,14 +28,14 @@ const SharedWithMePage: React.FC = () => {
       setIsLoading(true);
       setError(null);
       try {
-        const files = await listSharedWithMe();
-        // Group files by owner_username
-        const grouped = files.reduce((acc, file) => {
-          const owner = file.owner_username || "Unknown Sharer"; // Fallback if owner_username is not present
+        const entries = await listSharedWithMe();
+        // Group shares by the owner of the shared item
+        const grouped = entries.reduce((acc, entry) => {
+          const owner = displayName(entry.owner);
           if (!acc[owner]) {
             acc[owner] = [];
           }
-          acc[owner].push(file);
+          acc[owner].push(entry);
           return acc;
         }, {} as GroupedSharedFiles);
         setGroupedFiles(grouped);
@@ -102,40 +106,40 @@ const SharedWithMePage: React.FC = () => {
                 </h2>
               </div>
               <ul className="divide-y divide-gray-100">
-                {groupedFiles[ownerUsername].map((file) => (
+                {groupedFiles[ownerUsername].map((entry) => (
                   <li
-                    key={file.id}
+                    key={entry.id}
                     className="flex items-center justify-between px-2 py-3 hover:bg-gray-50 rounded-md cursor-pointer transition-colors duration-150"
-                    // onClick={() => console.log("Clicked shared file:", file.logical_path)} // Placeholder for future action
-                    title={`Path: ${file.logical_path}\nShared by: ${
-                      file.owner_username || "Unknown"
-                    }`}
+                    title={`Shared by: ${displayName(
+                      entry.granted_by
+                    )}\nAccess: ${entry.permission_level}`}
                   >
                     <div className="flex items-center min-w-0 flex-1 mr-4">
-                      {file.is_directory ? (
+                      {entry.node.is_directory ? (
                         <Folder className="h-5 w-5 mr-3 text-blue-500 shrink-0" />
                       ) : (
                         <FileIcon className="h-5 w-5 mr-3 text-gray-500 shrink-0" />
                       )}
                       <div className="min-w-0">
                         <span className="text-gray-800 truncate font-medium text-sm block">
-                          {file.name}
+                          {entry.node.name}
                         </span>
                         <span className="text-xs text-gray-500 block">
-                          {file.mime_type ||
-                            (file.is_directory ? "Folder" : "File")}
+                          {entry.node.mime_type ||
+                            (entry.node.is_directory ? "Folder" : "File")}
                         </span>
                       </div>
                     </div>
                     <div className="flex items-center space-x-4 shrink-0">
-                      {!file.is_directory && file.size_bytes != null && (
+                      {!entry.node.is_directory &&
+                        entry.node.size_bytes != null && (
                         <span className="text-xs text-gray-500 hidden md:block">
-                          {formatFileSize(file.size_bytes)}
+                          {formatFileSize(entry.node.size_bytes)}
                         </span>
                       )}
                       <span className="text-xs text-gray-500 hidden sm:block">
                         Modified:{" "}
-                        {new Date(file.updated_at).toLocaleDateString()}
+                        {new Date(entry.node.updated_at).toLocaleDateString()}
                       </span>
                       {/* Add actions like 'View' or 'Download' later if needed */}
                     </div>
@@ -1,4 +1,10 @@
-import type { FileNode, ApiError, SharePermission } from "../types";
+import type {
+  FileNode,
+  ApiError,
+  SharePermission,
+  SharedWithMeEntry,
+  CursorPage,
+} from "../types";
 import apiClient from "./apiClient";
 
 // Connected API functions
@@ -168,17 +174,20 @@ export const createShare = async (
     throw apiError;
   }
 };
-export const listSharedWithMe = async (): Promise<FileNode[]> => {
+export const listSharedWithMe = async (): Promise<SharedWithMeEntry[]> => {
   try {
-    const response = await apiClient.get<FileNode[]>(
-      "/sharing/shared-with-me/"
-    );
-    return response.data.map((node) => ({
-      ...node,
-      path: node.logical_path,
-      is_public:
-        node.is_public_root || node.logical_path.startsWith("/public/"),
-    }));
+    const entries: SharedWithMeEntry[] = [];
+    let cursor: string | null = null;
+    do {
+      const params: { cursor?: string } = cursor ? { cursor } : {};
+      const response = await apiClient.get<CursorPage<SharedWithMeEntry>>(
+        "/sharing/shared-with-me/",
+        { params }
+      );
+      entries.push(...response.data.results);
+      cursor = response.data.next;
+    } while (cursor);
+    return entries;
   } catch (error: any) {
     const apiError: ApiError = {
       message:
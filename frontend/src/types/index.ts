@@ -47,6 +47,41 @@ export interface SharePermission {
   updated_at?: string;
 }
 
+/**
+ * A node as seen by a user it is shared with: no path inside the owner's tree.
+ */
+export interface SharedNode {
+  id: string;
+  name: string;
+  is_directory: boolean;
+  size_bytes?: number | null;
+  mime_type?: string | null;
+  total_size_bytes?: number | null;
+  descendant_count?: number | null;
+  created_at: string;
+  updated_at: string;
+}
+
+/**
+ * One entry of GET /sharing/shared-with-me/.
+ */
+export interface SharedWithMeEntry {
+  id: string;
+  permission_level: "view" | "edit";
+  created_at: string;
+  node: SharedNode;
+  owner: User;
+  granted_by: User;
+}
+
+/**
+ * A cursor-paginated list response; `next` is the cursor of the following page.
+ */
+export interface CursorPage<T> {
+  next: string | null;
+  results: T[];
+}
+
 /**
  * Standard structure for API error responses.
  */